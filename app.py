@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, session, jsonify, redirect, url_for, Response, flash
+from flask import Flask, render_template, request, session, jsonify, redirect, url_for, Response, flash, stream_with_context
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -10,11 +10,17 @@ from models import db, User, ExchangeConnection, SubscriptionHistory, TradeDaily
 from flask import jsonify, request, session
 from logic import select_symbol
 import logic
+import exchange_governor
+import exchange_gateway
+import trade_queue
+import live_feed
+import cache
 import config
 import os
 import csv
 import io
 import uuid
+import hashlib
 import razorpay
 import time
 import traceback
@@ -61,8 +67,13 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 instance_path = os.path.join(app.root_path, 'instance')
 os.makedirs(instance_path, exist_ok=True)
 db_file_path = os.path.join(instance_path, 'users.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.abspath(db_file_path).replace('\\', '/')
+# DATABASE_URL lets benchmarks/tests run against a throwaway database
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or 'sqlite:///' + os.path.abspath(db_file_path).replace('\\', '/')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # Threaded workers: a write waits for another thread's commit instead of
+    # failing straight away with "database is locked"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 15}}
 
 RAZORPAY_MONTHLY_PLAN_ID = config.RAZORPAY_MONTHLY_PLAN_ID
 RAZORPAY_YEARLY_PLAN_ID = config.RAZORPAY_YEARLY_PLAN_ID
@@ -141,6 +152,42 @@ def subscription_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# (user, path, variant) -> (source version, ETag) of the last body built
+_etag_memo = cache.namespace('etags', ttl=600, max_entries=5000)
+
+def versioned_json(variant, version, build):
+    """
+    JSON response with an ETag, for the dashboard's polling endpoints.
+    version identifies the snapshot the body is built from (cache store times,
+    DB row stamps): while it is unchanged a matching If-None-Match gets a 304
+    without building the body at all. A new version rebuilds and hashes the
+    body, so a refresh that produced the same data still answers 304.
+    version=None means it couldn't be determined: always build.
+    """
+    memo_key = f"{current_user.id}:{request.path}:{variant}"
+    memo = _etag_memo.get(memo_key) if version is not None else None
+    if memo and memo[0] == version:
+        etag = memo[1]
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            resp.headers['Cache-Control'] = 'no-cache'
+            return resp
+    body = app.json.dumps(build())
+    etag = hashlib.sha1(body.encode()).hexdigest()[:16]
+    if version is not None:
+        _etag_memo.set(memo_key, (version, etag))
+    else:
+        _etag_memo.delete(memo_key)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype='application/json')
+    resp.set_etag(etag)
+    # no-cache = the browser keeps the body but revalidates every poll (If-None-Match)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
 @app.route('/')
 def home():
     return render_template('home.html')
@@ -360,15 +407,21 @@ def api_coin_details(symbol):
     side = request.args.get('side', 'LONG')
     
     try:
-        # 1. Get live price
-        current_price = logic.get_live_price(symbol, current_user.id)
-        
-        # 2. Get exchange limits (max leverage)
-        max_lev = logic.get_max_leverage(symbol, current_user.id)
-        
-        # 3. Get position sizing recommendation based on current UI inputs
+        # 1-4. Live price, exchange limits (max leverage), balance and open positions
+        # are independent reads: fetch them side by side, so this waits for the slowest
+        user_id = current_user.id
+        reads = exchange_gateway.gather({
+            'price': lambda: logic.get_live_price(symbol, user_id),
+            'max_lev': lambda: logic.get_max_leverage(symbol, user_id),
+            'balance': lambda: logic.get_live_balance(user_id),
+            'positions': lambda: logic.get_open_positions(user_id),
+        })
+        current_price = reads['price']
+        max_lev = reads['max_lev']
+
+        # Position sizing recommendation based on current UI inputs
         # (This uses the same logic as the main execute form)
-        balance_data = logic.get_live_balance(current_user.id)
+        balance_data = reads['balance']
         balance = 0.0
         margin_used = 0.0
         if balance_data and isinstance(balance_data, tuple):
@@ -378,10 +431,10 @@ def api_coin_details(symbol):
                 margin_used = float(inner_tuple[1] or 0.0)
         
         unutilized = max(balance - margin_used, 0.0)
-        sizing = logic.calculate_position_sizing(unutilized, current_price, sl_type, sl_value, side, user_id=current_user.id, symbol=symbol)
+        sizing = logic.calculate_position_sizing(unutilized, current_price, sl_type, sl_value, side, user_id=user_id, symbol=symbol)
         
-        # 4. Get current open position if any
-        all_pos = logic.get_open_positions(current_user.id)
+        # Current open position if any
+        all_pos = reads['positions']
         current_pos = next((p for p in all_pos if p['symbol'] == symbol), None)
         
         # 5. Build calculation breakdown for transparency
@@ -491,34 +544,23 @@ def get_open_positions_api():
     symbol_filter = request.args.get('symbol', '').strip().upper()
     fresh = request.args.get('fresh', '0') == '1'
     all_positions = logic.get_open_positions(current_user.id, force_refresh=fresh)
-    
-    # Filter by symbol if provided
-    if symbol_filter and symbol_filter.strip():
-        filtered_positions = [p for p in all_positions if isinstance(p, dict) and p.get('symbol') == symbol_filter]
-        return jsonify({"positions": filtered_positions, "symbol": symbol_filter, "total": len(filtered_positions)})
-    
-    return jsonify({"positions": all_positions})
+
+    def build():
+        # Filter by symbol if provided
+        if symbol_filter and symbol_filter.strip():
+            filtered_positions = [p for p in all_positions if isinstance(p, dict) and p.get('symbol') == symbol_filter]
+            return {"positions": filtered_positions, "symbol": symbol_filter, "total": len(filtered_positions)}
+        return {"positions": all_positions}
+
+    return versioned_json(symbol_filter, logic.user_cache_version(current_user.id, 'positions'), build)
 
 @app.route("/api/liquidation_prices")
 @login_required
 @subscription_required
 def get_liquidation_prices_api():
-    """LIVE liquidation prices - fetched fresh every time (NO CACHE)"""
+    """LIVE liquidation prices - from the shared position snapshot (max age LIVE_POSITIONS_MAX_AGE)"""
     try:
-        positions = logic.get_open_positions_live(current_user.id)  # Fresh fetch, no cache
-        liquidation_data = {}
-        for pos in positions:
-            liquidation_data[pos['symbol']] = {
-                'liquidation_price': pos['liquidation_price'],
-                'mark_price': pos['mark_price'],
-                'entry_price': pos['entry_price'],
-                'leverage': pos['leverage'],
-                'unrealized_pnl': pos['unrealized_pnl'],
-                'roi_percent': pos['roi_percent'],
-                'margin_ratio': pos.get('margin_ratio', 0),
-                'timestamp': pos['timestamp']
-            }
-        return jsonify({"success": True, "liquidation_prices": liquidation_data})
+        return jsonify({"success": True, "liquidation_prices": live_feed.liquidation_prices(current_user.id)})
     except Exception as e:
         print(f"Error fetching liquidation prices: {e}")
         return jsonify({"success": False, "error": str(e)})
@@ -530,9 +572,13 @@ def get_trade_history_api():
     fresh = request.args.get('fresh', '0') == '1'
     trades = logic.get_trade_history(current_user.id, force_refresh=fresh)
     symbol_filter = request.args.get('symbol', '').strip().upper()
-    if symbol_filter and symbol_filter.strip():
-        trades = [t for t in trades if isinstance(t, dict) and t.get('symbol') == symbol_filter]
-    return jsonify({"trades": trades})
+
+    def build():
+        if symbol_filter and symbol_filter.strip():
+            return {"trades": [t for t in trades if isinstance(t, dict) and t.get('symbol') == symbol_filter]}
+        return {"trades": trades}
+
+    return versioned_json(symbol_filter, logic.user_cache_version(current_user.id, 'trade_history'), build)
 
 @app.route("/api/calculate-sizing")
 @login_required
@@ -598,8 +644,8 @@ def calculate_sizing_api():
 @subscription_required
 def get_user_trade_positions_api():
     """Fetch user's trade positions with TP/SL levels from database"""
-    positions = logic.get_user_trade_positions_with_tp_sl(current_user.id)
-    return jsonify({"positions": positions})
+    return versioned_json('', logic.trade_positions_version(current_user.id),
+                          lambda: {"positions": logic.get_user_trade_positions_with_tp_sl(current_user.id)})
 
 @app.route("/api/wallet_balance")
 @login_required
@@ -656,24 +702,52 @@ def api_trade_logs():
         
         # If session empty, try to get recent history
         if not events:
-            trades = logic.get_trade_history(current_user.id)
-            if trades:
-                events = [
-                    {
-                        "type": "TRADE_CLOSE" if trade.get("realized_pnl") else "TRADE_OPEN",
-                        "symbol": trade.get("symbol", ""),
-                        "timestamp": str(trade.get("time", "")),
-                        "message": f"{trade.get('side')} {trade.get('symbol')} @ {trade.get('price')}",
-                        "pnl": float(trade.get("realized_pnl", 0))
-                    }
-                    for trade in trades[:10]  # Last 10 trades
-                ]
+            events = live_feed.history_log_events(current_user.id)
         
         return jsonify({"events": events})
     except Exception as e:
         print(f"❌ Error fetching trade logs: {e}")
         return jsonify({"events": []})
 
+@app.route("/api/dashboard_snapshot")
+@login_required
+@subscription_required
+def api_dashboard_snapshot():
+    """
+    All dashboard sections (positions, liquidation, TP/SL, history, stats, logs,
+    price) in one response - only those whose version changed since
+    ?since=<version of the previous response>. Polled when push isn't available.
+    """
+    symbol = (request.args.get('symbol') or session.get('selected_symbol') or 'BTCUSDT').upper().strip()
+    try:
+        snap = live_feed.snapshot(current_user.id, symbol, request.args.get('since'))
+    except Exception as e:
+        print(f"❌ Error building dashboard snapshot: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+    return jsonify({"success": True, "symbol": symbol, "version": snap['version'], "sections": snap['sections']})
+
+@app.route("/api/live_stream")
+@login_required
+@subscription_required
+def api_live_stream():
+    """
+    Server-Sent Events push of the dashboard sections (live_feed.py) - replaces
+    the per-widget pollers while connected. 204 means push isn't served by this
+    deployment (sync workers / LIVE_PUSH=0) and the page should keep polling.
+    """
+    if not live_feed.available(request.environ) or not live_feed.claim_slot():
+        return Response(status=204)
+    symbol = (request.args.get('symbol') or session.get('selected_symbol') or 'BTCUSDT').upper().strip()
+    resp = Response(
+        stream_with_context(live_feed.stream(current_user.id, symbol)),
+        mimetype='text/event-stream',
+        # X-Accel-Buffering: nginx must pass events through as they are written
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    # The server closes the response when the stream ends or the tab goes away
+    resp.call_on_close(live_feed.release_slot)
+    return resp
+
 @app.route('/logout')
 @login_required
 def logout():
@@ -689,6 +763,7 @@ def logout():
 @app.route('/index', methods=['GET', 'POST'])
 @login_required
 @subscription_required
+@exchange_governor.with_priority(exchange_governor.PRIORITY_INTERACTIVE)
 def index():
     # 1. Initialize session if needed
     logic.initialize_session()
@@ -788,7 +863,9 @@ def index():
         user_units = float(request.form.get("user_units") or 0) or sizing.get("suggested_units", 0)
         user_lev = float(request.form.get("user_lev") or 0) or sizing.get("suggested_leverage", 1)
         
-        result = logic.execute_trade_action(
+        # ✅ Runs in the background (trade_queue.py) - this worker returns immediately
+        # and the page polls /api/trade_jobs/<id> for entry/SL/TP progress
+        job, created = trade_queue.submit(app, current_user.id, dict(
             balance=balance,
             symbol=selected_symbol,
             side=side,
@@ -803,18 +880,14 @@ def index():
             tp1=tp1,
             tp1_pct=tp1_pct,
             tp2=tp2,
-            user_id=current_user.id
-        )
-        
-        session["trade_status"] = result
-        # Invalidate position and trade history caches so next page load is always fresh
-        logic._positions_cache.pop(f"positions_{current_user.id}", None)
-        logic._positions_cache_time.pop(f"positions_{current_user.id}", None)
-        logic._trade_history_cache.pop(f"trade_history_{current_user.id}", None)
-        logic._trade_history_cache_time.pop(f"trade_history_{current_user.id}", None)
-        
-        # Fix 10: Invalidate conditional cache after trade execution
-        logic.invalidate_conditional_cache(current_user.id)
+        ))
+        session["trade_status"] = {
+            "success": True,
+            "pending": True,
+            "job_id": job["id"],
+            "message": (f"⏳ {side} {selected_symbol} order submitted - executing..." if created
+                        else f"⏳ Previous {job['side']} {job['symbol']} order is still executing - not sent again"),
+        }
         
         return redirect(url_for("index", symbol=selected_symbol))
 
@@ -878,8 +951,21 @@ def sync_sqlite_schema():
     except Exception as e:
         print(f"⚠️ Schema sync failed: {e}")
 
+def enable_sqlite_wal():
+    """WAL journal: readers keep going while another thread or worker writes
+    (the default rollback journal blocks them). Persists in the DB file."""
+    if db.engine.dialect.name != 'sqlite':
+        return
+    try:
+        with db.engine.connect() as conn:
+            mode = conn.exec_driver_sql('PRAGMA journal_mode=WAL').scalar()
+            print(f"🗄️ SQLite journal mode: {mode}")
+    except Exception as e:
+        print(f"⚠️ Could not enable SQLite WAL: {e}")
+
 with app.app_context():
     sync_sqlite_schema()
+    enable_sqlite_wal()
 
 @app.errorhandler(Exception)
 def handle_unexpected_error(e):
@@ -1351,7 +1437,7 @@ def test_proxy():
         
     # 2. Test Binance Ping
     try:
-        resp = requests.get('https://fapi.binance.com/fapi/v1/ping', proxies=proxies, timeout=10)
+        resp = requests.get(f"{config.BINANCE_FAPI_URL}/fapi/v1/ping", proxies=proxies, timeout=10)
         results.append(f"✅ Binance Ping: HTTP {resp.status_code}")
     except Exception as e:
         results.append(f"❌ Binance Ping Failed: {str(e)}")
@@ -1379,7 +1465,8 @@ def change_leverage():
             
         client = client_res
         # Change leverage on Binance
-        client.futures_change_leverage(symbol=symbol, leverage=int(leverage))
+        logic.forget_symbol_config(current_user.id, symbol)
+        logic.ensure_leverage(client, symbol, int(leverage), current_user.id)
         
         # Log the event
         logic.log_trade_event("LEVERAGE_CHANGE", f"⚡ Leverage for {symbol} changed to {leverage}x", user_id=current_user.id)
@@ -1389,6 +1476,15 @@ def change_leverage():
         print(f"Error changing leverage: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/trade_jobs/<job_id>')
+@login_required
+def api_trade_job(job_id):
+    """Status of a queued trade: state (queued/running/done/failed), per-leg progress, final result."""
+    job = trade_queue.get_job(job_id, current_user.id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown or expired trade job"}), 404
+    return jsonify({"success": True, "job": job})
+
 @app.route('/api/conditional_orders')
 @login_required
 def api_conditional_orders():
@@ -1418,12 +1514,23 @@ def api_tp1_and_sl_orders():
     from conditional_orders_enhancement import get_tp1_and_sl_orders
     if request.args.get('force') == '1':
         logic.invalidate_conditional_cache(current_user.id)
+
+    def build():
+        try:
+            return get_tp1_and_sl_orders(current_user.id)
+        except Exception as e:
+            return {"success": False, "error": str(e),
+                    "tp1_orders": [], "tp2_orders": [], "sl_orders": []}
+
     try:
-        result = get_tp1_and_sl_orders(current_user.id)
+        # Refresh the orders snapshot if due, then version = its store time + the DB positions
+        logic.get_all_open_conditional_orders(current_user.id)
+        version = (logic.user_cache_version(current_user.id, 'conditional'),
+                   logic.trade_positions_version(current_user.id))
     except Exception as e:
-        result = {"success": False, "error": str(e),
-                  "tp1_orders": [], "tp2_orders": [], "sl_orders": []}
-    return jsonify(result)
+        print(f"⚠️ TP/SL orders version unavailable: {e}")
+        version = None
+    return versioned_json('', version, build)
 
 
 @app.route('/api/debug_conditional_orders')
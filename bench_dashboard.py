@@ -0,0 +1,454 @@
+"""
+Dashboard load test: N synthetic traders polling the app like templates/index.html does.
+
+Starts fake_binance.py (REST and market streams) in-process, seeds a throwaway database with N subscribed
+users (each with its own fake exchange account, open positions and TP/SL
+orders), starts the app (gunicorn like production, or the werkzeug dev server)
+and has every user replay the dashboard's old per-widget polling mix (or,
+with --snapshot, poll /api/dashboard_snapshot like index.html does now, or
+with --push, hold one /api/live_stream connection). Reports p50/p95/p99
+latency and error rate per endpoint, app requests per user-second and
+upstream exchange calls per user-minute.
+
+--capacity instead ramps the user count in steps and reports how many
+concurrent users each worker serves within --slo-ms p95 and 1% errors;
+--slow-ratio/--slow-ms make some exchange calls crawl like a bad proxy.
+
+    python bench_dashboard.py --users 20 --duration 60
+    python bench_dashboard.py --users 50 --workers 5 --latency-ms 120 --json bench_output.json
+    python bench_dashboard.py --users 20 --snapshot
+    python bench_dashboard.py --users 20 --push --worker-class gthread
+    python bench_dashboard.py --capacity 5,10,20,40 --workers 1 --worker-class sync --slow-ratio 0.05 --slow-ms 3000
+
+Nothing touches instance/users.db or the real exchange.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (path, seconds) — the per-widget setInterval pollers templates/index.html ran
+# before /api/dashboard_snapshot; kept as the baseline
+POLL_MIX = [
+    ('/api/liquidation_prices', 2),
+    ('/api/trade_logs', 2),
+    ('/get_open_positions', 5),
+    ('/api/tp1_and_sl_orders', 5),
+    ('/get_live_price/{symbol}', 5),
+    ('/get_trade_history', 10),
+]
+SNAPSHOT_INTERVAL = 2
+CAPACITY_MAX_ERROR_RATE = 0.01
+BENCH_PASSWORD = 'bench-password'
+POSITION_SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'SOLUSDT', 'BNBUSDT', 'XRPUSDT']
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def prepare_environment(args, workdir, fake_url, stream_url):
+    """Env for both this process and the app server. Must run before importing app/config."""
+    env = {
+        'BINANCE_FAPI_URL': fake_url,
+        'BINANCE_PAPI_URL': fake_url,
+        'BINANCE_API_URL': fake_url,
+        'BINANCE_FSTREAM_URL': stream_url,
+        'MARKET_DATA_STREAM': '0' if args.no_stream else '1',
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'SHARED_CACHE_URL': args.shared_cache or ('sqlite:///' + os.path.join(workdir, 'shared_cache.db')),
+        'SECRET_KEY': 'bench-secret',
+        'PROXY_URL': '',
+        # The governor budgets the same weight the fake exchange enforces
+        'EXCHANGE_WEIGHT_LIMIT': str(args.weight_limit),
+    }
+    os.environ.update(env)
+    return env
+
+
+def seed_users(fake, count, positions_per_user):
+    """Create subscribed users with exchange connections; give each fake account open positions + SL/TP."""
+    from datetime import datetime, timedelta
+    from werkzeug.security import generate_password_hash
+    from app import app
+    from models import db, User, ExchangeConnection
+
+    users = []
+    with app.app_context():
+        db.create_all()
+        password_hash = generate_password_hash(BENCH_PASSWORD)
+        for i in range(count):
+            email = f"bench{i}@bench.local"
+            user = User.query.filter_by(email=email).first()
+            if user is None:
+                user = User(email=email, username=f"bench{i}", password=password_hash, is_subscribed=True,
+                            subscription_status='active', subscription_type='monthly',
+                            subscription_start=datetime.utcnow(),
+                            subscription_end=datetime.utcnow() + timedelta(days=30))
+                db.session.add(user)
+                db.session.flush()
+                db.session.add(ExchangeConnection(user_id=user.id, exchange_type='binance',
+                                                  api_key=f"bench-key-{i}", api_secret=f"bench-secret-{i}",
+                                                  is_connected=True, connection_name='Bench'))
+            users.append(email)
+        db.session.commit()
+
+    for i in range(count):
+        account = fake.account(f"bench-key-{i}")
+        for symbol in POSITION_SYMBOLS[:positions_per_user]:
+            side = 'BUY' if (i + len(symbol)) % 2 else 'SELL'
+            step = fake.market.specs[symbol][2]
+            qty = max(step, round(200 / fake.market.price(symbol) / step) * step)
+            account.fill(symbol, side, qty)
+            price = fake.market.price(symbol)
+            exit_side = 'SELL' if side == 'BUY' else 'BUY'
+            sl = price * (0.98 if side == 'BUY' else 1.02)
+            tp = price * (1.03 if side == 'BUY' else 0.97)
+            fake.new_algo_order(account, {'symbol': symbol, 'side': exit_side, 'type': 'STOP_MARKET',
+                                          'triggerPrice': round(sl, 2), 'closePosition': 'true'})
+            fake.new_algo_order(account, {'symbol': symbol, 'side': exit_side, 'type': 'TAKE_PROFIT_MARKET',
+                                          'triggerPrice': round(tp, 2), 'quantity': qty / 2, 'reduceOnly': 'true'})
+    return users
+
+
+def start_app(args, env, port, workdir):
+    """Start the app server; returns a handle with .stop()."""
+    if args.server == 'werkzeug':
+        from werkzeug.serving import make_server
+        from app import app
+        server = make_server('127.0.0.1', port, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        server.stop = server.shutdown
+        return server
+
+    # Empty config file: gunicorn would otherwise load ./gunicorn.conf.py (www-data user, fixed bind)
+    conf = os.path.join(workdir, 'gunicorn.bench.py')
+    open(conf, 'w').close()
+    timeout = '120' if args.worker_class == 'sync' else '30'     # as gunicorn.conf.py
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:app', '-c', conf, '-b', f"127.0.0.1:{port}",
+           '-w', str(args.workers), '-k', args.worker_class, '--timeout', timeout, '--log-level', 'warning']
+    if args.worker_class == 'gthread':
+        cmd += ['--threads', str(args.threads)]
+    proc = subprocess.Popen(cmd, cwd=BASE_DIR, env=dict(os.environ, **env),
+                            stdout=None if args.verbose else subprocess.DEVNULL,
+                            stderr=None if args.verbose else subprocess.DEVNULL)
+    proc.stop = lambda: (proc.terminate(), proc.wait(timeout=30))
+    return proc
+
+
+def wait_until_up(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(base_url + '/login', timeout=2)
+            return True
+        except requests.RequestException:
+            time.sleep(0.3)
+    return False
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}   # path -> [seconds]
+        self.errors = {}      # path -> count
+        self.requests = {}    # path -> count
+        self.events = {}      # section -> times sent (--snapshot, --push)
+
+    def record(self, path, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(path, []).append(seconds)
+            self.requests[path] = self.requests.get(path, 0) + 1
+            if not ok:
+                self.errors[path] = self.errors.get(path, 0) + 1
+
+    def record_event(self, name):
+        with self.lock:
+            self.events[name] = self.events.get(name, 0) + 1
+
+
+def login(base_url, email):
+    s = requests.Session()
+    resp = s.post(base_url + '/login', data={'email': email, 'password': BENCH_PASSWORD}, allow_redirects=False, timeout=30)
+    if resp.status_code not in (200, 302):
+        raise RuntimeError(f"login failed for {email}: HTTP {resp.status_code}")
+    return s
+
+
+def poller(session, base_url, path, interval, symbol, stats, stop_at, timeout):
+    """One setInterval loop: fire every interval seconds (late if the previous call ran long)."""
+    url = base_url + path.format(symbol=symbol)
+    label = path.split('{')[0].rstrip('/')
+    next_at = time.time() + random.uniform(0, interval)   # tabs don't open in lockstep
+    while next_at < stop_at:
+        delay = next_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        started = time.time()
+        ok = False
+        try:
+            resp = session.get(url, timeout=timeout, allow_redirects=False)
+            ok = resp.status_code == 200
+        except requests.RequestException:
+            pass
+        stats.record(label, time.time() - started, ok)
+        next_at += interval
+
+
+def snapshot_poller(session, base_url, symbol, stats, stop_at, timeout):
+    """index.html's single dashboard poll: /api/dashboard_snapshot with the last version as since."""
+    url = base_url + '/api/dashboard_snapshot'
+    version = ''
+    next_at = time.time() + random.uniform(0, SNAPSHOT_INTERVAL)
+    while next_at < stop_at:
+        delay = next_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        started = time.time()
+        ok = False
+        try:
+            resp = session.get(url, params={'symbol': symbol, 'since': version}, timeout=timeout, allow_redirects=False)
+            ok = resp.status_code == 200
+            if ok:
+                data = resp.json()
+                version = data.get('version', '')
+                for name in data.get('sections', {}):
+                    stats.record_event(name)
+        except (requests.RequestException, ValueError):
+            pass
+        stats.record('/api/dashboard_snapshot', time.time() - started, ok)
+        next_at += SNAPSHOT_INTERVAL
+
+
+def push_listener(session, base_url, symbol, stats, stop_at, timeout):
+    """One dashboard tab on /api/live_stream: count pushed sections, reconnect when the server ends the stream."""
+    url = f"{base_url}/api/live_stream?symbol={symbol}"
+    time.sleep(random.uniform(0, 1))
+    while time.time() < stop_at:
+        started = time.time()
+        try:
+            with session.get(url, stream=True, timeout=timeout, allow_redirects=False) as resp:
+                # latency = time to response headers; 204 means push is off for this server
+                stats.record('/api/live_stream', time.time() - started, resp.status_code == 200)
+                if resp.status_code != 200:
+                    return
+                for line in resp.iter_lines(decode_unicode=True):
+                    if line and line.startswith('event: '):
+                        stats.record_event(line[len('event: '):])
+                    if time.time() >= stop_at:
+                        break
+        except requests.RequestException:
+            stats.record('/api/live_stream', time.time() - started, False)
+            time.sleep(2)
+
+
+def report(stats, fake, upstream_before, paths_before, args, elapsed):
+    user_minutes = args.users * elapsed / 60.0
+    upstream = fake.request_count - upstream_before
+    upstream_by_path = fake.path_counts - paths_before
+    total_reqs = sum(stats.requests.values())
+    total_errs = sum(stats.errors.values())
+    all_lat = [v for vals in stats.latencies.values() for v in vals]
+    rows = []
+    for path in sorted(stats.latencies):
+        lat = stats.latencies[path]
+        rows.append({
+            'endpoint': path,
+            'requests': stats.requests[path],
+            'error_rate': stats.errors.get(path, 0) / max(1, stats.requests[path]),
+            'p50_ms': percentile(lat, 50) * 1000,
+            'p95_ms': percentile(lat, 95) * 1000,
+            'p99_ms': percentile(lat, 99) * 1000,
+        })
+    summary = {
+        'users': args.users,
+        'duration_s': round(elapsed, 1),
+        'server': args.server if args.server == 'werkzeug' else f"gunicorn {args.worker_class} x{args.workers}",
+        'exchange_latency_ms': args.latency_ms,
+        'mode': 'push' if args.push else ('snapshot' if args.snapshot else 'poll'),
+        'requests': total_reqs,
+        'requests_per_user_s': total_reqs / max(1e-9, args.users * elapsed),
+        'sections_sent': dict(stats.events),
+        'error_rate': total_errs / max(1, total_reqs),
+        'p50_ms': percentile(all_lat, 50) * 1000,
+        'p99_ms': percentile(all_lat, 99) * 1000,
+        'upstream_calls': upstream,
+        'upstream_per_user_minute': upstream / max(1e-9, user_minutes),
+        'upstream_by_path': dict(upstream_by_path.most_common()),
+        'exchange_bans': fake.banned_until > 0,
+        'endpoints': rows,
+    }
+
+    print(f"\n📊 Dashboard benchmark — {args.users} users, {elapsed:.0f}s, {summary['server']}, "
+          f"{summary['mode']}, exchange latency {args.latency_ms}ms")
+    print(f"{'endpoint':<28}{'reqs':>7}{'err%':>7}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}")
+    for r in rows:
+        print(f"{r['endpoint']:<28}{r['requests']:>7}{r['error_rate'] * 100:>6.1f}%"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}")
+    print(f"{'TOTAL':<28}{total_reqs:>7}{summary['error_rate'] * 100:>6.1f}%"
+          f"{summary['p50_ms']:>9.1f}{'':>9}{summary['p99_ms']:>9.1f}")
+    print(f"App requests per user-second: {summary['requests_per_user_s']:.2f}")
+    if stats.events:
+        print("Sections sent: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.events.items())))
+    print(f"Upstream exchange calls: {upstream} ({summary['upstream_per_user_minute']:.1f} per user-minute)")
+    for path, n in list(summary['upstream_by_path'].items())[:10]:
+        print(f"   {n:>6}  {path}")
+    if summary['exchange_bans']:
+        print("⚠️ The fake exchange banned the IP (-1003) during the run")
+    return summary
+
+
+def run_load(sessions, base_url, args, stats, duration):
+    """Every session replays the dashboard (poll mix, --snapshot or --push) for duration seconds."""
+    stop_at = time.time() + duration
+    threads = []
+    for session in sessions:
+        if args.push or args.snapshot:
+            t = threading.Thread(target=push_listener if args.push else snapshot_poller, daemon=True,
+                                 args=(session, base_url, args.symbol, stats, stop_at, args.timeout))
+            t.start()
+            threads.append(t)
+            continue
+        for path, interval in POLL_MIX:
+            t = threading.Thread(target=poller, daemon=True,
+                                 args=(session, base_url, path, interval, args.symbol, stats, stop_at, args.timeout))
+            t.start()
+            threads.append(t)
+    for t in threads:
+        t.join(timeout=duration + args.timeout + 5)
+
+
+def capacity(sessions, base_url, args, steps):
+    """
+    Ramp through steps (user counts); stop at the first step over --slo-ms p95 or
+    CAPACITY_MAX_ERROR_RATE. Requests still queued when a step ends count as they land.
+    """
+    server = args.server if args.server == 'werkzeug' else f"gunicorn {args.worker_class} x{args.workers}"
+    print(f"\n📈 Capacity — {server}, exchange latency {args.latency_ms}ms"
+          f"{f', {args.slow_ratio:.0%} of calls +{args.slow_ms:.0f}ms' if args.slow_ratio else ''}, "
+          f"SLO p95 <= {args.slo_ms:.0f}ms and <= {CAPACITY_MAX_ERROR_RATE:.0%} errors, {args.duration:.0f}s per step")
+    # Warm-up: build every user's client and caches first, so steps measure steady state
+    for session in sessions:
+        try:
+            session.get(base_url + '/api/dashboard_snapshot', params={'symbol': args.symbol}, timeout=60)
+        except requests.RequestException:
+            pass
+    print(f"{'users':>6}{'reqs':>8}{'err%':>7}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}  ok")
+    results, served = [], 0
+    for users in steps:
+        stats = Stats()
+        run_load(sessions[:users], base_url, args, stats, args.duration)
+        lat = [v for vals in stats.latencies.values() for v in vals]
+        reqs = sum(stats.requests.values())
+        error_rate = sum(stats.errors.values()) / max(1, reqs)
+        p95 = percentile(lat, 95) * 1000
+        ok = reqs > 0 and error_rate <= CAPACITY_MAX_ERROR_RATE and p95 <= args.slo_ms
+        results.append({'users': users, 'requests': reqs, 'error_rate': error_rate, 'p50_ms': percentile(lat, 50) * 1000,
+                        'p95_ms': p95, 'p99_ms': percentile(lat, 99) * 1000, 'within_slo': ok})
+        r = results[-1]
+        print(f"{users:>6}{reqs:>8}{error_rate * 100:>6.1f}%{r['p50_ms']:>9.1f}{p95:>9.1f}{r['p99_ms']:>9.1f}  "
+              f"{'✅' if ok else '❌'}")
+        if not ok:
+            break
+        served = users
+    workers = 1 if args.server == 'werkzeug' else args.workers
+    print(f"Concurrent users within SLO: {served} ({served / workers:.1f} per worker)")
+    return {'server': server, 'slo_p95_ms': args.slo_ms, 'exchange_latency_ms': args.latency_ms,
+            'slow_ratio': args.slow_ratio, 'slow_ms': args.slow_ms, 'steps': results,
+            'users_within_slo': served, 'users_per_worker': served / workers}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=60, help='seconds of polling after warm-up')
+    parser.add_argument('--server', choices=['gunicorn', 'werkzeug'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--worker-class', default='sync')
+    parser.add_argument('--threads', type=int, default=8, help='per worker, with --worker-class gthread')
+    parser.add_argument('--latency-ms', type=float, default=80, help='fake exchange latency')
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--slow-ratio', type=float, default=0, help='fraction of exchange calls delayed by --slow-ms')
+    parser.add_argument('--slow-ms', type=float, default=0)
+    parser.add_argument('--capacity', help='comma-separated user counts to ramp through, e.g. 5,10,20,40')
+    parser.add_argument('--slo-ms', type=float, default=2000, help='p95 a --capacity step must stay under')
+    parser.add_argument('--weight-limit', type=int, default=2400)
+    parser.add_argument('--positions-per-user', type=int, default=2)
+    parser.add_argument('--symbol', default='BTCUSDT')
+    parser.add_argument('--timeout', type=float, default=30, help='client-side request timeout')
+    parser.add_argument('--no-stream', action='store_true', help='REST-only prices (MARKET_DATA_STREAM=0)')
+    parser.add_argument('--snapshot', action='store_true', help='poll /api/dashboard_snapshot instead of each widget')
+    parser.add_argument('--push', action='store_true',
+                        help='one /api/live_stream per user instead of polling (needs gthread or werkzeug)')
+    parser.add_argument('--shared-cache', default=None, help="SHARED_CACHE_URL for the app (default: temp sqlite)")
+    parser.add_argument('--json', dest='json_path', help='also write the summary here')
+    parser.add_argument('--verbose', action='store_true', help='show app server output')
+    args = parser.parse_args()
+    steps = sorted(int(n) for n in args.capacity.split(',')) if args.capacity else None
+    if steps:
+        args.users = steps[-1]
+
+    workdir = tempfile.mkdtemp(prefix='bench-dashboard-')
+    fake_port, stream_port, app_port = _free_port(), _free_port(), _free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    env = prepare_environment(args, workdir, fake_url, f"ws://127.0.0.1:{stream_port}")
+
+    # Only import app-side modules once the environment points at the fake exchange
+    sys.path.insert(0, BASE_DIR)
+    from fake_binance import start_server, start_stream_server
+    fake_server, fake, _ = start_server(port=fake_port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                        slow_ratio=args.slow_ratio, slow_ms=args.slow_ms,
+                                        weight_limit=args.weight_limit)
+    start_stream_server(fake, port=stream_port)
+    emails = seed_users(fake, args.users, args.positions_per_user)
+
+    server = start_app(args, env, app_port, workdir)
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        if not wait_until_up(base_url):
+            print("❌ App server did not come up")
+            return 1
+        sessions = [login(base_url, email) for email in emails]
+        print(f"✅ {len(sessions)} users logged in against {base_url} (fake exchange {fake_url})")
+
+        if steps:
+            summary = capacity(sessions, base_url, args, steps)
+        else:
+            stats = Stats()
+            upstream_before = fake.request_count
+            paths_before = fake.path_counts.copy()
+            started = time.time()
+            run_load(sessions, base_url, args, stats, args.duration)
+            summary = report(stats, fake, upstream_before, paths_before, args,
+                             min(time.time(), started + args.duration) - started)
+        if args.json_path:
+            with open(args.json_path, 'w') as f:
+                json.dump(summary, f, indent=2)
+        return 0
+    finally:
+        server.stop()
+        fake_server.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Bounded TTL + LRU caches for logic.py.
+
+Each namespace has its own TTL (how long an entry counts as fresh) and a
+maximum entry count; past that the least recently used entry is evicted,
+so a worker's memory stays flat however many symbol x user combinations
+get requested over its lifetime. Entries older than the TTL stay around
+until evicted so callers can still fall back to a stale value when the
+exchange is unreachable.
+
+Namespaces created with shared=True also read/write shared_cache, so the
+other gunicorn workers see the same entries. Give such a namespace a
+local_ttl when a worker must notice another worker's change quickly: its
+own copy then answers for only that long before the shared store is asked
+again.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import shared_cache
+
+
+class CacheNamespace:
+    def __init__(self, name, ttl, max_entries=1000, shared=False, local_ttl=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self.local_ttl = local_ttl if shared else None
+        self._entries = OrderedDict()   # key -> (value, stored_at, put_at), oldest use first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _put(self, key, value, stored_at):
+        with self._lock:
+            self._entries[key] = (value, stored_at, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key, max_age=None, default=None):
+        """Value stored less than max_age (default: the namespace TTL) seconds ago, else default."""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.time()
+            if entry is not None and (now - entry[1]) < max_age and \
+                    (self.local_ttl is None or (now - entry[2]) < self.local_ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        if self.shared and max_age > 0:
+            hit = shared_cache.lookup(f"{self.name}:{key}", max_age)
+            if hit is not None:
+                self._put(key, hit[0], hit[1])
+                with self._lock:
+                    self.hits += 1
+                return hit[0]
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def get_entry(self, key):
+        """(value, stored_at) whatever its age, or None. For stale fallbacks; not counted."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[:2] if entry is not None else None
+
+    def set(self, key, value, stored_at=None):
+        stored_at = stored_at or time.time()
+        self._put(key, value, stored_at)
+        if self.shared:
+            shared_cache.store(f"{self.name}:{key}", value, self.ttl, stored_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared:
+            shared_cache.delete(f"{self.name}:{key}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_namespaces = {}
+_namespaces_lock = threading.Lock()
+
+
+def namespace(name, ttl, max_entries=1000, shared=False, local_ttl=None):
+    """Create (or return the existing) namespace called name."""
+    with _namespaces_lock:
+        if name not in _namespaces:
+            _namespaces[name] = CacheNamespace(name, ttl, max_entries, shared, local_ttl)
+        return _namespaces[name]
+
+
+def invalidate(key, *names):
+    """Drop key from each named namespace, e.g. invalidate(user_key, 'positions', 'account')."""
+    for name in names:
+        ns = _namespaces.get(name)
+        if ns is not None:
+            ns.delete(key)
+
+
+def stored_at(key, *names):
+    """When key was last stored in each named namespace (0 if absent) - a cheap version stamp."""
+    stamps = []
+    for name in names:
+        ns = _namespaces.get(name)
+        entry = ns.get_entry(key) if ns is not None else None
+        stamps.append(entry[1] if entry else 0)
+    return tuple(stamps)
+
+
+def stats():
+    """Per-namespace size and hit/miss/eviction counters."""
+    return {name: ns.stats() for name, ns in list(_namespaces.items())}
@@ -15,6 +15,16 @@ PROXY_URL = os.getenv('PROXY_URL')
 if PROXY_URL:
     PROXY_URL = PROXY_URL.strip().strip('"').strip("'")
 
+# Binance REST base URLs. Override to point the app at fake_binance.py
+# (e.g. http://127.0.0.1:8765) for offline testing and benchmarks.
+BINANCE_FAPI_URL = os.getenv('BINANCE_FAPI_URL', 'https://fapi.binance.com').rstrip('/')
+BINANCE_PAPI_URL = os.getenv('BINANCE_PAPI_URL', 'https://papi.binance.com').rstrip('/')
+BINANCE_API_URL = os.getenv('BINANCE_API_URL', 'https://api.binance.com').rstrip('/')
+# USD-M futures WebSocket base (market_data.py). fake_binance.py serves a stand-in too.
+BINANCE_FSTREAM_URL = os.getenv('BINANCE_FSTREAM_URL', 'wss://fstream.binance.com').rstrip('/')
+# Serve live prices from the mark-price/bookTicker stream; set to 0 to use REST only
+MARKET_DATA_STREAM = os.getenv('MARKET_DATA_STREAM', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
 
 # Troubleshooting print (Check your Render logs to see this)
 if not BINANCE_KEY or not BINANCE_SECRET:
@@ -47,10 +57,31 @@ MAX_TRAIL_LOSS_PCT = 1.0  # Trailing SL max loss from entry
 MAX_RISK_PERCENT = 1.0  # Legacy
 SL_EDIT_MIN_PERCENT = -1.0
 SL_EDIT_MAX_PERCENT = 0.0
-POSITION_UPDATE_INTERVAL = 3
+POSITION_UPDATE_INTERVAL = 3  # positions snapshot TTL (logic._positions_cache)
 PRICE_UPDATE_INTERVAL = 5
-PRICE_CACHE_DURATION = 5
+PRICE_CACHE_DURATION = 5  # price TTL (logic._price_cache)
 SYMBOL_CACHE_DURATION = 600  # Reduced for fresher symbols (logic.py effective 10min)
+# Cache shared by all gunicorn workers: 'sqlite' (instance/shared_cache.db), 'sqlite:////path.db',
+# 'redis://host:6379/0' (pip install redis) or 'local' to keep caches per-process
+SHARED_CACHE_URL = os.getenv('SHARED_CACHE_URL', 'sqlite').strip()
+# Request weight per minute the exchange governor budgets for API hosts it has no limit for
+# (a testnet, fake_binance.py); the real Binance hosts use exchange_governor.HOST_WEIGHT_LIMITS
+EXCHANGE_WEIGHT_LIMIT = int(os.getenv('EXCHANGE_WEIGHT_LIMIT', '2400'))
+# Threads per worker running queued trades (trade_queue.py)
+TRADE_EXECUTOR_THREADS = int(os.getenv('TRADE_EXECUTOR_THREADS', '4'))
+# Exchange gateway (exchange_gateway.py): threads per worker running one view's reads side by side,
+# and pooled keep-alive connections its asyncio HTTP client holds to the exchange
+EXCHANGE_GATEWAY_THREADS = int(os.getenv('EXCHANGE_GATEWAY_THREADS', '16'))
+EXCHANGE_GATEWAY_CONNECTIONS = int(os.getenv('EXCHANGE_GATEWAY_CONNECTIONS', '20'))
+# Dashboard push channel (/api/live_stream, live_feed.py): 'auto' serves it only on threaded/async
+# gunicorn workers (on a sync worker every open tab would pin a whole worker), '1' always, '0' never.
+# Without it the dashboard keeps polling.
+LIVE_PUSH = os.getenv('LIVE_PUSH', 'auto').strip().lower()
+# Each stream ends after this long and the browser reconnects on its own
+LIVE_PUSH_MAX_SECONDS = int(os.getenv('LIVE_PUSH_MAX_SECONDS', '300'))
+# Open streams per worker process. On gthread each one holds a thread for its whole life, so keep
+# this under GUNICORN_THREADS; tabs past the cap get 204 and poll /api/dashboard_snapshot instead.
+LIVE_PUSH_MAX_STREAMS = int(os.getenv('LIVE_PUSH_MAX_STREAMS', '4'))
 MAX_RETRIES = 3
 RETRY_DELAY = 1
 
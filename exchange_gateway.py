@@ -0,0 +1,271 @@
+"""
+Exchange gateway: concurrent fan-out for views that need several exchange reads.
+
+A dashboard view that asks for price, leverage, balance and positions one after
+another waits for the SUM of those round trips. Through the gateway it waits
+for the slowest one:
+
+    fetch_many(client, [(base, path, params), ...])
+        Signed GETs sent together from one asyncio loop over a pooled,
+        keep-alive aiohttp session. Returns one entry per call, in order:
+        the parsed JSON, or the exception that call raised.
+
+    gather({name: callable, ...})
+        Runs existing sync helpers (logic.get_live_price, get_live_balance,
+        ...) side by side on a thread pool and returns {name: result}. Each
+        call gets a copy of the caller's request context with its own app
+        context (so its own DB session), and keeps the caller's governor
+        priority and user.
+
+Both are plain blocking calls, so Flask views use them as-is. Every request
+still goes through the exchange governor: weight budget and pacing
+(governor.acquire/observe), the per-process in-flight cap and fair queueing
+(scheduler), and identical in-flight GETs are coalesced.
+
+The loop thread, HTTP session and pool are created lazily in each worker
+process, so gunicorn's preload_app master never owns them across a fork.
+"""
+import asyncio
+import atexit
+import copy
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from binance.exceptions import BinanceAPIException, BinanceRequestException
+from flask import copy_current_request_context, current_app, has_app_context, has_request_context
+
+import config
+from exchange_governor import (current_priority, current_user_id, flight_key, governed_get,
+                               governor, request_priority, scheduler)
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:  # aiohttp ships with python-binance; without it fetch_many() uses requests on the pool
+    aiohttp = None
+
+REQUEST_TIMEOUT = 20            # per request once admitted, like the python-binance clients
+FETCH_MANY_TIMEOUT = 60         # whole batch, admission waits included
+RECV_WINDOW = 10000
+
+# fetch_many() base name -> config attribute holding its URL
+BASE_URLS = {
+    'api': 'BINANCE_API_URL',
+    'fapi': 'BINANCE_FAPI_URL',
+    'papi': 'BINANCE_PAPI_URL',
+}
+
+_gateway = None
+_gateway_lock = threading.Lock()
+_local = threading.local()      # .in_pool is set on the gateway's own call threads
+
+
+class _Reply:
+    """The bits of a response governor.observe() and BinanceAPIException read."""
+
+    def __init__(self, url, status_code, headers, text):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+
+def _mark_pool_thread():
+    _local.in_pool = True
+
+
+def _signed_query(client, params):
+    """Query string signed the way python-binance signs it (timestamp, recvWindow, HMAC)."""
+    params = dict(params)
+    params['timestamp'] = int(time.time() * 1000) + int(getattr(client, 'timestamp_offset', 0) or 0)
+    params.setdefault('recvWindow', RECV_WINDOW)
+    query = urllib.parse.urlencode(params)
+    signature = hmac.new(client.API_SECRET.encode('utf-8'), query.encode('utf-8'), hashlib.sha256).hexdigest()
+    return query + '&signature=' + signature
+
+
+def _parse(reply):
+    if not 200 <= reply.status_code < 300:
+        raise BinanceAPIException(reply, reply.status_code, reply.text)
+    if not reply.text:
+        return {}
+    try:
+        return json.loads(reply.text)
+    except ValueError:
+        raise BinanceRequestException(f"Invalid Response: {reply.text}")
+
+
+def _admit(url, params, priority, user_id):
+    # Both can block (pacing, queueing behind other requests), so this runs off the loop
+    governor.acquire(url, params, priority=priority)
+    scheduler.enter(priority, user_id)
+
+
+class _Gateway:
+    """One per worker process: the event loop thread, its HTTP session and the call pool."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.calls = ThreadPoolExecutor(max_workers=config.EXCHANGE_GATEWAY_THREADS,
+                                        thread_name_prefix='gateway', initializer=_mark_pool_thread)
+        self.loop = None
+        if aiohttp is not None:
+            self.loop = asyncio.new_event_loop()
+            self.loop.set_default_executor(ThreadPoolExecutor(max_workers=config.EXCHANGE_GATEWAY_CONNECTIONS,
+                                                              thread_name_prefix='gateway-admit'))
+            self.session = None
+            self.inflight = {}  # flight_key -> asyncio.Future, touched only on the loop thread
+            threading.Thread(target=self.loop.run_forever, name='exchange-gateway', daemon=True).start()
+            atexit.register(self.close)
+
+    def close(self):
+        """Close the pooled connections (at worker exit)."""
+        async def close_session():
+            if self.session is not None:
+                await self.session.close()
+        try:
+            asyncio.run_coroutine_threadsafe(close_session(), self.loop).result(2)
+        except Exception:
+            pass
+
+    def _session(self):
+        # Created on the loop thread: aiohttp binds a session to the loop it was made on
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=config.EXCHANGE_GATEWAY_CONNECTIONS, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            )
+        return self.session
+
+    async def get(self, client, base, path, params, priority, user_id):
+        url = getattr(config, BASE_URLS[base]) + path
+        key = flight_key(client.API_KEY, url, params)
+        flight = self.inflight.get(key)
+        if flight is not None:
+            return copy.deepcopy(await flight)
+        flight = self.inflight[key] = self.loop.create_future()
+        flight.add_done_callback(lambda f: f.cancelled() or f.exception())  # no "never retrieved" noise
+        try:
+            result = await self._send(client, url, params, priority, user_id)
+            flight.set_result(result)
+            return copy.deepcopy(result)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            self.inflight.pop(key, None)
+
+    async def _send(self, client, url, params, priority, user_id):
+        await self.loop.run_in_executor(None, _admit, url, params, priority, user_id)
+        try:
+            # Pre-encoded so the signature covers exactly the bytes that are sent
+            target = yarl.URL(url + '?' + _signed_query(client, params), encoded=True)
+            async with self._session().get(target, headers={'X-MBX-APIKEY': client.API_KEY},
+                                           proxy=config.PROXY_URL or None) as resp:
+                reply = _Reply(str(resp.url), resp.status, resp.headers, await resp.text())
+        finally:
+            scheduler.leave()
+        governor.observe(reply)
+        return _parse(reply)
+
+
+def _get_gateway():
+    """This process's gateway, created on first use (never in the gunicorn master before fork)."""
+    global _gateway
+    if _gateway is None or _gateway.pid != os.getpid():
+        with _gateway_lock:
+            if _gateway is None or _gateway.pid != os.getpid():
+                _gateway = _Gateway()
+    return _gateway
+
+
+def _blocking_get(client, base, path, params):
+    """fetch_many() without aiohttp: one governed requests.get."""
+    url = getattr(config, BASE_URLS[base]) + path + '?' + _signed_query(client, params)
+    proxies = {'https': config.PROXY_URL, 'http': config.PROXY_URL} if config.PROXY_URL else {}
+    resp = governed_get(url, headers={'X-MBX-APIKEY': client.API_KEY}, proxies=proxies, timeout=REQUEST_TIMEOUT)
+    return _parse(_Reply(resp.url, resp.status_code, resp.headers, resp.text))
+
+
+def fetch_many(client, calls, timeout=FETCH_MANY_TIMEOUT):
+    """
+    Send signed GETs [(base, path, params), ...] concurrently, base being 'api',
+    'fapi' or 'papi'. Returns a list in the same order holding each parsed
+    JSON reply or the exception that call raised (BinanceAPIException,
+    RequestShed, network errors).
+    """
+    calls = [(base, path, dict(params or {})) for base, path, params in calls]
+    if not calls:
+        return []
+    if aiohttp is None:
+        results = gather({i: (lambda c=c: _blocking_get(client, *c)) for i, c in enumerate(calls)},
+                         return_exceptions=True)
+        return [results[i] for i in range(len(calls))]
+
+    gateway = _get_gateway()
+    priority = current_priority('get')
+    user_id = current_user_id() or getattr(client, 'governor_user_id', None)
+
+    async def run_all():
+        return await asyncio.gather(*(gateway.get(client, base, path, params, priority, user_id)
+                                      for base, path, params in calls), return_exceptions=True)
+
+    return asyncio.run_coroutine_threadsafe(run_all(), gateway.loop).result(timeout)
+
+
+def _in_app_context(app, fn):
+    def run():
+        with app.app_context():
+            return fn()
+    return run
+
+
+def gather(calls, return_exceptions=False):
+    """
+    Run {name: zero-argument callable} side by side and return {name: result}.
+    Waits for every call; then raises the first failure in `calls` order, or
+    with return_exceptions=True puts the exception in its slot instead.
+    """
+    app = current_app._get_current_object() if has_app_context() else None
+    priority = current_priority('get')
+    user_id = current_user_id()
+
+    def bound(fn):
+        if has_request_context():
+            fn = copy_current_request_context(fn)   # session/current_user, in a fresh app context
+        elif app is not None:
+            fn = _in_app_context(app, fn)
+
+        def run():
+            with request_priority(priority, user_id):
+                return fn()
+        return run
+
+    results = {}
+    if getattr(_local, 'in_pool', False) or len(calls) < 2:
+        # Already on a gateway thread: waiting on the pool from inside it could deadlock
+        for name, fn in calls.items():
+            try:
+                results[name] = fn()
+            except Exception as e:
+                results[name] = e
+    else:
+        pool = _get_gateway().calls
+        futures = {name: pool.submit(bound(fn)) for name, fn in calls.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+
+    if not return_exceptions:
+        for value in results.values():
+            if isinstance(value, Exception):
+                raise value
+    return results
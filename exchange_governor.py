@@ -0,0 +1,459 @@
+"""
+Weight-aware request governor for every outbound Binance call.
+
+Binance reports the request weight an IP has used in the current minute in
+the X-MBX-USED-WEIGHT-1M response header. All users share one proxy egress
+IP, so one user's pollers eat into everyone's budget. The governor keeps the
+last reported weight per (egress, host), knows roughly what each endpoint
+costs, and delays or sheds low-priority reads BEFORE the limit is reached
+instead of reacting after Binance has already banned the IP (-1003).
+
+Every worker process learns the IP-wide number from its own responses, so
+the budget stays accurate across gunicorn workers without shared state.
+
+Calls are also prioritised: order placement/cancel/close (PRIORITY_TRADE)
+always go first and get weight headroom reserved for them, page renders
+(PRIORITY_INTERACTIVE) come next, and dashboard polling (PRIORITY_POLL)
+shares what is left fairly between users and is dropped when it goes stale.
+
+Identical concurrent reads (same API key, endpoint and params) are coalesced
+into one in-flight request whose result every caller shares (single-flight),
+so several tabs/threads missing the same cache at once cost one call.
+"""
+import copy
+import itertools
+import re
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from functools import wraps
+
+import requests
+from binance.client import Client
+
+import config
+
+# Per-IP request weight per minute, by API host
+HOST_WEIGHT_LIMITS = {
+    'fapi.binance.com': 2400,
+    'papi.binance.com': 6000,
+    'api.binance.com': 6000,
+}
+DEFAULT_WEIGHT_LIMIT = config.EXCHANGE_WEIGHT_LIMIT
+
+PRIORITY_TRADE = 0        # order placement, cancel, close — money moves
+PRIORITY_INTERACTIVE = 1  # a user waiting on a page render / form
+PRIORITY_POLL = 2         # dashboard setInterval pollers
+
+# Per priority: (delay above this share of the limit, shed above this share).
+# Polling backs off first so trades always have weight headroom left.
+PRIORITY_THRESHOLDS = {
+    PRIORITY_TRADE: (None, None),
+    PRIORITY_INTERACTIVE: (0.90, 0.97),
+    PRIORITY_POLL: (0.70, 0.85),
+}
+# How long a request may queue for a free slot before it's stale and dropped
+PRIORITY_MAX_WAIT = {
+    PRIORITY_TRADE: None,
+    PRIORITY_INTERACTIVE: 10.0,
+    PRIORITY_POLL: 2.0,   # the next poll tick will ask again anyway
+}
+MAX_CONCURRENT_REQUESTS = 6   # in-flight non-trade requests per process
+MAX_DELAY_SECONDS = 5    # never park a request longer than this; shed it instead
+DEFAULT_BAN_SECONDS = 60
+
+# Endpoint weights: path suffix -> (weight with symbol, weight without symbol)
+ENDPOINT_WEIGHTS = {
+    'exchangeInfo': (1, 1),
+    'ticker/price': (1, 2),
+    'ticker/bookTicker': (2, 5),
+    'premiumIndex': (1, 10),
+    'positionRisk': (5, 5),
+    'openOrders': (1, 40),
+    'algoOrder/openOrders': (1, 40),
+    'algoOrder': (1, 1),
+    'account': (5, 5),
+    'balance': (5, 5),
+    'leverageBracket': (1, 1),
+    'userTrades': (5, 5),
+    'order': (1, 1),
+    'batchOrders': (5, 5),
+    'allOpenOrders': (1, 1),
+    'leverage': (1, 1),
+    'marginType': (1, 1),
+    'time': (1, 1),
+    'ping': (1, 1),
+}
+
+
+class RequestShed(Exception):
+    """Raised instead of sending a low-priority request that would push the IP towards a ban."""
+
+
+def endpoint_weight(path, params=None):
+    """Estimated request weight for an API path such as '/fapi/v2/positionRisk'."""
+    path = urllib.parse.urlsplit(path).path.rstrip('/')
+    has_symbol = bool(params and params.get('symbol'))
+    best = None
+    for suffix in ENDPOINT_WEIGHTS:
+        if path.endswith('/' + suffix) and (best is None or len(suffix) > len(best)):
+            best = suffix
+    if best is None:
+        return 1
+    with_symbol, without_symbol = ENDPOINT_WEIGHTS[best]
+    return with_symbol if has_symbol else without_symbol
+
+
+def egress_key():
+    """Identify the outbound IP: all traffic through one proxy shares one budget."""
+    return getattr(config, 'PROXY_URL', None) or 'direct'
+
+
+class _WeightWindow:
+    """Used weight for one (egress, host) in the current one-minute window."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.minute = int(time.time() // 60)
+        self.banned_until = 0.0
+        self.lock = threading.Lock()
+
+    def roll(self, now):
+        minute = int(now // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used = 0
+
+
+class RequestGovernor:
+    def __init__(self):
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def _window(self, host):
+        key = (egress_key(), host)
+        window = self._windows.get(key)
+        if window is None:
+            with self._lock:
+                window = self._windows.setdefault(
+                    key, _WeightWindow(HOST_WEIGHT_LIMITS.get(host, DEFAULT_WEIGHT_LIMIT)))
+        return window
+
+    def acquire(self, url, params=None, priority=PRIORITY_POLL):
+        """
+        Reserve budget for one request. Trade calls (order placement,
+        cancels, closes) always go out unless the IP is banned; everything
+        else is delayed near its priority's threshold and shed above it.
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        weight = endpoint_weight(url, params)
+        window = self._window(host)
+        delay_at, shed_at = PRIORITY_THRESHOLDS[priority]
+        while True:
+            with window.lock:
+                now = time.time()
+                window.roll(now)
+                if now < window.banned_until:
+                    raise RequestShed(f"Binance IP ban active for {window.banned_until - now:.0f}s more ({host})")
+                projected = window.used + weight
+                wait = 0
+                if shed_at is not None:
+                    if projected > window.limit * shed_at:
+                        raise RequestShed(f"Request weight {window.used}/{window.limit} on {host} - low-priority call shed")
+                    if projected > window.limit * delay_at:
+                        wait = (window.minute + 1) * 60 - now
+                        if wait > MAX_DELAY_SECONDS:
+                            raise RequestShed(f"Request weight {window.used}/{window.limit} on {host} - low-priority call shed")
+                if not wait:
+                    # Optimistic reservation until the response header corrects it
+                    window.used = projected
+                    return weight
+            print(f"[GOVERNOR] {host} at {window.used}/{window.limit} weight, delaying read {wait:.1f}s")
+            time.sleep(wait)
+
+    def observe(self, response):
+        """Record the authoritative used weight (and any ban) from a Binance response."""
+        if response is None:
+            return
+        host = urllib.parse.urlsplit(response.url or '').netloc
+        window = self._window(host)
+        used = response.headers.get('X-MBX-USED-WEIGHT-1M') or response.headers.get('X-MBX-USED-WEIGHT')
+        with window.lock:
+            now = time.time()
+            window.roll(now)
+            if used and str(used).isdigit():
+                window.used = int(used)
+            if response.status_code in (418, 429):
+                retry_after = response.headers.get('Retry-After')
+                seconds = int(retry_after) if retry_after and retry_after.isdigit() else DEFAULT_BAN_SECONDS
+                window.banned_until = max(window.banned_until, now + seconds)
+                print(f"[GOVERNOR] HTTP {response.status_code} from {host}: backing off {seconds}s")
+        self.note_error(response.text if response.status_code >= 400 else '', host)
+
+    def note_error(self, message, host):
+        """Honour '-1003 ... banned until <ms>' so we stop hammering and extending the ban."""
+        message = str(message or '')
+        if '-1003' not in message:
+            return
+        window = self._window(host)
+        match = re.search(r'banned until (\d+)', message)
+        with window.lock:
+            until = int(match.group(1)) / 1000 if match else time.time() + DEFAULT_BAN_SECONDS
+            window.banned_until = max(window.banned_until, until)
+
+    def banned_until(self, host=None):
+        """Epoch seconds until which the host (default: futures API) is banned for our egress IP (0 if not banned)."""
+        window = self._window(host or urllib.parse.urlsplit(config.BINANCE_FAPI_URL).netloc)
+        return window.banned_until if window.banned_until > time.time() else 0
+
+    def status(self):
+        """Snapshot of every tracked window, for debugging/metrics."""
+        now = time.time()
+        out = {}
+        for (egress, host), window in list(self._windows.items()):
+            window.roll(now)
+            out[host] = {
+                'egress': 'proxy' if egress != 'direct' else 'direct',
+                'used_weight': window.used,
+                'limit': window.limit,
+                'banned_for': max(0, round(window.banned_until - now)),
+            }
+        return out
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'user_id', 'enqueued_at')
+
+    def __init__(self, priority, seq, user_id):
+        self.priority = priority
+        self.seq = seq
+        self.user_id = user_id
+        self.enqueued_at = time.time()
+
+
+class RequestScheduler:
+    """
+    Hands out in-flight request slots by priority. Trade calls never queue;
+    other calls wait for one of MAX_CONCURRENT_REQUESTS slots, highest
+    priority first and, within a priority, the user served least recently
+    first — so one user's pollers can't starve everyone else's. Waiters
+    that outlive their priority's max wait are dropped as stale.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS):
+        self.max_concurrent = max_concurrent
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = []
+        self._last_served = {}
+        self._seq = itertools.count()
+
+    def _next_waiter(self):
+        return min(self._waiting, key=lambda w: (w.priority, self._last_served.get(w.user_id, 0), w.seq))
+
+    def enter(self, priority, user_id=None):
+        with self._cond:
+            if priority == PRIORITY_TRADE:
+                self._active += 1
+                return
+            waiter = _Waiter(priority, next(self._seq), user_id)
+            self._waiting.append(waiter)
+            max_wait = PRIORITY_MAX_WAIT[priority]
+            try:
+                while not (self._active < self.max_concurrent and self._next_waiter() is waiter):
+                    remaining = None if max_wait is None else waiter.enqueued_at + max_wait - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise RequestShed(f"Stale request dropped after {max_wait:.1f}s in queue")
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._waiting.remove(waiter)
+                self._cond.notify_all()
+                raise
+            self._waiting.remove(waiter)
+            self._active += 1
+            self._last_served[user_id] = time.time()
+
+    def leave(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority, user_id=None):
+        self.enter(priority, user_id)
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def status(self):
+        with self._cond:
+            return {'active': self._active, 'waiting': len(self._waiting)}
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    request, everyone arriving while it's in flight waits and gets a copy of
+    the same result (or the same error). Nothing is cached after it lands.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.coalesced = 0
+
+    def do(self, key, fn, copy_result=True):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if isinstance(flight.error, RequestShed):
+                # The leader was shed at its own priority; ours may be higher
+                return fn()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result) if copy_result else flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+
+_VOLATILE_PARAMS = ('timestamp', 'signature', 'recvWindow')
+
+
+def flight_key(api_key, url, params):
+    """Identity of a read: who asks, what endpoint, which params (minus signing noise)."""
+    items = (params or {}).items() if isinstance(params, dict) else (params or [])
+    return (api_key, url, tuple(sorted((str(k), str(v)) for k, v in items if k not in _VOLATILE_PARAMS)))
+
+
+governor = RequestGovernor()
+scheduler = RequestScheduler()
+single_flight = SingleFlight()
+
+_context = threading.local()
+
+
+@contextmanager
+def request_priority(priority, user_id=None):
+    """Run the enclosed exchange calls at the given priority (innermost wins)."""
+    previous = (getattr(_context, 'priority', None), getattr(_context, 'user_id', None))
+    _context.priority = priority
+    if user_id is not None:
+        _context.user_id = user_id
+    try:
+        yield
+    finally:
+        _context.priority, _context.user_id = previous
+
+
+def with_priority(priority):
+    """Decorator form of request_priority, e.g. @with_priority(PRIORITY_TRADE)."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with request_priority(priority):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_priority(method='get'):
+    """Priority for a call: the enclosing context's, else writes are trades and reads are polls."""
+    priority = getattr(_context, 'priority', None)
+    if priority is not None:
+        return priority
+    return PRIORITY_POLL if method.lower() == 'get' else PRIORITY_TRADE
+
+
+def current_user_id():
+    """User the enclosing request_priority() context is fair-sharing for, if any."""
+    return getattr(_context, 'user_id', None)
+
+
+def governed_get(url, priority=None, user_id=None, **kwargs):
+    """requests.get through the governor, for raw (non-python-binance) Binance calls."""
+    params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query))
+    params.update(kwargs.get('params') or {})
+    priority = current_priority('get') if priority is None else priority
+
+    def fetch():
+        governor.acquire(url, params, priority=priority)
+        with scheduler.slot(priority, user_id or getattr(_context, 'user_id', None)):
+            resp = requests.get(url, **kwargs)
+        governor.observe(resp)
+        return resp
+
+    # Signed reads are per account: key them on the API key, and never share one we can't attribute
+    api_key = (kwargs.get('headers') or {}).get('X-MBX-APIKEY')
+    if api_key is None and 'signature' in params:
+        return fetch()
+    # Response objects are read-only for callers (.json() re-parses), so share as-is
+    return single_flight.do(flight_key(api_key, url.split('?')[0], params), fetch, copy_result=False)
+
+
+class GovernedClient(Client):
+    """python-binance Client whose every REST call goes through the governor."""
+
+    # Base URLs follow config so the client can target fake_binance.py offline
+    API_URL = config.BINANCE_API_URL + '/api'
+    FUTURES_URL = config.BINANCE_FAPI_URL + '/fapi'
+    FUTURES_DATA_URL = config.BINANCE_FAPI_URL + '/futures/data'
+    PAPI_URL = config.BINANCE_PAPI_URL + '/papi'
+
+    # Set by logic.get_user_exchange_client so polling is shared fairly per user
+    governor_user_id = None
+
+    # python-binance stores each reply on self.response and then re-reads it to
+    # parse; per-thread storage lets one client run requests from several threads
+    # (gthread workers, concurrent SL/TP placement) without parsing another's reply
+    @property
+    def response(self):
+        return getattr(self.__dict__.setdefault('_thread_state', threading.local()), 'response', None)
+
+    @response.setter
+    def response(self, value):
+        self.__dict__.setdefault('_thread_state', threading.local()).response = value
+
+    def _request(self, method, uri, signed, force_params=False, **kwargs):
+        params = kwargs.get('data') or kwargs.get('params') or {}
+        if method.lower() == 'get':
+            return single_flight.do(
+                flight_key(self.API_KEY, uri, params),
+                lambda: self._governed_request(method, uri, signed, force_params, params, **kwargs),
+            )
+        return self._governed_request(method, uri, signed, force_params, params, **kwargs)
+
+    def _governed_request(self, method, uri, signed, force_params, params, **kwargs):
+        priority = current_priority(method)
+        governor.acquire(uri, params, priority=priority)
+        self.response = None
+        try:
+            with scheduler.slot(priority, self.governor_user_id):
+                return super()._request(method, uri, signed, force_params, **kwargs)
+        finally:
+            governor.observe(self.response)
@@ -0,0 +1,740 @@
+"""
+Local stand-in for the Binance USDⓈ-M Futures REST API (and its market streams).
+
+Implements the endpoints logic.py actually calls (exchangeInfo, ticker/price,
+premiumIndex, positionRisk, openOrders, algoOrder, order create/cancel,
+batchOrders, leverage, marginType, userTrades, account, balance,
+leverageBracket and the papi /um equivalents) with in-memory per-API-key
+state, so the app and the benchmarks run offline and deterministically.
+
+Knobs (command line, start_server(**options) or POST /_fake/config):
+    latency_ms / jitter_ms   - added to every response
+    slow_ratio / slow_ms     - that fraction of responses takes slow_ms longer
+                               (a struggling proxy)
+    weight_limit             - per-minute request weight; X-MBX-USED-WEIGHT-1M
+                               is reported and going over bans the IP (-1003)
+    ban_seconds              - how long that ban lasts
+    algo_required            - conditional types on /order answer -4120
+                               (like current Binance) and must use /algoOrder
+    valid_keys               - if set, any other API key gets -2015
+    seed / tick_seconds      - prices follow a seeded random walk, one step per tick
+    fail                     - [{"code": -1003|-4120|-2015|..., "path": "order", "count": 1}]
+                               one-shot error injection, matched by path suffix
+
+Point the app at it with:
+    BINANCE_FAPI_URL=http://127.0.0.1:8765 BINANCE_PAPI_URL=http://127.0.0.1:8765 \
+    BINANCE_API_URL=http://127.0.0.1:8765
+and start it with:
+    python fake_binance.py --port 8765 --latency-ms 80 --seed 7
+
+--stream-port also serves /stream?streams=!markPrice@arr@1s/<sym>@bookTicker
+(plus SUBSCRIBE/UNSUBSCRIBE) for market_data.py; point BINANCE_FSTREAM_URL at
+ws://127.0.0.1:<stream-port>.
+"""
+import argparse
+import collections
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from exchange_governor import endpoint_weight
+
+try:
+    from websockets.exceptions import ConnectionClosed
+    from websockets.sync.server import serve as ws_serve
+except ImportError:  # only needed for the stream stand-in
+    ws_serve = None
+    ConnectionClosed = Exception
+
+# symbol -> (start price, tick size, step size, min notional, max leverage)
+SEED_SYMBOLS = {
+    'BTCUSDT': (65000.0, 0.1, 0.001, 100, 125),
+    'ETHUSDT': (3200.0, 0.01, 0.001, 20, 125),
+    'BNBUSDT': (580.0, 0.01, 0.01, 5, 75),
+    'SOLUSDT': (150.0, 0.01, 1, 5, 50),
+    'XRPUSDT': (0.6, 0.0001, 0.1, 5, 50),
+    'DOGEUSDT': (0.15, 0.00001, 1, 5, 50),
+    'ADAUSDT': (0.45, 0.0001, 1, 5, 50),
+    'LINKUSDT': (14.0, 0.001, 0.01, 5, 50),
+    'LTCUSDT': (80.0, 0.01, 0.001, 20, 50),
+    'AVAXUSDT': (30.0, 0.001, 1, 5, 50),
+}
+# The real exchangeInfo lists a few hundred contracts; pad to a realistic payload
+EXTRA_SYMBOLS = 250
+CONDITIONAL_TYPES = ('STOP', 'STOP_MARKET', 'TAKE_PROFIT', 'TAKE_PROFIT_MARKET', 'TRAILING_STOP_MARKET')
+
+DEFAULT_OPTIONS = {
+    'latency_ms': 0,
+    'jitter_ms': 0,
+    'slow_ratio': 0.0,
+    'slow_ms': 0,
+    'weight_limit': 2400,
+    'ban_seconds': 60,
+    'algo_required': True,
+    'valid_keys': None,
+    'seed': 1,
+    'tick_seconds': 1.0,
+    'starting_balance': 10000.0,
+    'fail': [],
+}
+
+
+class FakeBinanceError(Exception):
+    def __init__(self, code, msg, status=400):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.status = status
+
+
+def _decimals(step):
+    return max(0, int(round(-math.log10(step)))) if step < 1 else 0
+
+
+class Market:
+    """Contract specs and seeded price paths shared by every account."""
+
+    def __init__(self, seed, tick_seconds, extra_symbols=EXTRA_SYMBOLS):
+        self.seed = seed
+        self.tick_seconds = tick_seconds
+        self.started = time.time()
+        self.specs = dict(SEED_SYMBOLS)
+        rng = random.Random(seed)
+        for i in range(extra_symbols):
+            price = round(rng.uniform(0.01, 50), 4)
+            self.specs[f"ALT{i:03d}USDT"] = (price, 0.0001, 1, 5, rng.choice([20, 25, 50, 75]))
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def tick(self):
+        return int((time.time() - self.started) / self.tick_seconds)
+
+    def price(self, symbol):
+        """Seeded geometric random walk: same seed, same tick -> same price."""
+        tick = self.tick()
+        with self._lock:
+            path = self._paths.get(symbol)
+            if path is None:
+                path = self._paths[symbol] = ([self.specs[symbol][0]], random.Random(f"{self.seed}:{symbol}"))
+            prices, rng = path
+            while len(prices) <= tick:
+                prices.append(prices[-1] * math.exp(rng.gauss(0, 0.0015)))
+            tick_size = self.specs[symbol][1]
+            return round(prices[tick], _decimals(tick_size))
+
+    def require(self, symbol):
+        if symbol not in self.specs:
+            raise FakeBinanceError(-1121, 'Invalid symbol.')
+        return self.specs[symbol]
+
+    def symbol_info(self, symbol):
+        price, tick, step, notional, _ = self.specs[symbol]
+        return {
+            'symbol': symbol, 'pair': symbol, 'contractType': 'PERPETUAL', 'status': 'TRADING',
+            'baseAsset': symbol[:-4], 'quoteAsset': 'USDT', 'marginAsset': 'USDT',
+            'pricePrecision': _decimals(tick), 'quantityPrecision': _decimals(step),
+            'orderTypes': ['LIMIT', 'MARKET', 'STOP', 'STOP_MARKET', 'TAKE_PROFIT', 'TAKE_PROFIT_MARKET'],
+            'filters': [
+                {'filterType': 'PRICE_FILTER', 'tickSize': str(tick), 'minPrice': str(tick), 'maxPrice': '1000000'},
+                {'filterType': 'LOT_SIZE', 'stepSize': str(step), 'minQty': str(step), 'maxQty': '100000000'},
+                {'filterType': 'MARKET_LOT_SIZE', 'stepSize': str(step), 'minQty': str(step), 'maxQty': '100000000'},
+                {'filterType': 'MIN_NOTIONAL', 'notional': str(notional)},
+            ],
+        }
+
+    def brackets(self, symbol):
+        max_lev = self.specs[symbol][4]
+        rows, floor, lev, cap = [], 0, max_lev, 50000
+        for i in range(1, 7):
+            mmr = round(0.5 / lev, 4)
+            rows.append({'bracket': i, 'initialLeverage': int(lev), 'notionalCap': cap, 'notionalFloor': floor,
+                         'maintMarginRatio': mmr, 'cum': 0.0})
+            floor, cap, lev = cap, cap * 5, max(1, lev // 2)
+        return {'symbol': symbol, 'brackets': rows}
+
+
+class Account:
+    """Per-API-key futures account: positions, open/algo orders, trades, settings."""
+
+    def __init__(self, market, balance):
+        self.market = market
+        self.wallet = balance
+        self.positions = {}      # symbol -> {'amt', 'entry'}
+        self.leverage = {}       # symbol -> int
+        self.margin_type = {}    # symbol -> 'CROSSED' | 'ISOLATED'
+        self.orders = {}         # orderId -> order
+        self.algo_orders = {}    # algoId -> algo order
+        self.trades = []
+        self.lock = threading.RLock()
+
+    def _position_row(self, symbol):
+        pos = self.positions.get(symbol, {'amt': 0.0, 'entry': 0.0})
+        mark = self.market.price(symbol)
+        lev = self.leverage.get(symbol, 20)
+        amt, entry = pos['amt'], pos['entry']
+        upnl = (mark - entry) * amt if amt else 0.0
+        liq = entry * (1 - 1 / lev) if amt > 0 else entry * (1 + 1 / lev) if amt < 0 else 0
+        return {
+            'symbol': symbol, 'positionSide': 'BOTH', 'positionAmt': str(amt), 'entryPrice': str(entry),
+            'breakEvenPrice': str(entry), 'markPrice': str(mark), 'unRealizedProfit': str(round(upnl, 8)),
+            'liquidationPrice': str(round(liq, 8)), 'leverage': str(lev),
+            'marginType': 'isolated' if self.margin_type.get(symbol) == 'ISOLATED' else 'cross',
+            'isolatedMargin': '0', 'notional': str(round(mark * amt, 8)),
+            'maxNotionalValue': str(self.market.brackets(symbol)['brackets'][0]['notionalCap']),
+            'updateTime': int(time.time() * 1000),
+        }
+
+    def position_rows(self, symbol=None):
+        if symbol:
+            self.market.require(symbol)
+            return [self._position_row(symbol)]
+        return [self._position_row(s) for s in self.market.specs]
+
+    def totals(self):
+        upnl = init_margin = maint = 0.0
+        for symbol, pos in self.positions.items():
+            if not pos['amt']:
+                continue
+            mark = self.market.price(symbol)
+            upnl += (mark - pos['entry']) * pos['amt']
+            notional = abs(mark * pos['amt'])
+            init_margin += notional / self.leverage.get(symbol, 20)
+            maint += notional * 0.004
+        return upnl, init_margin, maint
+
+    def account(self):
+        upnl, init_margin, maint = self.totals()
+        available = self.wallet + upnl - init_margin
+        usdt = {'asset': 'USDT', 'walletBalance': str(self.wallet), 'unrealizedProfit': str(upnl),
+                'marginBalance': str(self.wallet + upnl), 'initialMargin': str(init_margin),
+                'maintMargin': str(maint), 'availableBalance': str(available), 'maxWithdrawAmount': str(available)}
+        return {
+            'totalWalletBalance': str(self.wallet), 'totalUnrealizedProfit': str(upnl),
+            'totalMarginBalance': str(self.wallet + upnl), 'totalInitialMargin': str(init_margin),
+            'totalMaintMargin': str(maint), 'availableBalance': str(available),
+            'maxWithdrawAmount': str(available), 'assets': [usdt],
+            'positions': [r for r in self.position_rows() if float(r['positionAmt'])],
+        }
+
+    def fill(self, symbol, side, qty, reduce_only=False):
+        """Fill qty at the current price, updating the position, wallet and trade log."""
+        price = self.market.price(symbol)
+        pos = self.positions.setdefault(symbol, {'amt': 0.0, 'entry': 0.0})
+        signed = qty if side == 'BUY' else -qty
+        if reduce_only:
+            if not pos['amt'] or (pos['amt'] > 0) == (signed > 0):
+                raise FakeBinanceError(-2022, 'ReduceOnly Order is rejected.')
+            signed = max(-abs(pos['amt']), min(abs(pos['amt']), signed))
+        realized = 0.0
+        if pos['amt'] and (pos['amt'] > 0) != (signed > 0):
+            closed = min(abs(signed), abs(pos['amt']))
+            realized = (price - pos['entry']) * closed * (1 if pos['amt'] > 0 else -1)
+            self.wallet += realized
+        new_amt = round(pos['amt'] + signed, 8)
+        if new_amt and (not pos['amt'] or (pos['amt'] > 0) != (new_amt > 0)):
+            pos['entry'] = price
+        elif new_amt and (pos['amt'] > 0) == (signed > 0):
+            pos['entry'] = (pos['entry'] * abs(pos['amt']) + price * abs(signed)) / abs(new_amt)
+        pos['amt'] = new_amt
+        if not new_amt:
+            pos['entry'] = 0.0
+            self._drop_close_position_orders(symbol)
+        self.trades.append({
+            'symbol': symbol, 'id': len(self.trades) + 1, 'side': side, 'price': str(price), 'qty': str(abs(signed)),
+            'realizedPnl': str(round(realized, 8)), 'commission': str(round(abs(signed) * price * 0.0004, 8)),
+            'commissionAsset': 'USDT', 'time': int(time.time() * 1000), 'buyer': side == 'BUY',
+            'maker': False, 'positionSide': 'BOTH',
+        })
+        return price, abs(signed), realized
+
+    def _drop_close_position_orders(self, symbol):
+        for book in (self.orders, self.algo_orders):
+            for oid in [k for k, o in book.items() if o['symbol'] == symbol and o.get('closePosition') in (True, 'true')]:
+                book.pop(oid)
+
+
+class FakeBinance:
+    """All server state: market, accounts, weight window, injected failures."""
+
+    def __init__(self, **options):
+        self.options = dict(DEFAULT_OPTIONS)
+        self.options.update(options)
+        self.market = Market(self.options['seed'], self.options['tick_seconds'])
+        self.accounts = {}
+        self.ids = itertools.count(1000001)
+        self.lock = threading.Lock()
+        self.weight_minute = 0
+        self.weight_used = 0
+        self.banned_until = 0
+        self.request_count = 0
+        self.path_counts = collections.Counter()
+
+    def account(self, api_key):
+        with self.lock:
+            if api_key not in self.accounts:
+                self.accounts[api_key] = Account(self.market, self.options['starting_balance'])
+            return self.accounts[api_key]
+
+    def configure(self, **options):
+        with self.lock:
+            for key, value in options.items():
+                if key == 'fail':
+                    self.options['fail'] = list(self.options['fail']) + list(value)
+                elif key == 'reset_ban':
+                    self.banned_until = 0
+                else:
+                    self.options[key] = value
+        return self.options
+
+    def charge(self, path, params):
+        """Apply request weight; returns the used-weight header value or raises the -1003 ban."""
+        now = time.time()
+        with self.lock:
+            self.request_count += 1
+            self.path_counts[path] += 1
+            if now < self.banned_until:
+                raise FakeBinanceError(-1003, f"Way too much request weight used; IP banned until {int(self.banned_until * 1000)}. "
+                                              "Please use WebSocket Streams for live updates to avoid bans.", 418)
+            minute = int(now // 60)
+            if minute != self.weight_minute:
+                self.weight_minute, self.weight_used = minute, 0
+            self.weight_used += endpoint_weight(path, params)
+            if self.weight_used > self.options['weight_limit']:
+                self.banned_until = now + self.options['ban_seconds']
+                raise FakeBinanceError(-1003, f"Way too much request weight used; IP banned until {int(self.banned_until * 1000)}. "
+                                              "Please use WebSocket Streams for live updates to avoid bans.", 418)
+            return self.weight_used
+
+    def injected_failure(self, path):
+        with self.lock:
+            for rule in self.options['fail']:
+                if rule.get('count', 1) > 0 and path.endswith(rule.get('path', '')):
+                    rule['count'] = rule.get('count', 1) - 1
+                    code = int(rule.get('code', -1000))
+                    if code == -1003:
+                        self.banned_until = time.time() + self.options['ban_seconds']
+                    return FakeBinanceError(code, rule.get('msg') or ERROR_MESSAGES.get(code, 'Injected failure.'),
+                                            418 if code == -1003 else int(rule.get('status', 400)))
+        return None
+
+    # ---- request routing -------------------------------------------------
+
+    def handle(self, method, path, params, api_key):
+        route = ROUTES.get((method, self._normalise(path)))
+        if route is None:
+            raise FakeBinanceError(-5000, f"Path {path}, Method {method} is invalid", 404)
+        handler, signed = route
+        if signed:
+            if not api_key or (self.options['valid_keys'] and api_key not in self.options['valid_keys']):
+                raise FakeBinanceError(-2015, ERROR_MESSAGES[-2015], 401)
+            return handler(self, self.account(api_key), params)
+        return handler(self, None, params)
+
+    @staticmethod
+    def _normalise(path):
+        # /fapi/v2/positionRisk, /fapi/v3/positionRisk -> fapi positionRisk; papi keeps its /um prefix
+        parts = [p for p in path.split('/') if p]
+        if len(parts) >= 3 and parts[0] in ('fapi', 'api'):
+            return parts[0] + ':' + '/'.join(parts[2:])
+        if len(parts) >= 3 and parts[0] == 'papi':
+            return 'papi:' + '/'.join(parts[2:])
+        return path
+
+    # ---- public ----------------------------------------------------------
+
+    def ping(self, acc, params):
+        return {}
+
+    def server_time(self, acc, params):
+        return {'serverTime': int(time.time() * 1000)}
+
+    def exchange_info(self, acc, params):
+        return {'timezone': 'UTC', 'serverTime': int(time.time() * 1000), 'rateLimits': [
+            {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': self.options['weight_limit']}],
+            'symbols': [self.market.symbol_info(s) for s in self.market.specs]}
+
+    def ticker_price(self, acc, params):
+        now = int(time.time() * 1000)
+        if params.get('symbol'):
+            self.market.require(params['symbol'])
+            return {'symbol': params['symbol'], 'price': str(self.market.price(params['symbol'])), 'time': now}
+        return [{'symbol': s, 'price': str(self.market.price(s)), 'time': now} for s in self.market.specs]
+
+    def premium_index(self, acc, params):
+        now = int(time.time() * 1000)
+
+        def row(s):
+            p = self.market.price(s)
+            return {'symbol': s, 'markPrice': str(p), 'indexPrice': str(p), 'estimatedSettlePrice': str(p),
+                    'lastFundingRate': '0.00010000', 'nextFundingTime': (now // 28800000 + 1) * 28800000,
+                    'interestRate': '0.00010000', 'time': now}
+        if params.get('symbol'):
+            self.market.require(params['symbol'])
+            return row(params['symbol'])
+        return [row(s) for s in self.market.specs]
+
+    # ---- signed: reads ---------------------------------------------------
+
+    def position_risk(self, acc, params):
+        with acc.lock:
+            return acc.position_rows(params.get('symbol'))
+
+    def account_info(self, acc, params):
+        with acc.lock:
+            return acc.account()
+
+    def balance(self, acc, params):
+        with acc.lock:
+            return acc.account()['assets']
+
+    def open_orders(self, acc, params):
+        with acc.lock:
+            return [o for o in acc.orders.values() if not params.get('symbol') or o['symbol'] == params['symbol']]
+
+    def algo_open_orders(self, acc, params):
+        with acc.lock:
+            return [o for o in acc.algo_orders.values() if not params.get('symbol') or o['symbol'] == params['symbol']]
+
+    def user_trades(self, acc, params):
+        start = int(params.get('startTime') or 0)
+        limit = int(params.get('limit') or 500)
+        with acc.lock:
+            rows = [t for t in acc.trades if t['time'] >= start and (not params.get('symbol') or t['symbol'] == params['symbol'])]
+        return rows[-limit:]
+
+    def leverage_bracket(self, acc, params):
+        if params.get('symbol'):
+            self.market.require(params['symbol'])
+            return [self.market.brackets(params['symbol'])]
+        return [self.market.brackets(s) for s in self.market.specs]
+
+    # ---- signed: writes --------------------------------------------------
+
+    def change_leverage(self, acc, params):
+        symbol = params.get('symbol', '')
+        self.market.require(symbol)
+        lev = int(params.get('leverage') or 0)
+        if lev < 1 or lev > self.market.specs[symbol][4]:
+            raise FakeBinanceError(-4028, f"Leverage {lev} is not valid")
+        with acc.lock:
+            acc.leverage[symbol] = lev
+        return {'symbol': symbol, 'leverage': lev, 'maxNotionalValue': str(self.market.brackets(symbol)['brackets'][0]['notionalCap'])}
+
+    def change_margin_type(self, acc, params):
+        symbol = params.get('symbol', '')
+        self.market.require(symbol)
+        wanted = (params.get('marginType') or '').upper()
+        with acc.lock:
+            if acc.margin_type.get(symbol, 'CROSSED') == wanted:
+                raise FakeBinanceError(-4046, 'No need to change margin type.')
+            acc.margin_type[symbol] = wanted
+        return {'code': 200, 'msg': 'success'}
+
+    def new_order(self, acc, params):
+        symbol = params.get('symbol', '')
+        self.market.require(symbol)
+        order_type = (params.get('type') or '').upper()
+        side = (params.get('side') or '').upper()
+        if side not in ('BUY', 'SELL'):
+            raise FakeBinanceError(-1102, "Mandatory parameter 'side' was not sent, was empty/null, or malformed.")
+        if order_type in CONDITIONAL_TYPES and self.options['algo_required']:
+            raise FakeBinanceError(-4120, ERROR_MESSAGES[-4120])
+        close_position = str(params.get('closePosition', '')).lower() == 'true'
+        qty = float(params.get('quantity') or 0)
+        if qty <= 0 and not close_position:
+            raise FakeBinanceError(-1102, "Mandatory parameter 'quantity' was not sent, was empty/null, or malformed.")
+        reduce_only = str(params.get('reduceOnly', '')).lower() == 'true'
+        now = int(time.time() * 1000)
+        order = {
+            'orderId': next(self.ids), 'symbol': symbol, 'status': 'NEW', 'clientOrderId': params.get('newClientOrderId') or f"fake{now}",
+            'price': str(params.get('price') or 0), 'avgPrice': '0', 'origQty': str(qty), 'executedQty': '0',
+            'cumQuote': '0', 'timeInForce': params.get('timeInForce') or 'GTC', 'type': order_type,
+            'origType': order_type, 'reduceOnly': reduce_only, 'closePosition': close_position, 'side': side,
+            'positionSide': 'BOTH', 'stopPrice': str(params.get('stopPrice') or 0),
+            'workingType': params.get('workingType') or 'CONTRACT_PRICE', 'updateTime': now,
+        }
+        with acc.lock:
+            if order_type == 'MARKET':
+                price, filled, realized = acc.fill(symbol, side, qty, reduce_only)
+                order.update(status='FILLED', avgPrice=str(price), executedQty=str(filled),
+                             cumQuote=str(round(price * filled, 8)), realizedPnl=str(round(realized, 8)))
+            else:
+                acc.orders[order['orderId']] = order
+        return order
+
+    def batch_orders(self, acc, params):
+        results = []
+        for p in json.loads(params.get('batchOrders') or '[]'):
+            try:
+                results.append(self.new_order(acc, {k: str(v) for k, v in p.items()}))
+            except FakeBinanceError as e:
+                results.append({'code': e.code, 'msg': e.msg})
+        return results
+
+    def cancel_order(self, acc, params):
+        with acc.lock:
+            order = acc.orders.pop(int(params.get('orderId') or 0), None)
+        if order is None:
+            raise FakeBinanceError(-2011, 'Unknown order sent.')
+        order.update(status='CANCELED', updateTime=int(time.time() * 1000))
+        return order
+
+    def cancel_all(self, acc, params):
+        with acc.lock:
+            for oid in [k for k, o in acc.orders.items() if o['symbol'] == params.get('symbol')]:
+                acc.orders.pop(oid)
+        return {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
+
+    def new_algo_order(self, acc, params):
+        symbol = params.get('symbol', '')
+        self.market.require(symbol)
+        order_type = (params.get('type') or '').upper()
+        if order_type not in CONDITIONAL_TYPES:
+            raise FakeBinanceError(-1116, 'Invalid orderType.')
+        close_position = str(params.get('closePosition', '')).lower() == 'true'
+        qty = float(params.get('quantity') or 0)
+        if qty <= 0 and not close_position:
+            raise FakeBinanceError(-1102, "Mandatory parameter 'quantity' was not sent, was empty/null, or malformed.")
+        now = int(time.time() * 1000)
+        algo = {
+            'algoId': next(self.ids), 'clientAlgoId': params.get('clientAlgoId') or f"fakealgo{now}",
+            'algoType': params.get('algoType') or 'CONDITIONAL', 'orderType': order_type, 'type': order_type,
+            'symbol': symbol, 'side': (params.get('side') or '').upper(), 'positionSide': 'BOTH',
+            'timeInForce': params.get('timeInForce') or 'GTC', 'quantity': str(qty),
+            'algoStatus': 'NEW', 'triggerPrice': str(params.get('triggerPrice') or 0),
+            'price': str(params.get('price') or 0), 'workingType': params.get('workingType') or 'CONTRACT_PRICE',
+            'closePosition': close_position, 'reduceOnly': str(params.get('reduceOnly', '')).lower() == 'true',
+            'createTime': now, 'updateTime': now,
+        }
+        with acc.lock:
+            acc.algo_orders[algo['algoId']] = algo
+        return algo
+
+    def cancel_algo_order(self, acc, params):
+        with acc.lock:
+            algo = acc.algo_orders.pop(int(params.get('algoId') or 0), None)
+        if algo is None:
+            raise FakeBinanceError(-2011, 'Unknown order sent.')
+        return {'algoId': algo['algoId'], 'clientAlgoId': algo['clientAlgoId'], 'code': '200', 'msg': 'success'}
+
+    def control(self, acc, params):
+        return {'options': self.configure(**params), 'weight_used': self.weight_used,
+                'requests': self.request_count, 'banned_until': int(self.banned_until * 1000)}
+
+
+ERROR_MESSAGES = {
+    -1003: 'Way too much request weight used; IP banned. Please use WebSocket Streams for live updates to avoid bans.',
+    -2015: 'Invalid API-key, IP, or permissions for action.',
+    -4120: 'Order type not supported for this endpoint. Please use the Algo Order API endpoints instead.',
+    -1021: 'Timestamp for this request is outside of the recvWindow.',
+}
+
+# (method, normalised path) -> (handler, signed)
+ROUTES = {
+    ('GET', 'fapi:ping'): (FakeBinance.ping, False),
+    ('GET', 'api:ping'): (FakeBinance.ping, False),
+    ('GET', 'fapi:time'): (FakeBinance.server_time, False),
+    ('GET', 'api:time'): (FakeBinance.server_time, False),
+    ('GET', 'fapi:exchangeInfo'): (FakeBinance.exchange_info, False),
+    ('GET', 'fapi:ticker/price'): (FakeBinance.ticker_price, False),
+    ('GET', 'fapi:premiumIndex'): (FakeBinance.premium_index, False),
+    ('GET', 'fapi:positionRisk'): (FakeBinance.position_risk, True),
+    ('GET', 'fapi:account'): (FakeBinance.account_info, True),
+    ('GET', 'fapi:balance'): (FakeBinance.balance, True),
+    ('GET', 'fapi:openOrders'): (FakeBinance.open_orders, True),
+    ('GET', 'fapi:algoOrder/openOrders'): (FakeBinance.algo_open_orders, True),
+    ('GET', 'fapi:userTrades'): (FakeBinance.user_trades, True),
+    ('GET', 'fapi:leverageBracket'): (FakeBinance.leverage_bracket, True),
+    ('POST', 'fapi:leverage'): (FakeBinance.change_leverage, True),
+    ('POST', 'fapi:marginType'): (FakeBinance.change_margin_type, True),
+    ('POST', 'fapi:order'): (FakeBinance.new_order, True),
+    ('POST', 'fapi:batchOrders'): (FakeBinance.batch_orders, True),
+    ('DELETE', 'fapi:order'): (FakeBinance.cancel_order, True),
+    ('DELETE', 'fapi:allOpenOrders'): (FakeBinance.cancel_all, True),
+    ('POST', 'fapi:algoOrder'): (FakeBinance.new_algo_order, True),
+    ('DELETE', 'fapi:algoOrder'): (FakeBinance.cancel_algo_order, True),
+    # Portfolio Margin (papi) equivalents
+    ('GET', 'papi:um/positionRisk'): (FakeBinance.position_risk, True),
+    ('GET', 'papi:um/account'): (FakeBinance.account_info, True),
+    ('GET', 'papi:um/openOrders'): (FakeBinance.open_orders, True),
+    ('GET', 'papi:um/userTrades'): (FakeBinance.user_trades, True),
+    ('GET', 'papi:um/leverageBracket'): (FakeBinance.leverage_bracket, True),
+    ('POST', 'papi:um/order'): (FakeBinance.new_order, True),
+    ('DELETE', 'papi:um/order'): (FakeBinance.cancel_order, True),
+    ('POST', 'papi:um/leverage'): (FakeBinance.change_leverage, True),
+    ('POST', '/_fake/config'): (FakeBinance.control, False),
+    ('GET', '/_fake/config'): (FakeBinance.control, False),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None  # set by make_server
+
+    def _params(self):
+        parsed = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(parsed.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode()
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                params.update(json.loads(body or '{}'))
+            else:
+                params.update(dict(urllib.parse.parse_qsl(body)))
+        params.pop('signature', None)
+        return parsed.path, params
+
+    def _respond(self, status, payload, weight=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if weight is not None:
+            self.send_header('X-MBX-USED-WEIGHT-1M', str(weight))
+        if status in (418, 429):
+            retry = max(1, int(self.fake.banned_until - time.time()))
+            self.send_header('Retry-After', str(retry))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        fake = self.fake
+        path, params = self._params()
+        opts = fake.options
+        delay = opts['latency_ms'] + (random.uniform(0, opts['jitter_ms']) if opts['jitter_ms'] else 0)
+        if opts['slow_ratio'] and random.random() < opts['slow_ratio']:
+            delay += opts['slow_ms']
+        if delay:
+            time.sleep(delay / 1000.0)
+        weight = None
+        try:
+            if not path.startswith('/_fake/'):
+                weight = fake.charge(path, params)
+                injected = fake.injected_failure(path)
+                if injected is not None:
+                    raise injected
+            result = fake.handle(method, path, params, self.headers.get('X-MBX-APIKEY'))
+            self._respond(200, result, weight)
+        except FakeBinanceError as e:
+            self._respond(e.status, {'code': e.code, 'msg': e.msg}, weight if weight is not None else fake.weight_used)
+        except Exception as e:
+            self._respond(500, {'code': -1000, 'msg': f"Fake server error: {e}"}, weight)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def log_message(self, fmt, *args):
+        pass  # keep benchmark output clean
+
+
+def make_server(host='127.0.0.1', port=0, **options):
+    """Build (server, fake) without starting it; port=0 picks a free port."""
+    fake = FakeBinance(**options)
+    handler = type('FakeBinanceHandler', (_Handler,), {'fake': fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, fake
+
+
+def start_server(host='127.0.0.1', port=0, **options):
+    """Start in a background thread. Returns (server, fake, base_url)."""
+    server, fake = make_server(host, port, **options)
+    threading.Thread(target=server.serve_forever, name='fake-binance', daemon=True).start()
+    return server, fake, f"http://{host}:{server.server_address[1]}"
+
+
+def _stream_handler(fake, interval):
+    def handler(ws):
+        query = urllib.parse.urlparse(ws.request.path).query
+        streams = set(filter(None, urllib.parse.parse_qs(query).get('streams', [''])[0].split('/')))
+        next_push = 0
+        while True:
+            now = time.time()
+            if now >= next_push:
+                next_push = now + interval
+                event_ms = int(now * 1000)
+                if any(s.startswith('!markPrice@arr') for s in streams):
+                    rows = [{'e': 'markPriceUpdate', 'E': event_ms, 's': sym, 'p': str(fake.market.price(sym)),
+                             'i': str(fake.market.price(sym)), 'r': '0.00010000'} for sym in fake.market.specs]
+                    ws.send(json.dumps({'stream': '!markPrice@arr@1s', 'data': rows}))
+                for name in sorted(streams):
+                    sym = name.split('@')[0].upper()
+                    if name.endswith('@bookTicker') and sym in fake.market.specs:
+                        price, tick = fake.market.price(sym), fake.market.specs[sym][1]
+                        ws.send(json.dumps({'stream': name, 'data': {
+                            'e': 'bookTicker', 'E': event_ms, 's': sym,
+                            'b': str(round(price - tick, 8)), 'B': '10', 'a': str(round(price + tick, 8)), 'A': '10'}}))
+            try:
+                msg = json.loads(ws.recv(timeout=max(0.01, next_push - time.time())))
+            except TimeoutError:
+                continue
+            except ConnectionClosed:
+                return
+            if msg.get('method') == 'SUBSCRIBE':
+                streams.update(msg.get('params') or [])
+            elif msg.get('method') == 'UNSUBSCRIBE':
+                streams.difference_update(msg.get('params') or [])
+            ws.send(json.dumps({'result': None, 'id': msg.get('id')}))
+    return handler
+
+
+def start_stream_server(fake, host='127.0.0.1', port=0, interval=1.0):
+    """Market stream stand-in for fake's prices, in a background thread. Returns (server, ws_url)."""
+    if ws_serve is None:
+        raise RuntimeError("the stream stand-in needs the 'websockets' package")
+    server = ws_serve(_stream_handler(fake, interval), host, port)
+    threading.Thread(target=server.serve_forever, name='fake-binance-stream', daemon=True).start()
+    return server, f"ws://{host}:{server.socket.getsockname()[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local fake Binance Futures REST server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--slow-ratio', type=float, default=0, help='fraction of responses delayed by --slow-ms')
+    parser.add_argument('--slow-ms', type=float, default=0)
+    parser.add_argument('--weight-limit', type=int, default=2400)
+    parser.add_argument('--ban-seconds', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tick-seconds', type=float, default=1.0)
+    parser.add_argument('--no-algo-required', action='store_true',
+                        help='accept STOP/TAKE_PROFIT types on /order instead of answering -4120')
+    parser.add_argument('--valid-key', action='append', dest='valid_keys',
+                        help='only accept these API keys (others get -2015); repeatable')
+    parser.add_argument('--stream-port', type=int, default=None,
+                        help='also serve the mark-price/bookTicker WebSocket stand-in on this port')
+    args = parser.parse_args()
+    server, fake = make_server(
+        args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        slow_ratio=args.slow_ratio, slow_ms=args.slow_ms,
+        weight_limit=args.weight_limit, ban_seconds=args.ban_seconds, seed=args.seed,
+        tick_seconds=args.tick_seconds, algo_required=not args.no_algo_required, valid_keys=args.valid_keys,
+    )
+    print(f"🧪 Fake Binance listening on http://{args.host}:{server.server_address[1]}")
+    if args.stream_port is not None:
+        _, ws_url = start_stream_server(fake, args.host, args.stream_port)
+        print(f"🧪 Fake Binance streams on {ws_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -10,13 +10,27 @@ import os
 bind = "127.0.0.1:8000"  # Nginx proxies to this port
 backlog = 2048
 
-# Worker processes (CPU-based)
-workers = max((multiprocessing.cpu_count() * 2 + 1), 3)
-worker_class = "sync"
-worker_connections = 1000
-
-# Timeouts for Binance API calls
-timeout = 120
+# Worker model. Requests spend nearly all their time waiting on Binance (up to
+# 20s per call through the proxy), so a sync worker - one request at a time -
+# was taken out by a handful of slow calls and nginx answered 502 for everything
+# behind it (TODO-GC-502.md). gthread runs GUNICORN_THREADS requests per worker;
+# gevent (pip install gevent) is the cooperative alternative for many more open
+# connections. "sync" still works as a fallback.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))   # gthread only
+worker_connections = 1000                            # gevent only
+
+# Worker processes. Threads carry the concurrency, so fewer processes are needed
+# (and each one keeps its own caches and market-data stream).
+if worker_class == "sync":
+    workers = max((multiprocessing.cpu_count() * 2 + 1), 3)
+else:
+    workers = int(os.getenv("GUNICORN_WORKERS", max(multiprocessing.cpu_count(), 2)))
+
+# Timeouts for Binance API calls. A sync worker is silent for the whole request,
+# so it needs room for several slow calls in a row; threaded/async workers keep
+# heartbeating while requests wait, so this only catches a genuinely stuck worker.
+timeout = 120 if worker_class == "sync" else 30
 keepalive = 2
 
 # Restart workers after N requests to prevent memory leaks
@@ -36,8 +50,9 @@ proc_name = "mindriskcontrol"
 user = "www-data"
 group = "www-data"
 
-# Preload app (DB connections)
-preload_app = True
+# Preload app (DB connections). Not with gevent: its monkey-patching runs in the
+# worker after the fork, too late for locks and sockets created at import time.
+preload_app = worker_class != "gevent"
 
 # Graceful restart
 graceful_timeout = 60
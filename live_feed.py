@@ -0,0 +1,233 @@
+"""
+Dashboard push channel: one Server-Sent Events stream per open dashboard
+instead of a request per widget every few seconds.
+
+Every section is built from the same server-side snapshot caches as the
+polling endpoint it stands in for, and carries that endpoint's JSON, so the
+page renders pushed data with the code it already has for polled data:
+
+    positions        /get_open_positions
+    liquidation      /api/liquidation_prices
+    tp_sl            /api/tp1_and_sl_orders
+    trade_positions  /get_user_trade_positions
+    history          /get_trade_history
+    stats            /api/today_stats
+    logs             /api/trade_logs
+    price            /get_live_price/<symbol>
+
+A section is rebuilt on its own cadence (SECTIONS) and only sent when its JSON
+changed; the sections due on a tick are built side by side through
+exchange_gateway.gather(). A stream ends after LIVE_PUSH_MAX_SECONDS and the
+browser's EventSource reconnects by itself, so gunicorn restarts are never
+held up.
+A worker serves at most LIVE_PUSH_MAX_STREAMS at once (claim_slot()), so
+streams can't take every thread of a gthread worker.
+
+Where push isn't served, snapshot() answers /api/dashboard_snapshot: every
+section in one response, minus those unchanged since the caller's version.
+It keeps the same cadences: a section is only rebuilt once its SECTIONS
+interval has passed, otherwise its last build (per worker, user and symbol)
+is reused.
+"""
+import hashlib
+import json
+import threading
+import time
+
+import cache
+import config
+import exchange_gateway
+import logic
+from models import db
+
+TICK_SECONDS = 1
+KEEPALIVE_SECONDS = 15          # comment line so nginx/the browser notice dead connections
+DUE_SLACK_SECONDS = 0.5         # a 2s poll landing a little early still rebuilds a 2s section
+
+# "user:symbol" -> {section: (digest, payload, built_at)}, the last snapshot() builds
+_snapshot_memo = cache.namespace('dashboard_snapshot', ttl=60, max_entries=1000)
+
+_stream_slots = threading.BoundedSemaphore(config.LIVE_PUSH_MAX_STREAMS)
+
+
+def liquidation_prices(user_id):
+    """{symbol: live liquidation/mark/PnL fields} from the shared position snapshot."""
+    liquidation_data = {}
+    for pos in logic.get_open_positions_live(user_id):
+        liquidation_data[pos['symbol']] = {
+            'liquidation_price': pos['liquidation_price'],
+            'mark_price': pos['mark_price'],
+            'entry_price': pos['entry_price'],
+            'leverage': pos['leverage'],
+            'unrealized_pnl': pos['unrealized_pnl'],
+            'roi_percent': pos['roi_percent'],
+            'margin_ratio': pos.get('margin_ratio', 0),
+            'timestamp': pos['timestamp']
+        }
+    return liquidation_data
+
+
+def history_log_events(user_id):
+    """Last 10 trades shaped as live-log events (the log's fallback when nothing was logged yet)."""
+    trades = logic.get_trade_history(user_id)
+    return [
+        {
+            "type": "TRADE_CLOSE" if trade.get("realized_pnl") else "TRADE_OPEN",
+            "symbol": trade.get("symbol", ""),
+            "timestamp": str(trade.get("time", "")),
+            "message": f"{trade.get('side')} {trade.get('symbol')} @ {trade.get('price')}",
+            "pnl": float(trade.get("realized_pnl", 0))
+        }
+        for trade in (trades or [])[:10]
+    ]
+
+
+def _positions(user_id, symbol):
+    return {"positions": logic.get_open_positions(user_id)}
+
+
+def _liquidation(user_id, symbol):
+    return {"success": True, "liquidation_prices": liquidation_prices(user_id)}
+
+
+def _tp_sl(user_id, symbol):
+    from conditional_orders_enhancement import get_tp1_and_sl_orders
+    return get_tp1_and_sl_orders(user_id)
+
+
+def _trade_positions(user_id, symbol):
+    return {"positions": logic.get_user_trade_positions_with_tp_sl(user_id)}
+
+
+def _history(user_id, symbol):
+    return {"trades": logic.get_trade_history(user_id)}
+
+
+def _stats(user_id, symbol):
+    return logic.get_today_stats(user_id)
+
+
+def _logs(user_id, symbol):
+    # DB log (+ this session's events) - queued trades log to the DB only
+    return {"events": logic.get_trade_events(user_id) or history_log_events(user_id)}
+
+
+def _price(user_id, symbol):
+    return {"symbol": symbol, "price": logic.get_live_price(symbol, user_id)}
+
+
+# name -> (builder, rebuild every N seconds); cadences match the pollers they replace
+SECTIONS = {
+    'price': (_price, 1),
+    'liquidation': (_liquidation, 2),
+    'logs': (_logs, 2),
+    'positions': (_positions, 5),
+    'tp_sl': (_tp_sl, 5),
+    'trade_positions': (_trade_positions, 5),
+    'stats': (_stats, 10),
+    'history': (_history, 10),
+}
+
+
+def _build(names, user_id, symbol):
+    """{name: payload, or the exception its builder raised}; the sections are built side by side."""
+    return exchange_gateway.gather(
+        {name: (lambda build=SECTIONS[name][0]: build(user_id, symbol)) for name in names},
+        return_exceptions=True,
+    )
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:10]
+
+
+def snapshot(user_id, symbol, since=None):
+    """
+    {'version': ..., 'sections': {name: payload}} with only the sections that
+    changed since `since` (the version of a previous snapshot). The version is
+    one content digest per section, in SECTIONS order, joined by dots.
+    """
+    previous = (since or '').split('.')
+    if len(previous) != len(SECTIONS):
+        previous = [None] * len(SECTIONS)
+    memo_key = f"{user_id}:{symbol}"
+    memo = dict(_snapshot_memo.get(memo_key) or {})
+    now = time.time()
+    due = [name for name in SECTIONS
+           if name not in memo or now - memo[name][2] >= SECTIONS[name][1] - DUE_SLACK_SECONDS]
+    for name, payload in _build(due, user_id, symbol).items():
+        if isinstance(payload, Exception):
+            print(f"⚠️ [SNAPSHOT] {name} for user {user_id} failed: {payload}")
+            memo.pop(name, None)    # digest '': resent as soon as it builds again
+            continue
+        memo[name] = (_digest(json.dumps(payload, default=str, sort_keys=True)), payload, now)
+    _snapshot_memo.set(memo_key, memo)
+
+    sections, digests = {}, []
+    for name, seen in zip(SECTIONS, previous):
+        digest, payload, _ = memo.get(name) or ('', None, 0)
+        digests.append(digest)
+        if digest and digest != seen:
+            sections[name] = payload
+    return {'version': '.'.join(digests), 'sections': sections}
+
+
+def available(environ):
+    """
+    Whether this server can hold a stream open. 'auto' needs a threaded/async
+    worker (gthread, gevent, dev server): on a sync worker each open tab would
+    pin a whole worker, so the page is told to keep polling instead.
+    """
+    mode = config.LIVE_PUSH
+    if mode in ('0', 'false', 'no', 'off'):
+        return False
+    if mode in ('1', 'true', 'yes', 'on'):
+        return True
+    return bool(environ.get('wsgi.multithread'))
+
+
+def claim_slot():
+    """Take one of this worker's stream slots; False when all are in use. Pair with release_slot()."""
+    return _stream_slots.acquire(blocking=False)
+
+
+def release_slot():
+    _stream_slots.release()
+
+
+def _event(name, text):
+    return f"event: {name}\ndata: {text}\n\n"
+
+
+def stream(user_id, symbol, max_seconds=None):
+    """SSE body: 'hello', then each section whenever it changes, until max_seconds."""
+    max_seconds = max_seconds or config.LIVE_PUSH_MAX_SECONDS
+    started = last_write = time.time()
+    sent = {}       # section -> JSON last sent
+    due = {}        # section -> next rebuild time
+    yield "retry: 2000\n\n"
+    yield _event('hello', json.dumps({"symbol": symbol, "sections": list(SECTIONS), "max_seconds": max_seconds}))
+    try:
+        while time.time() - started < max_seconds:
+            now = time.time()
+            names = [name for name in SECTIONS if now >= due.get(name, 0)]
+            for name in names:
+                due[name] = now + SECTIONS[name][1]
+            for name, payload in _build(names, user_id, symbol).items():
+                if isinstance(payload, Exception):
+                    print(f"⚠️ [LIVE PUSH] {name} for user {user_id} failed: {payload}")
+                    continue
+                text = json.dumps(payload, default=str, sort_keys=True)
+                if sent.get(name) != text:
+                    sent[name] = text
+                    last_write = now
+                    yield _event(name, text)
+            # Give the DB connection back between ticks, and don't read stale rows
+            # from this request's identity map on the next one
+            db.session.remove()
+            if time.time() - last_write >= KEEPALIVE_SECONDS:
+                last_write = time.time()
+                yield ": keepalive\n\n"
+            time.sleep(TICK_SECONDS)
+    finally:
+        db.session.remove()
@@ -1,43 +1,225 @@
-from flask import session
+from flask import session, has_request_context
 from datetime import datetime
 from binance.client import Client
 from binance.exceptions import BinanceAPIException
 import config
 import math
 import traceback
+from bisect import bisect_right
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from models import db, TradeDailyStats, TradeLog
+import shared_cache
+import cache
+import market_data
+import exchange_gateway
+from exchange_governor import (GovernedClient, RequestShed, governed_get, governor,
+                               request_priority, with_priority, PRIORITY_TRADE)
 
 # Global variables - Default client (for demo/fallback)
 _default_client = None
+_default_client_lock = threading.Lock()
 _symbol_cache = None
 _symbol_cache_time = 0
-_price_cache = {}
-_price_cache_time = {}
-_positions_cache = {}
-_positions_cache_time = {}
-_trade_history_cache = {}
-_trade_history_cache_time = {}
-_leverage_cache = {}
-_leverage_cache_time = {}
+# Compiled exchangeInfo index shared by every rounding/validation helper
+_symbol_index = {}
+_symbol_index_time = 0
+_symbol_index_retry_at = 0
+SYMBOL_INDEX_RETRY_SECONDS = 30
+POSITIONS_MAX_AGE = config.POSITION_UPDATE_INTERVAL   # /get_open_positions, coin details
+LIVE_POSITIONS_MAX_AGE = 1.5     # /api/liquidation_prices, symbol select (polled every 2s)
+TRADE_HISTORY_TTL = 10
+LEVERAGE_BRACKETS_TTL = 3600     # brackets change a few times a year; one unfiltered call per hour
+LEVERAGE_BRACKETS_RETRY_SECONDS = 60
+SYMBOL_CONFIG_TTL = 600          # remembered per-account symbol setup (leverage, margin type)
+ORDER_VARIANT_TTL = 6 * 3600     # how long a learned good/rejected SL/TP order shape is trusted
+# Rejections that say "this parameter shape doesn't work for this account/symbol" (algo-only,
+# missing/unexpected params, order type, position side) - not price, margin or rate-limit errors
+ORDER_SHAPE_ERROR_CODES = {-4120, -1102, -1104, -1106, -1116, -4061, -4136}
+# Bounded TTL+LRU caches (cache.py). Two kinds of data, never mixed:
+#   public market data (price; symbol index, leverage brackets, market_data tables) - keyed
+#     by symbol alone, fetched once for everybody whichever user's client did it
+#   account-private data (USER_TRADING_CACHES, selected_trades) - keyed by _user_key(user_id)
+_price_cache = cache.namespace('price', ttl=config.PRICE_CACHE_DURATION, max_entries=2000, shared=True)
+_positions_cache = cache.namespace('positions', ttl=POSITIONS_MAX_AGE, max_entries=500, shared=True)
+_positions_fetch_locks = {}      # {cache_key: Lock} — one in-flight positions fetch per user
+_trade_history_cache = cache.namespace('trade_history', ttl=TRADE_HISTORY_TTL, max_entries=200)
+# Compiled leverageBracket index: {symbol: [tier rows sorted by notional floor]} + floors for bisect
+_leverage_brackets = {}
+_leverage_bracket_floors = {}
+_leverage_brackets_time = 0
+_leverage_brackets_retry_at = 0
+# Which SL/TP parameter shape works per account+symbol+role: {'good': shape, 'bad': {shape: {...}}}
+_order_variant_cache = cache.namespace('order_variants', ttl=ORDER_VARIANT_TTL, max_entries=5000, shared=True)
+# Per-account symbol setup we set or saw on the exchange:
+# {user_key: {symbol: {'leverage': 20, 'margin_type': 'ISOLATED'|'CROSSED', '_set_at': {field: when we set it}}}}
+# local_ttl=0: every check reads the shared store, so a change made by another worker is seen at once
+_symbol_config_cache = cache.namespace('symbol_config', ttl=SYMBOL_CONFIG_TTL, max_entries=2000, shared=True,
+                                       local_ttl=0)
+_symbol_config_locks = {}    # user_key -> Lock around this worker's read-modify-write of the dict above
 _last_call_time = 0
 CACHE_DURATION = 5
 _virtual_guard_last_run = {}
+_virtual_guard_running = set()    # users whose guard is mid-run on some thread of this worker
+_virtual_guard_lock = threading.Lock()
 
-# TTL cache + ban-aware short-circuit for conditional-orders endpoint.
+# TTL cache for the conditional-orders endpoint (IP-ban tracking lives in exchange_governor).
 # Prevents the duplicate UI pollers from hammering Binance and triggering -1003 IP bans.
-_conditional_cache = {}          # {user_id: (ts_ms, [orders])}
-_conditional_ban_until = 0       # ms epoch; while now < this, skip the call
+# Concurrent misses are coalesced into one call by exchange_governor's single-flight.
 CONDITIONAL_CACHE_MS = 3000
+_conditional_cache = cache.namespace('conditional', ttl=CONDITIONAL_CACHE_MS / 1000, max_entries=500, shared=True)
+# Users whose last regular open-orders list was empty (maybe Portfolio Margin): ask papi alongside it
+_pm_orders_likely = {}
+# {user_key: [symbol, ...]} with open positions last time: their open orders are fetched alongside positionRisk
+_open_position_symbols = {}
+
+# Regular + algo open orders for the whole account, as exchange_gateway.fetch_many() calls
+_OPEN_ORDERS_CALLS = [
+    ('fapi', '/fapi/v1/openOrders', {'recvWindow': 10000}),
+    ('fapi', '/fapi/v1/algoOrder/openOrders', {'recvWindow': 10000}),
+]
+# Without a symbol each of those costs 40 weight, with one 1: per-symbol pairs are cheaper up to here
+OPEN_ORDERS_PER_SYMBOL_MAX = 20
+
+# Everything that goes stale when a user's orders or positions change
+USER_TRADING_CACHES = ('positions', 'trade_history', 'conditional', 'account')
+
+def _user_key(user_id):
+    return f"{user_id or 'public'}"
+
+def invalidate_user_caches(user_id, *names):
+    """Named invalidation: drop the user's entries from names (default: every trading cache)."""
+    cache.invalidate(_user_key(user_id), *(names or USER_TRADING_CACHES))
+
+def user_cache_version(user_id, *names):
+    """
+    Version of the user's cached snapshots in names (their store times). Changes
+    whenever one is refreshed or invalidated - ETags key off it (app.py).
+    """
+    return cache.stored_at(_user_key(user_id), *names)
+
+def trade_positions_version(user_id):
+    """(row count, newest updated_at) of the user's TradePosition rows - one aggregate query."""
+    from models import TradePosition
+    count, newest = db.session.query(db.func.count(TradePosition.id), db.func.max(TradePosition.updated_at)) \
+        .filter(TradePosition.user_id == user_id).one()
+    return (count, newest.isoformat() if newest else None)
+
+def _account_symbol_configs(user_id):
+    return _symbol_config_cache.get(_user_key(user_id)) or {}
+
+def known_symbol_config(user_id, symbol):
+    """What we last knew of this account's setup for symbol ({} if nothing recent)."""
+    return _account_symbol_configs(user_id).get(symbol) or {}
+
+def _symbol_config_lock(user_id):
+    return _symbol_config_locks.setdefault(_user_key(user_id), threading.Lock())
+
+def remember_symbol_config(user_id, symbol, **fields):
+    """Record setup fields (e.g. leverage=20) after a successful change, stamped with when."""
+    with _symbol_config_lock(user_id):
+        configs = dict(_account_symbol_configs(user_id))
+        current = configs.get(symbol) or {}
+        now = time.time()
+        configs[symbol] = dict(current, **fields, _set_at=dict(current.get('_set_at') or {}, **{k: now for k in fields}))
+        _symbol_config_cache.set(_user_key(user_id), configs)
+
+def forget_symbol_config(user_id, symbol):
+    """Drop what we knew of symbol; fetches that began before now can't teach it back."""
+    with _symbol_config_lock(user_id):
+        configs = dict(_account_symbol_configs(user_id))
+        current = configs.get(symbol)
+        if current is None:
+            return
+        now = time.time()
+        configs[symbol] = {'_set_at': {k: now for k in current if k != '_set_at'}}
+        _symbol_config_cache.set(_user_key(user_id), configs)
+
+def _row_symbol_config(row):
+    """Leverage / margin type from a positionRisk or futures_account['positions'] row."""
+    fields = {}
+    try:
+        if row.get('leverage') not in (None, ''):
+            fields['leverage'] = int(float(row['leverage']))
+    except (TypeError, ValueError):
+        pass
+    if row.get('marginType'):
+        fields['margin_type'] = 'ISOLATED' if str(row['marginType']).lower() == 'isolated' else 'CROSSED'
+    elif 'isolated' in row:
+        fields['margin_type'] = 'ISOLATED' if row['isolated'] in (True, 'true') else 'CROSSED'
+    return fields
+
+def learn_symbol_config(user_id, rows, fetched_at):
+    """
+    Merge what position/account payloads say about each symbol's setup; writes only on change.
+    fetched_at is when that fetch began: fields we set or forgot after it are newer and win.
+    """
+    with _symbol_config_lock(user_id):
+        merged, changed = dict(_account_symbol_configs(user_id)), False
+        for row in rows or []:
+            symbol, fields = row.get('symbol'), _row_symbol_config(row)
+            if not symbol or not fields:
+                continue
+            current = merged.get(symbol) or {}
+            set_at = current.get('_set_at') or {}
+            fields = {k: v for k, v in fields.items() if set_at.get(k, 0) < fetched_at}
+            if any(current.get(k) != v for k, v in fields.items()):
+                merged[symbol] = dict(current, **fields)
+                changed = True
+        if changed:
+            _symbol_config_cache.set(_user_key(user_id), merged)
+
+def order_variant_shape(kind, params):
+    """Stable name for an order variant: endpoint kind, order type and which params it sends."""
+    return f"{kind}:{params.get('type')}:" + ",".join(sorted(k for k in params if k not in ('symbol', 'type')))
+
+def _order_variant_key(user_id, symbol, role):
+    return f"{_user_key(user_id)}:{symbol}:{role}"
+
+def learned_order_variants(user_id, symbol, role):
+    return _order_variant_cache.get(_order_variant_key(user_id, symbol, role)) or {'good': None, 'bad': {}}
+
+def plan_order_variants(user_id, symbol, role, kind, variants):
+    """
+    Order the variants for one endpoint: last known-good shape first, then untried ones.
+    Shapes rejected within ORDER_VARIANT_TTL are left out and returned as (shape, error) pairs.
+    """
+    memory = learned_order_variants(user_id, symbol, role)
+    now = time.time()
+    bad = {shape: b for shape, b in (memory.get('bad') or {}).items() if now - b.get('at', 0) < ORDER_VARIANT_TTL}
+    tagged = [(params, order_variant_shape(kind, params)) for params in variants]
+    good = [t for t in tagged if t[1] == memory.get('good')]
+    rest = [t for t in tagged if t[1] != memory.get('good') and t[1] not in bad]
+    skipped = [(shape, bad[shape]['error']) for _, shape in tagged if shape in bad and shape != memory.get('good')]
+    return good + rest, skipped
+
+def record_order_variant(user_id, symbol, role, shape, error=None):
+    """Learn from one placement: success (error=None) or a shape rejection. Writes only on change."""
+    memory = learned_order_variants(user_id, symbol, role)
+    if error is None:
+        if memory.get('good') == shape and shape not in (memory.get('bad') or {}):
+            return
+        bad = {k: v for k, v in (memory.get('bad') or {}).items() if k != shape}
+        memory = {'good': shape, 'bad': bad}
+    else:
+        if getattr(error, 'code', None) not in ORDER_SHAPE_ERROR_CODES:
+            return
+        bad = dict(memory.get('bad') or {})
+        bad[shape] = {'error': str(error)[:200], 'at': time.time()}
+        memory = {'good': None if memory.get('good') == shape else memory.get('good'), 'bad': bad}
+    _order_variant_cache.set(_order_variant_key(user_id, symbol, role), memory)
 
 def invalidate_conditional_cache(user_id):
     """Call this after placing any TP/SL order to force fresh fetch on next poll."""
-    global _conditional_cache
-    if user_id in _conditional_cache:
-        del _conditional_cache[user_id]
+    invalidate_user_caches(user_id, 'conditional')
     print(f"[CACHE] Conditional cache invalidated for user {user_id}")
 
+def invalidate_positions_snapshot(user_id):
+    """Drop the positions snapshot in this worker and the shared cache."""
+    invalidate_user_caches(user_id, 'positions')
+
 def _fetch_papi(client, path, params=None):
     """
     Make a signed request to the Binance Portfolio Margin (papi) base URL.
@@ -47,9 +229,8 @@ def _fetch_papi(client, path, params=None):
     import hmac
     import hashlib
     import urllib.parse
-    import requests as _requests
     
-    base_url = 'https://papi.binance.com'
+    base_url = config.BINANCE_PAPI_URL
     params = params or {}
     params['timestamp'] = int(time.time() * 1000)
     if hasattr(client, 'timestamp_offset') and client.timestamp_offset:
@@ -71,37 +252,13 @@ def _fetch_papi(client, path, params=None):
     if hasattr(config, 'PROXY_URL') and config.PROXY_URL:
         proxies = {'https': config.PROXY_URL, 'http': config.PROXY_URL}
     
-    resp = _requests.get(url, headers=headers, proxies=proxies, timeout=15)
+    resp = governed_get(url, headers=headers, proxies=proxies, timeout=15)
     resp.raise_for_status()
     return resp.json()
 
-# Known leverage limits for common coins (updated based on Binance data)
-# These serve as fallback when API fails
-KNOWN_LEVERAGE_MAP = {
-    # Tier 1 - Most coins: 125x
-    'BTCUSDT': 125, 'ETHUSDT': 75, 'BNBUSDT': 75, 'SOLUSDT': 75,
-    'XRPUSDT': 75, 'ADAUSDT': 75, 'LINKUSDT': 75, 'LTCUSDT': 75,
-    'DOGEUSDT': 50, 'MATICUSDT': 75, 'AVAXUSDT': 75, 'DOTUSDT': 75,
-    'UNIUSDT': 75, 'APTUSDT': 75, 'FILUSDT': 75, 'TAOUSDT': 75,
-    
-    # Tier 2 - Medium leverage: 50x or less
-    'BIOUSDT': 50,   # BIO can be 50x
-    'MEMUSDT': 50, 'PEPEUSDT': 50, 'DYDXUSDT': 50,
-    'OPSUSDT': 50, 'ARBUSDT': 50, 'SUIUSDT': 50,
-    
-    # Tier 3 - Low leverage coins: 20-25x
-    'BANKUSDT': 20,  # Bank max 20x
-    'SOLSOL': 20,    # Solana perp max 20x
-    'MEMEUSDT': 25,
-    
-    # Defaults if needed
-    'DEFAULT': 125,
-}
-
 # logic.py — symbol selector (uses real existing functions, invalidates caches)
-_trades_cache = {}
-_trades_cache_time = {}
-_analysis_cache = {}
+_trades_cache = cache.namespace('selected_trades', ttl=TRADE_HISTORY_TTL, max_entries=200)
+_analysis_cache = cache.namespace('analysis', ttl=60, max_entries=200)
 
 def select_symbol(user_id, symbol):
     """
@@ -110,15 +267,11 @@ def select_symbol(user_id, symbol):
     positions, recent trades, and coin analysis so the frontend
     receives everything in ONE response (no second-click delay).
     """
-    # 1. Invalidate the REAL position cache used by get_open_positions()
-    cache_key_pos = f"positions_{user_id or 'public'}"
-    _positions_cache.pop(cache_key_pos, None)
-    _positions_cache_time.pop(cache_key_pos, None)
-    # Invalidate trade-history + analysis caches for this user/symbol
-    cache_key_hist = f"trade_history_{user_id or 'public'}"
-    _trade_history_cache.pop(cache_key_hist, None)
-    _trade_history_cache_time.pop(cache_key_hist, None)
-    _analysis_cache.pop(symbol, None)
+    # 1. Invalidate trade-history + analysis caches for this user/symbol.
+    # Positions aren't symbol-specific: the shared snapshot is reused if it
+    # is live-fresh, so a symbol switch doesn't force an extra exchange call.
+    invalidate_user_caches(user_id, 'trade_history')
+    _analysis_cache.delete(symbol)
     # 2. Remember the user's currently selected symbol (best-effort)
     try:
         session['selected_symbol'] = symbol
@@ -126,7 +279,7 @@ def select_symbol(user_id, symbol):
         pass  # session may not be available outside a request context
     # 3. Fetch everything fresh, synchronously
     try:
-        positions = get_open_positions(user_id) or []
+        positions = get_open_positions(user_id, max_age=LIVE_POSITIONS_MAX_AGE) or []
     except Exception as e:
         print(f"[select_symbol] positions error: {e}")
         positions = []
@@ -140,9 +293,8 @@ def select_symbol(user_id, symbol):
     # populates that box. If you have a real analysis function, plug it in.
     analysis = {}
     # 4. Re-populate caches with the fresh data
-    _trades_cache[user_id] = {"symbol": symbol, "data": trades}
-    _trades_cache_time[user_id] = time.time()
-    _analysis_cache[symbol] = analysis
+    _trades_cache.set(_user_key(user_id), {"symbol": symbol, "data": trades})
+    _analysis_cache.set(symbol, analysis)
     return {
         "symbol": symbol,
         "positions": positions,
@@ -152,8 +304,11 @@ def select_symbol(user_id, symbol):
 
 # User-specific client storage: {user_id: (client, last_verified_ts)}
 _user_clients = {}
+# One client build / re-verify per user at a time: {user_id: Lock}
+_user_client_locks = {}
 # Last connection error per user, so UI endpoints can show the REAL reason
 _last_client_error = {}
+_last_client_error_at = {}
 # How long to trust a cached client before re-verifying with Binance.
 # The old code called futures_account() (weight 5) on EVERY request from every
 # poller, which is what triggered -1003 IP bans and killed the connection.
@@ -161,6 +316,12 @@ CLIENT_REVERIFY_SECONDS = 120
 
 _public_ip_cache = {'ip': None, 'ts': 0}
 
+# Per-user futures_account snapshot: {cache_key: snapshot}. Balance, wallet,
+# sizing and client re-verification all read this instead of each calling
+# futures_account (weight 5). Invalidated explicitly after trades.
+ACCOUNT_SNAPSHOT_TTL = 5
+_account_cache = cache.namespace('account', ttl=ACCOUNT_SNAPSHOT_TTL, max_entries=500, shared=True)
+
 def get_last_client_error(user_id):
     """Return the most recent connection error message for a user (or None)."""
     return _last_client_error.get(user_id)
@@ -232,19 +393,50 @@ def get_user_exchange_client(user_id, include_disconnected=False):
     'Disconnected' flag can never permanently block a working key. Whenever
     verification succeeds, is_connected/last_verified are updated so the UI
     shows Connected again.
+
+    Thread-safe: a dashboard opens with several concurrent requests, and on a
+    threaded worker each would otherwise build (time sync + futures_account)
+    its own client. They queue on a per-user lock and take the one built.
     """
+    cached = _user_clients.get(user_id)
+    if not include_disconnected and cached and (time.time() - cached[1]) < CLIENT_REVERIFY_SECONDS:
+        return cached[0]
+    waited_from = time.time()
+    with _user_client_locks.setdefault(user_id, threading.Lock()):
+        if _last_client_error.get(user_id) and _last_client_error_at.get(user_id, 0) >= waited_from:
+            # The build we queued behind just failed; don't repeat its (up to 20s) timeout
+            return {"error": _last_client_error[user_id]}
+        return _load_user_exchange_client(user_id, include_disconnected)
+
+def _record_client_error(user_id, error_msg):
+    _last_client_error[user_id] = error_msg
+    _last_client_error_at[user_id] = time.time()
+
+def _load_user_exchange_client(user_id, include_disconnected=False):
+    """get_user_exchange_client's body; runs under the user's client lock."""
     from models import ExchangeConnection, db
     import config
     # Serve from cache; only re-verify after CLIENT_REVERIFY_SECONDS
     now = time.time()
-    if not include_disconnected and user_id in _user_clients:
-        client, verified_at = _user_clients[user_id]
+    cached = _user_clients.get(user_id)
+    if not include_disconnected and cached:
+        client, verified_at = cached
         if (now - verified_at) < CLIENT_REVERIFY_SECONDS:
             return client
+        # A successful account snapshot fetch already proves the keys work
+        entry = _account_cache.get_entry(_user_key(user_id))
+        snapshot_at = entry[1] if entry else 0
+        if (now - snapshot_at) < CLIENT_REVERIFY_SECONDS:
+            _user_clients[user_id] = (client, snapshot_at)
+            return client
         try:
-            client.futures_account(recvWindow=10000)
+            _store_account_snapshot(user_id, client.futures_account(recvWindow=10000), now)
             _user_clients[user_id] = (client, now)
             return client
+        except RequestShed as e:
+            # Weight budget exhausted — that says nothing about the keys, keep the client
+            print(f"[CLIENT] Re-verify for user {user_id} deferred: {e}")
+            return client
         except Exception as e:
             print(f"[CLIENT] Cached client invalid for user {user_id}: {e}, recreating...")
             _user_clients.pop(user_id, None)
@@ -275,19 +467,23 @@ def get_user_exchange_client(user_id, include_disconnected=False):
 
         # Stripped keys: trailing whitespace from copy-paste is the #1 cause
         # of -2014/-2015 errors
-        client = Client(
+        client = GovernedClient(
             api_key=connection.api_key.strip(),
             api_secret=connection.api_secret.strip(),
             requests_params=req_params
         )
 
+        client.governor_user_id = user_id
+
         # Apply timestamp offset (PERMANENT -1021 FIX)
         if abs(time_offset) > 100:
             client.timestamp_offset = time_offset
             print(f"✅ Applied user client offset: {time_offset}ms")
 
-        # Verify the keys actually work
-        client.futures_account(recvWindow=10000)
+        # Verify the keys actually work (the response seeds the account snapshot)
+        fetched_at = time.time()
+        acc = client.futures_account(recvWindow=10000)
+        _store_account_snapshot(user_id, acc, fetched_at)
 
         print(f"✅ User {user_id} Binance client created successfully")
         # Self-heal the DB status so the UI shows Connected
@@ -307,7 +503,7 @@ def get_user_exchange_client(user_id, include_disconnected=False):
     except BinanceAPIException as e:
         error_msg = describe_binance_error(e)
         print(f"❌ BinanceAPIException for user {user_id}: code={e.code}: {error_msg}")
-        _last_client_error[user_id] = error_msg
+        _record_client_error(user_id, error_msg)
 
         # Only mark as disconnected for permanent key errors — NOT for
         # transient ones (rate limits, timeouts), which self-heal above
@@ -336,7 +532,7 @@ def get_user_exchange_client(user_id, include_disconnected=False):
         else:
             error_msg = f"Could not reach Binance: {msg}"
         print(f"❌ Unexpected error creating client for user {user_id}: {e}")
-        _last_client_error[user_id] = error_msg
+        _record_client_error(user_id, error_msg)
         # Transient (network/timeout) — do not flip is_connected
         return {"error": error_msg}
 
@@ -348,14 +544,71 @@ def clear_user_client(user_id):
     """Clear cached client for a user (when they disconnect)"""
     _user_clients.pop(user_id, None)
     _last_client_error.pop(user_id, None)
+    _last_client_error_at.pop(user_id, None)
+    invalidate_account_snapshot(user_id)
+
+def _store_account_snapshot(user_id, acc, fetched_at):
+    """Parse a futures_account response (requested at fetched_at) into the shared per-user account snapshot."""
+    snapshot = {
+        'wallet_balance': float(acc.get('totalWalletBalance', 0.0)),
+        'unrealized_pnl': float(acc.get('totalUnrealizedProfit', 0.0)),
+        'initial_margin': float(acc.get('totalInitialMargin', 0.0)),
+        'maint_margin': float(acc.get('totalMaintMargin', 0.0)),
+        'available_balance': float(acc.get('availableBalance', 0.0)),
+        'assets': [{
+            'asset': a.get('asset'),
+            'balance': float(a.get('walletBalance', 0)),
+            'unrealized': float(a.get('unrealizedProfit', 0)),
+            'margin': float(a.get('initialMargin', 0)),
+            'available': float(a.get('availableBalance', 0))
+        } for a in acc.get('assets', [])],
+        # Raw exchange strings, as shown on the dashboard debug panel
+        'debug_info': {
+            'totalInitialMargin': acc.get('totalInitialMargin'),
+            'totalMaintMargin': acc.get('totalMaintMargin'),
+            'availableBalance': acc.get('availableBalance')
+        }
+    }
+    _account_cache.set(_user_key(user_id), snapshot)
+    # v2 account rows carry every symbol's leverage + isolated flag
+    learn_symbol_config(user_id, acc.get('positions'), fetched_at)
+    return snapshot
+
+def invalidate_account_snapshot(user_id):
+    """Call after anything that moves balance/margin (orders, closes) to force a fresh fetch."""
+    invalidate_user_caches(user_id, 'account')
+
+def get_account_snapshot(user_id=None, client=None, max_age=ACCOUNT_SNAPSHOT_TTL):
+    """
+    Per-user account snapshot (wallet balance, initial/maintenance margin,
+    available balance, per-asset rows), fetched at most once per max_age.
+    Returns (snapshot, error_msg).
+    """
+    cache_key = _user_key(user_id)
+    snapshot = _account_cache.get(cache_key, max_age)
+    if snapshot is not None:
+        return snapshot, None
+    try:
+        if client is None:
+            client = get_client(user_id)
+        if client is None:
+            return None, (get_last_client_error(user_id) if user_id else None) or "No Binance client"
+        # get_client may have just re-verified the keys, which refreshes the snapshot
+        snapshot = _account_cache.get(cache_key, max_age)
+        if snapshot is not None:
+            return snapshot, None
+        fetched_at = time.time()
+        return _store_account_snapshot(user_id, client.futures_account(recvWindow=10000), fetched_at), None
+    except Exception as e:
+        return None, str(e)
 
 def sync_time_with_binance():
     """Sync local time with Binance server time - ROBUST VERSION"""
     import config
     endpoints = [
-        'https://fapi.binance.com/fapi/v1/time',
-        'https://fapi.binance.com/fapi/v2/time', 
-        'https://api.binance.com/api/v3/time'
+        f"{config.BINANCE_FAPI_URL}/fapi/v1/time",
+        f"{config.BINANCE_FAPI_URL}/fapi/v2/time",
+        f"{config.BINANCE_API_URL}/api/v3/time"
     ]
     
     for endpoint in endpoints:
@@ -365,7 +618,7 @@ def sync_time_with_binance():
                 proxies = {'https': config.PROXY_URL, 'http': config.PROXY_URL}
             
             try:
-                response = requests.get(endpoint, timeout=5, proxies=proxies)
+                response = governed_get(endpoint, timeout=5, proxies=proxies)
                 response.raise_for_status()
             except requests.exceptions.HTTPError as he:
                 if he.response.status_code == 403:
@@ -406,38 +659,42 @@ def get_client(user_id=None):
             return None
 
     # Fallback to default client
-    if _default_client is None:
+    if _default_client is not None:
+        return _default_client
+    if not (config.BINANCE_KEY and config.BINANCE_SECRET and len(config.BINANCE_KEY) > 5):
+        return None
+    with _default_client_lock:
+        if _default_client is not None:
+            return _default_client
         try:
-            if config.BINANCE_KEY and config.BINANCE_SECRET and len(config.BINANCE_KEY) > 5:
-                time_offset = sync_time_with_binance()
-                
-                # CRITICAL FIX: Properly bundle parameters into requests_params
-                req_params = {'timeout': 20}
-                
-                if hasattr(config, 'PROXY_URL') and config.PROXY_URL:
-                    req_params['proxies'] = {
-                        'https': config.PROXY_URL, 
-                        'http': config.PROXY_URL
-                    }
-                
-                _default_client = Client(
-                    api_key=config.BINANCE_KEY, 
-                    api_secret=config.BINANCE_SECRET,
-                    requests_params=req_params
-                )
-                
-                if abs(time_offset) > 100:  
-                    _default_client.timestamp_offset = time_offset
-                
-                _default_client.futures_account(recvWindow=10000)
-                print("✅ Default Binance client initialized successfully")
-            else:
-                return None
+            time_offset = sync_time_with_binance()
+
+            # CRITICAL FIX: Properly bundle parameters into requests_params
+            req_params = {'timeout': 20}
+
+            if hasattr(config, 'PROXY_URL') and config.PROXY_URL:
+                req_params['proxies'] = {
+                    'https': config.PROXY_URL,
+                    'http': config.PROXY_URL
+                }
+
+            client = GovernedClient(
+                api_key=config.BINANCE_KEY,
+                api_secret=config.BINANCE_SECRET,
+                requests_params=req_params
+            )
+
+            if abs(time_offset) > 100:
+                client.timestamp_offset = time_offset
+
+            client.futures_account(recvWindow=10000)
+            # Only published once verified - other threads never see a half-built client
+            _default_client = client
+            print("✅ Default Binance client initialized successfully")
         except Exception as e:
             print(f"❌ Error initializing default Binance client: {e}")
-            _default_client = None
             return None
-    
+
     return _default_client
 
 def initialize_session():
@@ -448,94 +705,193 @@ def initialize_session():
         session["stats"] = {}
     session.modified = True
 
-def get_all_exchange_symbols(user_id=None):
-    """Fetches ALL USDT trading symbols from Binance Futures"""
-    global _symbol_cache, _symbol_cache_time
+def _fetch_exchange_info(user_id=None):
+    """Download the raw futures exchangeInfo payload (heavy: lists every contract)."""
+    client_res = get_client(user_id)
+    if not client_res or isinstance(client_res, dict):
+        # No client / connection errored — fetch symbols from the PUBLIC
+        # endpoint instead so the symbol list still populates
+        proxies = {}
+        if hasattr(config, 'PROXY_URL') and config.PROXY_URL:
+            proxies = {'https': config.PROXY_URL, 'http': config.PROXY_URL}
+        resp = governed_get(f"{config.BINANCE_FAPI_URL}/fapi/v1/exchangeInfo", timeout=10, proxies=proxies)
+        resp.raise_for_status()
+        return resp.json()
+    return client_res.futures_exchange_info()
+
+def _compile_symbol_entry(s):
+    """Flatten one exchangeInfo symbol row into the fields the rounding/validation helpers need."""
+    entry = {
+        'symbol': s.get('symbol'),
+        'status': s.get('status'),
+        'contract_type': s.get('contractType'),
+        'quote_asset': s.get('quoteAsset'),
+        'tick_size': 0.01,
+        'step_size': 0.001,
+        'min_qty': 0.001,
+        'min_notional': 5.0,
+        'filters': s.get('filters') or [],
+    }
+    for f in entry['filters']:
+        f_type = f.get('filterType')
+        if f_type == 'PRICE_FILTER':
+            entry['tick_size'] = float(f.get('tickSize', 0.01))
+        elif f_type == 'LOT_SIZE':
+            entry['step_size'] = float(f.get('stepSize', 0.001))
+            entry['min_qty'] = float(f.get('minQty', f.get('stepSize', 0.001)))
+        elif f_type in ['MIN_NOTIONAL', 'NOTIONAL']:
+            entry['min_notional'] = float(f.get('minNotional', f.get('notional', 5)))
+    # Same precision rule round_qty/round_price have always used
+    entry['price_precision'] = abs(int(round(-math.log10(entry['tick_size'])))) if entry['tick_size'] > 0 else 2
+    entry['qty_precision'] = abs(int(round(-math.log10(entry['step_size'])))) if entry['step_size'] > 0 else 3
+    return entry
+
+def _install_symbol_index(index, compiled_at):
+    """Swap in a compiled index and the tradeable USDT-perp list derived from it."""
+    global _symbol_index, _symbol_index_time, _symbol_cache, _symbol_cache_time
+    _symbol_index = index
+    _symbol_index_time = compiled_at
+    _symbol_cache = sorted([
+        e['symbol'] for e in index.values()
+        if e['status'] == 'TRADING'
+        and e['quote_asset'] == 'USDT'
+        and e['contract_type'] == 'PERPETUAL'
+        and len(e['symbol']) <= 20  # Binance symbols are reasonably short
+        and e['symbol'].endswith('USDT')  # Must end with USDT
+    ])
+    _symbol_cache_time = compiled_at
+
+def get_symbol_index(user_id=None, force_refresh=False):
+    """
+    Compiled exchangeInfo index: {symbol: {tick_size, step_size, min_qty, min_notional,
+    price_precision, qty_precision, status, ...}}.
+    Built from ONE exchangeInfo download and refreshed every SYMBOL_CACHE_DURATION,
+    so rounding/validation never re-downloads the full contract list.
+    """
+    global _symbol_index_retry_at
     now = time.time()
-    
+    if _symbol_index and not force_refresh and (now - _symbol_index_time) < config.SYMBOL_CACHE_DURATION:
+        return _symbol_index
+    if not force_refresh:
+        # Another worker may have compiled it already
+        hit = shared_cache.lookup("symbol_index", config.SYMBOL_CACHE_DURATION)
+        if hit and hit[0]:
+            _install_symbol_index(hit[0], hit[1])
+            return _symbol_index
+    # A failed refresh backs off instead of retrying on every rounding call
+    if now < _symbol_index_retry_at and not force_refresh:
+        return _symbol_index
     try:
-        # Serve cached symbols while fresh (avoids an exchangeInfo call per page load)
-        if _symbol_cache and (now - _symbol_cache_time) < config.SYMBOL_CACHE_DURATION:
-            return _symbol_cache
-
-        client_res = get_client(user_id)
-        if not client_res or isinstance(client_res, dict):
-            # No client / connection errored — fetch symbols from the PUBLIC
-            # endpoint instead so the symbol list still populates
-            proxies = {}
-            if hasattr(config, 'PROXY_URL') and config.PROXY_URL:
-                proxies = {'https': config.PROXY_URL, 'http': config.PROXY_URL}
-            resp = requests.get('https://fapi.binance.com/fapi/v1/exchangeInfo', timeout=10, proxies=proxies)
-            resp.raise_for_status()
-            info = resp.json()
-        else:
-            client = client_res
-            info = client.futures_exchange_info()
-        
-        # ✅ FIXED: Validate symbols more strictly
-        symbols = sorted([
-            s['symbol'] for s in info.get('symbols', []) 
-            if s['status'] == 'TRADING' 
-            and s['quoteAsset'] == 'USDT'
-            and s['contractType'] == 'PERPETUAL'
-            and len(s['symbol']) <= 20  # Binance symbols are reasonably short
-            and s['symbol'].endswith('USDT')  # Must end with USDT
-        ])
-        
-        _symbol_cache = symbols
-        _symbol_cache_time = now
-        return symbols
+        info = _fetch_exchange_info(user_id)
+        index = {s['symbol']: _compile_symbol_entry(s) for s in info.get('symbols', []) if s.get('symbol')}
+        if index:
+            _install_symbol_index(index, now)
+            shared_cache.store("symbol_index", index, config.SYMBOL_CACHE_DURATION, now)
+            print(f"✅ Symbol index compiled: {len(index)} contracts")
     except Exception as e:
-        print(f"Error fetching symbols: {e}")
-        return _symbol_cache if _symbol_cache else ["BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT"]
+        print(f"⚠️ exchangeInfo refresh failed: {e}")
+        _symbol_index_retry_at = now + SYMBOL_INDEX_RETRY_SECONDS
+    return _symbol_index
 
-def get_max_leverage(symbol, user_id=None):
+def get_symbol_info(symbol, user_id=None):
+    """Return the compiled index entry for a symbol, or None if unknown/unavailable."""
+    return get_symbol_index(user_id).get(symbol)
+
+def get_all_exchange_symbols(user_id=None):
+    """Fetches ALL USDT trading symbols from Binance Futures"""
+    get_symbol_index(user_id)
+    if _symbol_cache:
+        return _symbol_cache
+    print("Error fetching symbols: symbol index unavailable")
+    return ["BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT"]
+
+def _compile_leverage_brackets(payload):
+    """leverageBracket rows -> {symbol: [{'floor','cap','leverage','mmr','cum'}, ...]} sorted by floor."""
+    index = {}
+    for item in payload or []:
+        rows = sorted((
+            {
+                'floor': float(b.get('notionalFloor', 0)),
+                'cap': float(b.get('notionalCap', 0)),
+                'leverage': int(b.get('initialLeverage', 1)),
+                'mmr': float(b.get('maintMarginRatio', 0)),
+                'cum': float(b.get('cum', 0)),
+            }
+            for b in item.get('brackets') or []
+        ), key=lambda r: r['floor'])
+        if item.get('symbol') and rows:
+            index[item['symbol']] = rows
+    return index
+
+def _install_leverage_brackets(index, compiled_at):
+    global _leverage_brackets, _leverage_bracket_floors, _leverage_brackets_time
+    # {symbol: (rows, floors)} - a reader on another thread checks it has the floors of the rows it holds
+    _leverage_bracket_floors = {sym: (rows, [r['floor'] for r in rows]) for sym, rows in index.items()}
+    _leverage_brackets = index
+    _leverage_brackets_time = compiled_at
+
+def get_leverage_brackets(user_id=None, force_refresh=False):
     """
-    Fetches max leverage: Cache -> Live Binance API -> Known Map -> Safe Default
+    Every symbol's notional/leverage tiers from ONE unfiltered leverageBracket call,
+    refreshed every LEVERAGE_BRACKETS_TTL and shared with the other workers.
+    Signed endpoint, so it needs some connected user's client; {} until one exists.
     """
-    global _leverage_cache, _leverage_cache_time
+    global _leverage_brackets_retry_at
     now = time.time()
-    cache_key = f"{symbol}_{user_id or 'public'}"
-    
-    # 1. Check Cache (Return immediately if we already fetched it recently)
-    if cache_key in _leverage_cache and (now - _leverage_cache_time.get(cache_key, 0)) < 300:
-        return _leverage_cache[cache_key]
-    
-    # 2. Fetch LIVE data from Binance (This is the dynamic fix you need)
+    if _leverage_brackets and not force_refresh and (now - _leverage_brackets_time) < LEVERAGE_BRACKETS_TTL:
+        return _leverage_brackets
+    if not force_refresh:
+        hit = shared_cache.lookup("leverage_brackets", LEVERAGE_BRACKETS_TTL)
+        if hit and hit[0]:
+            _install_leverage_brackets(hit[0], hit[1])
+            return _leverage_brackets
+    if now < _leverage_brackets_retry_at and not force_refresh:
+        return _leverage_brackets
     try:
         client = get_client(user_id)
-        if client:
-            # We call the Bracket API to get the TRUE limit for this specific coin
-            brackets = client.futures_leverage_bracket(symbol=symbol)
-            if brackets and isinstance(brackets, list):
-                max_lev = int(brackets[0]['brackets'][0]['initialLeverage'])
-                
-                # Save to cache and return the real number (e.g., 20, 50, or 125)
-                _leverage_cache[cache_key] = max_lev
-                _leverage_cache_time[cache_key] = now
-                print(f"✅ {symbol} Live Max: {max_lev}x")
-                return max_lev
+        if not client or isinstance(client, dict):
+            return _leverage_brackets
+        index = _compile_leverage_brackets(client.futures_leverage_bracket())
+        if index:
+            _install_leverage_brackets(index, now)
+            shared_cache.store("leverage_brackets", index, LEVERAGE_BRACKETS_TTL, now)
+            print(f"✅ Leverage brackets loaded: {len(index)} symbols")
     except Exception as e:
-        print(f"⚠️ Binance API failed for {symbol}: {e}")
-    # 3. Fallback to Known Map (If API fails or no keys connected)
-    if symbol in KNOWN_LEVERAGE_MAP:
-        max_lev = KNOWN_LEVERAGE_MAP[symbol]
-        print(f"📋 {symbol} using Known Map: {max_lev}x")
-        return max_lev
-    # 4. Smart Safety Fallback (Preventing the 125x error)
-    if symbol.endswith('USDT'):
-        # Only allow 125x for the biggest, safest coins
-        if any(symbol.startswith(m) for m in ['BTC', 'ETH', 'BNB']):
-            return 125
-        
-        # For ALL other altcoins, default to 20x. 
-        # This prevents the "Leverage too high" error you were getting.
-        print(f"⚠️ {symbol} unknown, defaulting to safe 20x")
-        return 20
-        
-    # 5. Absolute Final Fallback
+        print(f"⚠️ leverageBracket refresh failed: {e}")
+        _leverage_brackets_retry_at = now + LEVERAGE_BRACKETS_RETRY_SECONDS
+    return _leverage_brackets
+
+def max_leverage_for_notional(symbol, notional, user_id=None):
+    """
+    Highest leverage Binance allows for a position of `notional` USDT in symbol:
+    the initialLeverage of the tier whose [floor, cap) holds it. None if brackets unknown.
+    """
+    rows = get_leverage_brackets(user_id).get(symbol)
+    if not rows:
+        return None
+    compiled = _leverage_bracket_floors.get(symbol)
+    floors = compiled[1] if compiled and compiled[0] is rows else [r['floor'] for r in rows]
+    i = max(0, bisect_right(floors, max(0.0, float(notional))) - 1)
+    return rows[i]['leverage']
+
+def _default_max_leverage(symbol):
+    # Smart Safety Fallback when brackets can't be loaded (Preventing the 125x error)
+    if symbol.endswith('USDT') and any(symbol.startswith(m) for m in ['BTC', 'ETH', 'BNB']):
+        return 125
+    # For ALL other coins, default to 20x. This prevents the "Leverage too high" error.
     return 20
 
+def get_max_leverage(symbol, user_id=None):
+    """
+    Max leverage for symbol (first, smallest-notional tier): bracket index -> safe default.
+    """
+    rows = get_leverage_brackets(user_id).get(symbol)
+    if rows:
+        return rows[0]['leverage']
+    max_lev = _default_max_leverage(symbol)
+    print(f"⚠️ {symbol} brackets unavailable, defaulting to {max_lev}x")
+    return max_lev
+
 def calculate_position_sizing(unutilized_margin, entry, sl_type, sl_value, side="LONG", user_id=None, symbol=None):
     import config
     if entry <= 0:
@@ -558,16 +914,18 @@ def calculate_position_sizing(unutilized_margin, entry, sl_type, sl_value, side=
         return {"error": "Invalid SL (0 distance)"}
     calculated_leverage = 100.0 / (sl_percent + 0.2)
     
-    # NEW: Get actual Binance max leverage for the specific symbol
+    pos_value_usdt = risk_amount / ((sl_percent / 100.0) + 0.002)
+    position_size = pos_value_usdt / entry
+    
+    # Binance max leverage AT THIS POSITION SIZE (tiers drop as notional grows)
     # If symbol not provided, use BTCUSDT as default
     symbol_for_lev = symbol if symbol else 'BTCUSDT'
-    exchange_max_lev = get_max_leverage(symbol_for_lev, user_id=user_id)
+    exchange_max_lev = max_leverage_for_notional(symbol_for_lev, pos_value_usdt, user_id=user_id)
+    if exchange_max_lev is None:
+        exchange_max_lev = get_max_leverage(symbol_for_lev, user_id=user_id)
     
     # FINAL: Cap by risk-calc, exchange limit, and absolute max
     final_max_leverage = min(int(calculated_leverage), exchange_max_lev, 125)
-    
-    pos_value_usdt = risk_amount / ((sl_percent / 100.0) + 0.002)
-    position_size = pos_value_usdt / entry
     return {
         "suggested_units": round_qty(symbol_for_lev, position_size),  # Use proper symbol
         "suggested_leverage": final_max_leverage,
@@ -587,28 +945,34 @@ def calculate_position_sizing(unutilized_margin, entry, sl_type, sl_value, side=
         "error": None
     }
 
-def get_open_positions(user_id=None, force_refresh=False):
-    global _positions_cache, _positions_cache_time
-    if force_refresh:
-        cache_key = f"positions_{user_id or 'public'}"
-        _positions_cache.pop(cache_key, None)
-        _positions_cache_time.pop(cache_key, None)
-    current_time = time.time()
-    cache_key = f"positions_{user_id or 'public'}"
-    
-    # Return cached positions if less than 5 seconds old (for LIVE liquidation price updates)
-    # Reduced from 30s to 5s for real-time liquidation price data
-    if cache_key in _positions_cache and (current_time - _positions_cache_time.get(cache_key, 0)) < 5:
-        return _positions_cache[cache_key]
-    
+def _fetch_open_positions(user_id=None):
+    """
+    One exchange round-trip for the account's positions (+ one grouped
+    open-orders fetch, sent alongside it when the account had open positions
+    last time). Returns the parsed open positions, or None when the
+    fetch failed so the caller doesn't cache a bogus empty list.
+    """
     try:
         # Virtual TP/SL fallback enforcement (for accounts/symbols rejecting algo orders)
         run_virtual_tp_sl_guard(user_id)
         client = get_client(user_id)
         if client is None: 
-            return []
+            return None
         
-        positions_raw = client.futures_position_information(recvWindow=10000)
+        # Open orders come from the TP/SL poller's conditional-orders cache when it is
+        # fresh. Otherwise accounts that had open positions last time get theirs in the
+        # same round as positionRisk instead of one after the other
+        cache_key = _user_key(user_id)
+        recent_orders = _fresh_conditional_orders(cache_key)
+        likely_symbols = _open_position_symbols.get(cache_key) or []
+        calls = [('fapi', '/fapi/v3/positionRisk', {'recvWindow': 10000})]
+        if recent_orders is None and likely_symbols:
+            calls += _open_orders_calls(likely_symbols)
+        fetched_at = time.time()
+        replies = exchange_gateway.fetch_many(client, calls)
+        if isinstance(replies[0], Exception):
+            raise replies[0]
+        positions_raw = replies[0]
         
         # After fetching positions, if empty, try Portfolio Margin endpoint
         if not positions_raw:
@@ -620,7 +984,18 @@ def get_open_positions(user_id=None, force_refresh=False):
             except Exception as pm_pos_err:
                 print(f"[DEBUG] Portfolio Margin positions endpoint failed (non-fatal): {pm_pos_err}")
 
+        learn_symbol_config(user_id, positions_raw, fetched_at)
         open_positions = []
+        # Open orders for every position in one round, grouped by symbol in memory
+        open_symbols = sorted({p.get('symbol') for p in positions_raw if abs(float(p.get('positionAmt', 0))) > 0})
+        _open_position_symbols[cache_key] = open_symbols
+        if not open_symbols:
+            orders_by_symbol = {}
+        elif recent_orders is not None:
+            orders_by_symbol = _orders_by_symbol_from_conditional(recent_orders)
+        else:
+            prefetched = replies[1:] if open_symbols == likely_symbols else None
+            orders_by_symbol = get_open_orders_by_symbol(user_id, client, prefetched, symbols=open_symbols)
         
         for pos in positions_raw:
             position_amt = float(pos.get('positionAmt', 0))
@@ -645,7 +1020,7 @@ def get_open_positions(user_id=None, force_refresh=False):
                 # Dashboard margin ratio shows actual margin buffer (NOT multiplied by leverage)
                 dashboard_margin_ratio = abs(margin_ratio)
                 
-                open_orders = get_open_orders_for_symbol(pos.get('symbol'), user_id)
+                open_orders = orders_by_symbol.get(pos.get('symbol'), [])
                 
                 open_positions.append({
                     'symbol': pos.get('symbol'), 
@@ -665,91 +1040,47 @@ def get_open_positions(user_id=None, force_refresh=False):
                     'open_orders': open_orders,
                     'timestamp': datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
                 })
-        
-        # Cache the results
-        _positions_cache[cache_key] = open_positions
-        _positions_cache_time[cache_key] = current_time
         return open_positions
     except Exception as e:
         print(f"Error getting open positions: {e}")
-        return []
+        return None
 
-def get_open_positions_live(user_id=None):
+def get_positions_snapshot(user_id=None, max_age=POSITIONS_MAX_AGE):
     """
-    ✅ LIVE VERSION - Fetches fresh position data WITHOUT caching
-    Used specifically for real-time liquidation price updates
-    This bypasses all caching to ensure the most current data
+    Single position-snapshot engine shared by every positions consumer.
+    Returns the cached snapshot if it is younger than max_age seconds,
+    otherwise fetches once. Concurrent callers for the same user wait on
+    the in-flight fetch and reuse its result instead of issuing their own.
     """
-    try:
-        # Virtual TP/SL fallback enforcement (for accounts/symbols rejecting algo orders)
-        run_virtual_tp_sl_guard(user_id)
-        client = get_client(user_id)
-        if client is None: 
+    cache_key = _user_key(user_id)
+    cached = _positions_cache.get(cache_key, max_age)
+    if cached is not None:
+        return cached
+
+    lock = _positions_fetch_locks.setdefault(cache_key, threading.Lock())
+    with lock:
+        # Another caller may have refreshed the snapshot while we waited
+        cached = _positions_cache.get(cache_key, max_age)
+        if cached is not None:
+            return cached
+        fetched_at = time.time()
+        open_positions = _fetch_open_positions(user_id)
+        if open_positions is None:
             return []
-        
-        positions_raw = client.futures_position_information(recvWindow=10000)
-        
-        # After fetching positions, if empty, try Portfolio Margin endpoint
-        if not positions_raw:
-            try:
-                pm_positions = _fetch_papi(client, '/papi/v1/um/positionRisk', {'recvWindow': 10000})
-                if pm_positions and isinstance(pm_positions, list):
-                    positions_raw = pm_positions
-                    print(f"[DEBUG] Portfolio Margin positions found: {len(positions_raw)}")
-            except Exception as pm_pos_err:
-                print(f"[DEBUG] Portfolio Margin positions endpoint failed (non-fatal): {pm_pos_err}")
-
-        open_positions = []
-        
-        for pos in positions_raw:
-            position_amt = float(pos.get('positionAmt', 0))
-            if abs(position_amt) > 0:
-                entry_price = float(pos.get('entryPrice', 0))
-                mark_price = float(pos.get('markPrice', 0))
-                unrealized_pnl = float(pos.get('unRealizedProfit', 0))
-                liquidation_price = float(pos.get('liquidationPrice', 0))
-                leverage = int(pos.get('leverage', 0))
-                notional = float(pos.get('notional', 0))
-                
-                initial_margin = abs(notional) / leverage if leverage > 0 else abs(notional)
-                # ROI percent (Binance-style, based on margin used)
-                roi_percent = (unrealized_pnl / initial_margin * 100) if initial_margin > 0 else 0
-                # Dashboard ROI multiplied by leverage - includes leverage tax effect
-                dashboard_roi_percent = roi_percent * leverage
-                # Margin ratio (Binance-style) - shows % buffer before liquidation
-                if mark_price > 0 and liquidation_price > 0:
-                    margin_ratio = ((mark_price - liquidation_price) / mark_price) * 100 if position_amt > 0 else ((liquidation_price - mark_price) / mark_price) * 100
-                else: 
-                    margin_ratio = 0
-                # Dashboard margin ratio shows actual margin buffer (NOT multiplied by leverage)
-                dashboard_margin_ratio = abs(margin_ratio)
-                
-                open_orders = get_open_orders_for_symbol(pos.get('symbol'), user_id)
-                
-                open_positions.append({
-                    'symbol': pos.get('symbol'), 
-                    'side': 'LONG' if position_amt > 0 else 'SHORT',
-                    'amount': abs(position_amt), 
-                    'size_usdt': abs(notional), 
-                    'margin_usdt': initial_margin,
-                    'margin_ratio': abs(margin_ratio),  # Raw
-                    'dashboard_margin_ratio': dashboard_margin_ratio,  # Actual margin buffer %
-                    'entry_price': entry_price, 
-                    'mark_price': mark_price,
-                    'unrealized_pnl': unrealized_pnl, 
-                    'roi_percent': roi_percent,  # Raw
-                    'dashboard_roi_percent': dashboard_roi_percent,  # Actual ROI %
-                    'leverage': leverage,
-                    'liquidation_price': liquidation_price, 
-                    'open_orders': open_orders,
-                    'timestamp': datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-                })
-        
-        # NO CACHING - Return fresh data immediately
+        _positions_cache.set(cache_key, open_positions, fetched_at)
         return open_positions
-    except Exception as e:
-        print(f"Error getting live open positions: {e}")
-        return []
+
+def get_open_positions(user_id=None, force_refresh=False, max_age=POSITIONS_MAX_AGE):
+    """Open positions from the shared snapshot (default freshness: POSITIONS_MAX_AGE)."""
+    return get_positions_snapshot(user_id, max_age=0 if force_refresh else max_age)
+
+def get_open_positions_live(user_id=None):
+    """
+    Near-real-time positions for liquidation price updates. Reads the same
+    snapshot as get_open_positions with a tighter max_age, so the 2s
+    liquidation poll and the 5s positions poll share one exchange fetch.
+    """
+    return get_positions_snapshot(user_id, max_age=LIVE_POSITIONS_MAX_AGE)
 
 def get_open_orders_for_symbol(symbol, user_id=None):
     try:
@@ -769,6 +1100,114 @@ def get_open_orders_for_symbol(symbol, user_id=None):
     except Exception:
         return []
 
+def _fetch_algo_open_orders(client):
+    """Fetch ALL open algo/conditional orders (TP1 lives here). Returns [] if unavailable."""
+    algo_orders = []
+
+    # Method 1: standard python-binance method
+    if hasattr(client, 'futures_get_algo_orders'):
+        try:
+            resp = client.futures_get_algo_orders(recvWindow=10000)
+            if resp:
+                algo_orders = resp if isinstance(resp, list) else resp.get('orders', [])
+                print(f"[DEBUG] Algo orders via futures_get_algo_orders: {len(algo_orders)}")
+        except Exception as e1:
+            print(f"[DEBUG] futures_get_algo_orders failed: {e1}")
+
+    # Method 2: fallback to raw request if Method 1 failed or returned nothing
+    if not algo_orders and hasattr(client, '_request_futures_api'):
+        try:
+            resp = client._request_futures_api('get', 'algoOrder/openOrders', True, data={'recvWindow': 10000})
+            if resp:
+                algo_orders = resp if isinstance(resp, list) else resp.get('orders', [])
+                print(f"[DEBUG] Algo orders via _request_futures_api: {len(algo_orders)}")
+        except Exception as e2:
+            print(f"[DEBUG] _request_futures_api algo failed: {e2}")
+
+    return algo_orders
+
+def _algo_orders_from(reply, client):
+    """Algo orders out of a gateway algoOrder/openOrders reply; the python-binance paths if that call errored."""
+    if isinstance(reply, RequestShed):
+        return []
+    if isinstance(reply, Exception):
+        print(f"[DEBUG] Gateway algo orders failed: {reply}")
+        return _fetch_algo_open_orders(client)
+    return reply if isinstance(reply, list) else (reply or {}).get('orders', [])
+
+def _open_orders_calls(symbols=None):
+    """
+    fetch_many() calls for the open orders of symbols: a regular + algo pair per
+    symbol (weight 1 each), or the two account-wide calls (weight 40 each) when
+    symbols is None or that many pairs would cost more.
+    """
+    if symbols is None or len(symbols) > OPEN_ORDERS_PER_SYMBOL_MAX:
+        return list(_OPEN_ORDERS_CALLS)
+    return [(base, path, dict(params, symbol=symbol)) for symbol in symbols for base, path, params in _OPEN_ORDERS_CALLS]
+
+def _fresh_conditional_orders(cache_key):
+    """get_all_open_conditional_orders()' list if it was fetched under CONDITIONAL_CACHE_MS ago (by any worker), else None."""
+    return _conditional_cache.get(cache_key)
+
+def _orders_by_symbol_from_conditional(orders):
+    """Group get_all_open_conditional_orders() rows the way get_open_orders_by_symbol() does."""
+    grouped = {}
+    for o in orders:
+        grouped.setdefault(o.get('symbol'), []).append({
+            'orderId': o.get('orderId'),
+            'type': o.get('type'),
+            'side': o.get('side'),
+            'price': o.get('stopPrice', 0),
+            'origQty': o.get('origQty', 0),
+            'status': o.get('status')
+        })
+    return grouped
+
+def get_open_orders_by_symbol(user_id=None, client=None, replies=None, symbols=None):
+    """
+    Fetch the open orders (regular + algo) of symbols, or of the whole account,
+    in one round and group them by symbol: {symbol: [order, ...]}.
+    Replaces one futures_get_open_orders(symbol=...) call per open position.
+    `replies` are the _open_orders_calls(symbols) replies, when the caller
+    already fetched them alongside its own calls.
+    """
+    try:
+        client = client or get_client(user_id)
+        if client is None:
+            return {}
+
+        calls = _open_orders_calls(symbols)
+        if not replies or len(replies) != len(calls):
+            replies = exchange_gateway.fetch_many(client, calls)
+
+        grouped = {}
+        for regular, algo_reply in zip(replies[0::2], replies[1::2]):
+            if isinstance(regular, Exception):
+                raise regular
+            for o in regular:
+                grouped.setdefault(o.get('symbol'), []).append({
+                    'orderId': o.get('orderId'), 
+                    'type': o.get('type'), 
+                    'side': o.get('side'),
+                    'price': float(o.get('stopPrice', o.get('price', 0))),
+                    'origQty': float(o.get('origQty', 0)), 
+                    'status': o.get('status')
+                })
+            for o in _algo_orders_from(algo_reply, client):
+                grouped.setdefault(o.get('symbol'), []).append({
+                    'orderId': str(o.get('algoId') or o.get('orderId') or ''),
+                    'type': (o.get('type') or o.get('algoType') or '').upper(),
+                    'side': o.get('side'),
+                    'price': float(o.get('triggerPrice') or o.get('stopPrice') or 0),
+                    'origQty': float(o.get('qty') or o.get('origQty') or 0),
+                    'status': o.get('algoStatus') or o.get('status')
+                })
+        return grouped
+    except Exception as e:
+        print(f"Error getting open orders: {e}")
+        return {}
+
+@with_priority(PRIORITY_TRADE)
 def cancel_open_order(symbol, order_id, user_id=None):
     try:
         client = get_client(user_id)
@@ -781,21 +1220,23 @@ def cancel_open_order(symbol, order_id, user_id=None):
         return {"success": False, "message": str(e)}
 
 def get_all_open_conditional_orders(user_id=None):
-    global _conditional_ban_until
     now_ms = int(time.time() * 1000)
-    print(f"[DEBUG] get_all_open_conditional_orders called. now_ms={now_ms}, ban_until={_conditional_ban_until}, cached={_conditional_cache.get(user_id)}")
-
+    ban_until_ms = int(governor.banned_until() * 1000)
+    cache_key = _user_key(user_id)
     # Serve from short TTL cache when available — kills duplicate-poll storms.
-    cached = _conditional_cache.get(user_id)
-    if cached and (now_ms - cached[0]) < CONDITIONAL_CACHE_MS:
+    # get() pulls a fresher copy from the other workers; get_entry() gives its age.
+    _conditional_cache.get(cache_key)
+    cached = _conditional_cache.get_entry(cache_key)
+    print(f"[DEBUG] get_all_open_conditional_orders called. now_ms={now_ms}, ban_until={ban_until_ms}, cached={cached}")
+    if cached and (now_ms - cached[1] * 1000) < CONDITIONAL_CACHE_MS:
         # If cache is very fresh (under 1s), return even if empty
-        if (now_ms - cached[0]) < 1000 or len(cached[1]) > 0:
-            return list(cached[1])
+        if (now_ms - cached[1] * 1000) < 1000 or len(cached[0]) > 0:
+            return list(cached[0])
 
     # If Binance has banned us, don't issue more requests until the window passes.
-    if now_ms < _conditional_ban_until:
-        if cached and len(cached[1]) > 0:
-            return list(cached[1])
+    if now_ms < ban_until_ms:
+        if cached and len(cached[0]) > 0:
+            return list(cached[0])
         return []
 
     try:
@@ -803,16 +1244,31 @@ def get_all_open_conditional_orders(user_id=None):
         if client is None:
             return []
 
-        # --- Fetch regular open orders ---
+        # --- Regular and algo (TP1 lives here) open orders, fetched concurrently ---
+        # Portfolio Margin accounts only list orders on papi: when this account's regular
+        # list was empty last time, ask papi in the same round instead of after it.
+        calls = list(_OPEN_ORDERS_CALLS)
+        if _pm_orders_likely.get(cache_key):
+            calls.append(('papi', '/papi/v1/um/openOrders', {'recvWindow': 10000}))
+        replies = exchange_gateway.fetch_many(client, calls)
+        algo_reply = replies[1]
+        pm_reply = replies[2] if len(replies) > 2 else None
+
         all_orders = []
         try:
-            # FIX: Ensure we fetch all open orders including conditional ones
-            all_orders = client.futures_get_open_orders(recvWindow=10000)
-            
+            if isinstance(replies[0], Exception):
+                raise replies[0]
+            all_orders = replies[0]
+            _pm_orders_likely[cache_key] = not all_orders
+
             if not all_orders:
                 # Try Portfolio Margin (papi) endpoint for accounts using PM mode
                 try:
-                    pm_orders = _fetch_papi(client, '/papi/v1/um/openOrders', {'recvWindow': 10000})
+                    pm_orders = pm_reply
+                    if pm_orders is None:
+                        pm_orders = _fetch_papi(client, '/papi/v1/um/openOrders', {'recvWindow': 10000})
+                    if isinstance(pm_orders, Exception):
+                        raise pm_orders
                     if pm_orders and isinstance(pm_orders, list):
                         all_orders = pm_orders
                         print(f"[DEBUG] Portfolio Margin papi orders found: {len(all_orders)}")
@@ -837,13 +1293,9 @@ def get_all_open_conditional_orders(user_id=None):
         except Exception as e:
             msg = str(e)
             print(f"[DEBUG] Error fetching regular open orders: {e}")
-            # Honour Binance IP-ban so we stop hammering and extending the ban.
-            if "-1003" in msg and "banned until" in msg:
-                try:
-                    _conditional_ban_until = int(msg.split("banned until")[1].split(".")[0].strip())
-                except Exception:
-                    _conditional_ban_until = now_ms + 60_000
-                return list(cached[1]) if cached else []
+            # Governor has recorded the IP-ban (or shed the call); stop hammering and extending it.
+            if isinstance(e, RequestShed) or ("-1003" in msg and "banned until" in msg):
+                return list(cached[0]) if cached else []
 
 
         conditional_types = [
@@ -892,32 +1344,13 @@ def get_all_open_conditional_orders(user_id=None):
                         'origQty': qty,
                         'time': datetime.fromtimestamp(o.get('time', 0) / 1000).strftime('%Y-%m-%d %H:%M:%S') if o.get('time') else 'N/A',
                         'reduceOnly': o.get('reduceOnly', False),
+                        'status': o.get('status'),
                         'source': 'regular'
                     })
 
-        # --- Fetch algo/conditional orders (TP1 lives here) ---
+        # --- Algo/conditional orders (TP1 lives here) ---
         try:
-            algo_orders = []
-
-            # Method 1: standard python-binance method
-            if hasattr(client, 'futures_get_algo_orders'):
-                try:
-                    resp = client.futures_get_algo_orders(recvWindow=10000)
-                    if resp:
-                        algo_orders = resp if isinstance(resp, list) else resp.get('orders', [])
-                        print(f"[DEBUG] Algo orders via futures_get_algo_orders: {len(algo_orders)}")
-                except Exception as e1:
-                    print(f"[DEBUG] futures_get_algo_orders failed: {e1}")
-
-            # Method 2: fallback to raw request if Method 1 failed or returned nothing
-            if not algo_orders and hasattr(client, '_request_futures_api'):
-                try:
-                    resp = client._request_futures_api('get', 'algoOrder/openOrders', True, data={'recvWindow': 10000})
-                    if resp:
-                        algo_orders = resp if isinstance(resp, list) else resp.get('orders', [])
-                        print(f"[DEBUG] Algo orders via _request_futures_api: {len(algo_orders)}")
-                except Exception as e2:
-                    print(f"[DEBUG] _request_futures_api algo failed: {e2}")
+            algo_orders = _algo_orders_from(algo_reply, client)
 
             for o in algo_orders:
                 o_type = (o.get('type') or o.get('algoType') or '').upper()
@@ -947,6 +1380,7 @@ def get_all_open_conditional_orders(user_id=None):
                         'origQty': qty,
                         'time': datetime.fromtimestamp(int(book_time) / 1000).strftime('%Y-%m-%d %H:%M:%S') if book_time else 'N/A',
                         'reduceOnly': o.get('reduceOnly', True),
+                        'status': o.get('algoStatus') or o.get('status'),
                         'source': 'algo'
                     })
         except Exception as algo_err:
@@ -970,13 +1404,14 @@ def get_all_open_conditional_orders(user_id=None):
             print(f"[DEBUG] Error resetting virtual guard flag: {e}")
 
         print(f"[DEBUG] Final conditional_orders to return: {conditional_orders}")
-        _conditional_cache[user_id] = (now_ms, list(conditional_orders))
+        _conditional_cache.set(cache_key, list(conditional_orders), now_ms / 1000)
         return conditional_orders
 
     except Exception as e:
         print(f"Error fetching conditional orders: {e}")
         return []
 
+@with_priority(PRIORITY_TRADE)
 def cancel_order(symbol, order_id, user_id=None):
     try:
         client = get_client(user_id)
@@ -1017,8 +1452,12 @@ def run_virtual_tp_sl_guard(user_id=None):
     if not user_id: return
     now = time.time()
     interval = getattr(config, 'VIRTUAL_GUARD_INTERVAL_SECONDS', 1.0)
-    if now - _virtual_guard_last_run.get(user_id, 0) < interval: return
-    _virtual_guard_last_run[user_id] = now
+    # Check-and-claim atomically: two threads both firing a virtual SL would close twice
+    with _virtual_guard_lock:
+        if user_id in _virtual_guard_running: return
+        if now - _virtual_guard_last_run.get(user_id, 0) < interval: return
+        _virtual_guard_last_run[user_id] = now
+        _virtual_guard_running.add(user_id)
     
     try:
         open_pos_db = TradePosition.query.filter_by(user_id=user_id, status='open').all()
@@ -1068,6 +1507,8 @@ def run_virtual_tp_sl_guard(user_id=None):
         except Exception:
             pass
         print(f"Virtual TP/SL guard error: {e}")
+    finally:
+        _virtual_guard_running.discard(user_id)
 
 def get_user_daily_stats(user_id):
     """Get or create today's stats from DB"""
@@ -1108,31 +1549,35 @@ def get_today_stats(user_id):
 def get_exchange_max_leverage(symbol, client=None):
     """
     Fetches the actual maximum available leverage for a symbol from Binance Futures.
+    Served from the bulk leverage-bracket index (get_leverage_brackets); client is unused.
     """
-    try:
-        if not client:
-            # Fallback to your default client logic if a user client isn't passed
-            client = _default_client 
-            
-        # Fetch leverage brackets for the specific symbol
-        brackets_info = client.futures_leverage_bracket(symbol=symbol)
-        
-        # Binance returns a list. Bracket 1 (the first item) always contains the highest leverage
-        if brackets_info and isinstance(brackets_info, list) and len(brackets_info) > 0:
-            max_lev = brackets_info[0]['brackets'][0]['initialLeverage']
-            return int(max_lev)
-            
-    except Exception as e:
-        print(f"API failed to fetch max leverage for {symbol}: {e}")
-        
-    # FALLBACK: If API fails, default to your KNOWN_LEVERAGE_MAP
-    # IMPORTANT: Change the default from a dangerous 125 to a safe 20!
-    return KNOWN_LEVERAGE_MAP.get(symbol, 20)
+    return get_max_leverage(symbol)
 
-def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_value, sizing, user_units, user_lev, margin_mode, tp1, tp1_pct, tp2, user_id=None):
+def ensure_leverage(client, symbol, leverage, user_id=None):
+    """
+    Set symbol leverage unless this account is already known to be on it.
+    0 signed calls when remembered, 1 otherwise. Returns the leverage now in force.
+    """
+    leverage = int(leverage)
+    if known_symbol_config(user_id, symbol).get('leverage') == leverage:
+        print(f"ℹ️ {symbol} leverage already {leverage}x - skipping change")
+        return leverage
+    res = client.futures_change_leverage(symbol=symbol, leverage=leverage)
+    leverage = int((res or {}).get('leverage') or leverage)
+    remember_symbol_config(user_id, symbol, leverage=leverage)
+    return leverage
+
+@with_priority(PRIORITY_TRADE)
+def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_value, sizing, user_units, user_lev, margin_mode, tp1, tp1_pct, tp2, user_id=None, progress=None):
+    """progress(leg, status, detail=None), if given, is told as entry/sl/tp1/tp2 finish (trade_queue)."""
     from models import TradePosition, db
     import config
-    global _positions_cache_time
+    def _report(leg, status, detail=None):
+        if progress:
+            try:
+                progress(leg, status, detail)
+            except Exception as e:
+                print(f"⚠️ Trade progress callback failed: {e}")
     client = get_client(user_id)
     if not client: 
         return {"success": False, "message": "❌ No Binance connection"}
@@ -1173,66 +1618,49 @@ def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_v
         can_trade, limit_msg = can_open_trade(symbol, user_id)
         if not can_trade:
             return {"success": False, "message": limit_msg}
-        # ✅ SMART LEVERAGE FALLBACK - Try ALL common leverage values
+        # ✅ LEVERAGE FROM BRACKETS - the valid value is known locally, so at most ONE signed call
         original_lev = lev
-        leverage_set = False
-        
-        # Build comprehensive list: start with requested, then try all common values
-        # Common Binance leverage: 125, 100, 75, 50, 25, 20, 15, 10, 5, 3, 2, 1
-        all_leverages = [125, 100, 75, 50, 25, 20, 15, 10, 5, 3, 2, 1]
-        
-        # Try requested leverage first
-        leverage_attempts = [original_lev] + [x for x in all_leverages if x < original_lev and x != original_lev]
-        leverage_attempts = list(dict.fromkeys(leverage_attempts))  # Remove duplicates, preserve order
-        
-        print(f"📊 Trying leverages for {symbol}: {leverage_attempts}")
+        bracket_lev = max_leverage_for_notional(symbol, float(qty) * float(entry), user_id)
+        if not bracket_lev:
+            # Brackets unavailable for this symbol: still cap, with the safe default, so the
+            # single leverage call doesn't go out uncapped and fail the trade with -4028
+            bracket_lev = get_max_leverage(symbol, user_id)
+        if lev > bracket_lev:
+            lev = bracket_lev
+            print(f"✅ Leverage adjusted to bracket max: {original_lev}x → {lev}x")
+        try:
+            lev = ensure_leverage(client, symbol, lev, user_id)
+        except BinanceAPIException as e:
+            forget_symbol_config(user_id, symbol)
+            if e.code == -4028:  # Leverage not valid for this coin/account
+                return {"success": False, "message": f"❌ {lev}x leverage rejected for {symbol} on your account. "
+                                                     f"Try a lower leverage."}
+            print(f"   ❌ Leverage error {e.code}: {e}")
+            raise
+        except Exception as e:
+            forget_symbol_config(user_id, symbol)
+            return {"success": False, "message": f"❌ Could not set {lev}x leverage for {symbol}: {e}"}
         
-        for attempt_lev in leverage_attempts:
+        # Set margin type only if this account isn't already known to be on it
+        # (the form says CROSS; Binance and the learned config say CROSSED)
+        margin_type = 'CROSSED' if str(margin_mode).upper().startswith('CROSS') else 'ISOLATED'
+        if known_symbol_config(user_id, symbol).get('margin_type') == margin_type:
+            print(f"ℹ️ {symbol} margin mode already {margin_type} - skipping change")
+        else:
             try:
-                client.futures_change_leverage(symbol=symbol, leverage=attempt_lev)
-                lev = attempt_lev
-                leverage_set = True
-                if attempt_lev < original_lev:
-                    print(f"✅ Leverage adjusted: {original_lev}x → {attempt_lev}x")
-                break
+                client.futures_change_margin_type(symbol=symbol, marginType=margin_type)
+                remember_symbol_config(user_id, symbol, margin_type=margin_type)
             except BinanceAPIException as e:
-                if e.code == 4028:  # Leverage not valid for this coin/account
-                    print(f"   ⚠️ {attempt_lev}x rejected for {symbol}")
-                    continue
+                # These are non-fatal - already set or not needed
+                if e.code == -4046:  # No need to change margin type
+                    print(f"ℹ️ Margin mode already set to {margin_type}")
+                    remember_symbol_config(user_id, symbol, margin_type=margin_type)
                 else:
-                    # Unexpected error
-                    print(f"   ❌ Leverage error {e.code}: {e}")
-                    raise
+                    # e.g. -4048: can't change with an open position/orders - continue on the current mode
+                    print(f"⚠️ Margin mode issue (non-fatal, continuing): {e}")
             except Exception as e:
-                print(f"   ⚠️ Leverage {attempt_lev}x error: {e}")
-                continue
-        
-        if not leverage_set:
-            return {
-                "success": False, 
-                "message": f"❌ No valid leverage found for {symbol} on your account.\n"
-                           f"Requested: {original_lev}x\n"
-                           f"Tried: {', '.join(map(str, leverage_attempts))}\n"
-                           f"All rejected. Your account/coin may have restrictions.\n"
-                           f"Try: Contact Binance support or use a different coin."
-            }
-        
-        # Try to set margin type (silently ignore if already set)
-        try:
-            client.futures_change_margin_type(symbol=symbol, marginType=margin_mode)
-        except BinanceAPIException as e:
-            # These are non-fatal - already set or not needed
-            if e.code in [4046, 4048]:  # Already in this mode, or no need to change
-                print(f"ℹ️ Margin mode already set to {margin_mode}")
-                pass
-            else:
-                # Only fail for actual margin mode errors
-                print(f"⚠️ Margin mode issue (non-fatal, continuing): {e}")
-                pass
-        except Exception as e:
-            # Ignore margin mode errors - they don't block trades
-            print(f"⚠️ Margin mode error (ignored): {str(e)}")
-            pass
+                # Ignore margin mode errors - they don't block trades
+                print(f"⚠️ Margin mode error (ignored): {str(e)}")
         e_side = Client.SIDE_BUY if side == "LONG" else Client.SIDE_SELL
         x_side = Client.SIDE_SELL if side == "LONG" else Client.SIDE_BUY
         
@@ -1268,20 +1696,27 @@ def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_v
                 order_params["price"] = round_price(symbol, entry, user_id)
                 order_params["timeInForce"] = "GTC"
             main_resp = client.futures_create_order(**order_params)
+            invalidate_account_snapshot(user_id)
             if isinstance(main_resp, dict) and main_resp.get("orderId") is not None:
                 main_order_id = str(main_resp.get("orderId"))
-            time.sleep(0.5)
+            _report("entry", "ok", main_order_id)
         except Exception as e:
+            _report("entry", "failed", e)
             return {"success": False, "message": f"❌ Main order failed: {str(e)}"}
-        def _create_order_with_fallbacks(variants):
-            errs = []
-            for params in variants:
+        def _create_order_with_fallbacks(variants, role):
+            # Learned per account/symbol/role: known-good shape first, known rejections skipped
+            if (learned_order_variants(user_id, symbol, role).get('good') or '').startswith('algo:'):
+                _, skipped = plan_order_variants(user_id, symbol, role, 'order', variants)
+                return False, None, " | ".join(err for _, err in skipped) or "Regular order skipped (algo endpoint learned)"
+            planned, skipped = plan_order_variants(user_id, symbol, role, 'order', variants)
+            errs = [err for _, err in skipped]
+            for params, shape in planned:
                 try:
                     resp = client.futures_create_order(**params)
-                    if isinstance(resp, dict) and resp.get("orderId"):
-                        return True, resp, None
+                    record_order_variant(user_id, symbol, role, shape)
                     return True, resp, None
                 except Exception as ex:
+                    record_order_variant(user_id, symbol, role, shape, ex)
                     errs.append(str(ex))
                     continue
             return False, None, " | ".join(errs) if errs else "Unknown order placement error"
@@ -1299,17 +1734,19 @@ def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_v
             if hasattr(client, "_request_futures_api"):
                 return client._request_futures_api("post", "algoOrder", True, data=params)
             raise Exception("Algo order endpoint method not available in Binance client")
-        def _create_algo_order_with_fallbacks(variants):
-            errs = []
-            for params in variants:
+        def _create_algo_order_with_fallbacks(variants, role):
+            planned, skipped = plan_order_variants(user_id, symbol, role, 'algo', variants)
+            if not planned:
+                # Every algo shape was rejected recently - still try them rather than leave no order
+                planned, skipped = [(params, order_variant_shape('algo', params)) for params in variants], []
+            errs = [err for _, err in skipped]
+            for params, shape in planned:
                 try:
                     resp = _submit_algo_order(params)
-                    if isinstance(resp, dict):
-                        oid = resp.get("algoId") or resp.get("orderId")
-                        if oid is not None:
-                            return True, resp, None
+                    record_order_variant(user_id, symbol, role, shape)
                     return True, resp, None
                 except Exception as ex:
+                    record_order_variant(user_id, symbol, role, shape, ex)
                     errs.append(str(ex))
                     continue
             return False, None, " | ".join(errs) if errs else "Unknown algo-order placement error"
@@ -1340,139 +1777,121 @@ def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_v
                 log_trade_event("TRADE_WARN", f"⚠️ Emergency close executed for {symbol} after SL placement failure", user_id)
             except Exception as close_err:
                 log_trade_event("TRADE_WARN", f"⚠️ Emergency close failed for {symbol}: {close_err}", user_id)
-        # SL ORDER - Create with error tolerance
-        sl_created = False
-        sl_error = None
-        try:
-            sl_variants = [
-                {
-                    "symbol": symbol,
-                    "side": x_side,
-                    "type": "STOP_MARKET",
-                    "stopPrice": sl_p,
-                    "closePosition": True,
-                    "workingType": "MARK_PRICE",
-                },
-                {
-                    "symbol": symbol,
-                    "side": x_side,
-                    "type": "STOP_MARKET",
-                    "stopPrice": sl_p,
-                    "closePosition": True,
-                },
-                {
-                    "symbol": symbol,
-                    "side": x_side,
-                    "type": "STOP_MARKET",
-                    "stopPrice": sl_p,
-                    "quantity": qty,
-                    "reduceOnly": True,
-                    "workingType": "MARK_PRICE",
-                },
-                {
-                    "symbol": symbol,
-                    "side": x_side,
-                    "type": "STOP_MARKET",
-                    "stopPrice": sl_p,
-                    "quantity": qty,
-                    "reduceOnly": True,
-                },
-                {
-                    "symbol": symbol,
-                    "side": x_side,
-                    "type": "STOP",
-                    "stopPrice": sl_p,
-                    "price": sl_p,
-                    "quantity": qty,
-                    "reduceOnly": True,
-                    "timeInForce": "GTC",
-                    "workingType": "MARK_PRICE",
-                },
-                {
-                    "symbol": symbol,
-                    "side": x_side,
-                    "type": "STOP",
-                    "stopPrice": sl_p,
-                    "price": sl_p,
-                    "quantity": qty,
-                    "reduceOnly": True,
-                    "timeInForce": "GTC",
-                },
-            ]
-            sl_created, sl_order, sl_error = _create_order_with_fallbacks(sl_variants)
-            if sl_created and sl_order and sl_order.get("orderId"):
-                sl_created = True
-                print(f"✅ SL order created: {sl_order['orderId']}")
-            # Binance native algo endpoint fallback for -4120 style accounts
-            if not sl_created:
-                sl_algo_variants = [
+        # SL / TP1 / TP2 are independent orders: submit them CONCURRENTLY right after the
+        # entry ack (no fixed sleeps), so a fresh position is unprotected for one round-trip.
+        # These run on pool threads - no DB access in here, logging happens after the join.
+        def _place_sl():
+            sl_created, sl_order, sl_error = False, None, None
+            try:
+                sl_variants = [
                     {
                         "symbol": symbol,
-                        "algoType": "CONDITIONAL",
                         "side": x_side,
                         "type": "STOP_MARKET",
-                        "triggerPrice": sl_p,
-                        "closePosition": "true",
+                        "stopPrice": sl_p,
+                        "closePosition": True,
                         "workingType": "MARK_PRICE",
                     },
                     {
                         "symbol": symbol,
-                        "algoType": "CONDITIONAL",
                         "side": x_side,
                         "type": "STOP_MARKET",
-                        "triggerPrice": sl_p,
+                        "stopPrice": sl_p,
+                        "closePosition": True,
+                    },
+                    {
+                        "symbol": symbol,
+                        "side": x_side,
+                        "type": "STOP_MARKET",
+                        "stopPrice": sl_p,
                         "quantity": qty,
-                        "reduceOnly": "true",
+                        "reduceOnly": True,
                         "workingType": "MARK_PRICE",
                     },
                     {
                         "symbol": symbol,
-                        "algoType": "CONDITIONAL",
+                        "side": x_side,
+                        "type": "STOP_MARKET",
+                        "stopPrice": sl_p,
+                        "quantity": qty,
+                        "reduceOnly": True,
+                    },
+                    {
+                        "symbol": symbol,
                         "side": x_side,
                         "type": "STOP",
-                        "triggerPrice": sl_p,
+                        "stopPrice": sl_p,
                         "price": sl_p,
                         "quantity": qty,
-                        "reduceOnly": "true",
+                        "reduceOnly": True,
                         "timeInForce": "GTC",
                         "workingType": "MARK_PRICE",
                     },
+                    {
+                        "symbol": symbol,
+                        "side": x_side,
+                        "type": "STOP",
+                        "stopPrice": sl_p,
+                        "price": sl_p,
+                        "quantity": qty,
+                        "reduceOnly": True,
+                        "timeInForce": "GTC",
+                    },
                 ]
-                sl_created, sl_algo_order, sl_algo_error = _create_algo_order_with_fallbacks(sl_algo_variants)
-                if sl_created:
-                    sl_order = sl_algo_order
-                    sl_error = None
-                    print(f"✅ SL algo order created: {sl_order}")
-                else:
-                    sl_error = sl_error or sl_algo_error
-            time.sleep(0.3)
-        except Exception as e:
-            sl_error = str(e)
-            print(f"⚠️ SL order creation failed: {e}")
-            log_trade_event("TRADE_WARN", f"⚠️ SL order failed: {sl_error}", user_id)
-        # HARD SAFETY:
-        # If Binance rejects algo order type (-4120), switch to virtual guard fallback.
-        # Otherwise, emergency-close to avoid unprotected exposure.
-        virtual_guard_enabled = False
-        sl_err_txt = (sl_error or "").lower()
-        if (not sl_created) and ("-4120" in sl_err_txt or "algo order api endpoints" in sl_err_txt):
-            virtual_guard_enabled = True
-            log_trade_event("TRADE_WARN", f"⚠️ {symbol}: Exchange SL/TP algo not supported, virtual guard enabled", user_id)
-        elif not sl_created:
-            _emergency_close_position()
-            return {
-                "success": False,
-                "message": f"❌ Trade aborted: Stop Loss order rejected by Binance.\n{sl_error or ''}\nPosition auto-closed for safety."
-            }
-        # TP1 PARTIAL - Create with error tolerance  
-        tp1_created = False
-        tp1_error = None
-        tp1_qty = 0
-        try:
-            if tp1 > 0 and ((side=="LONG" and tp1>entry) or (side=="SHORT" and tp1<entry)):
-                tp1_qty = round_qty(symbol, qty * (tp1_pct/100), user_id)
+                sl_created, sl_order, sl_error = _create_order_with_fallbacks(sl_variants, "SL")
+                if sl_created and sl_order and sl_order.get("orderId"):
+                    sl_created = True
+                    print(f"✅ SL order created: {sl_order['orderId']}")
+                # Binance native algo endpoint fallback for -4120 style accounts
+                if not sl_created:
+                    sl_algo_variants = [
+                        {
+                            "symbol": symbol,
+                            "algoType": "CONDITIONAL",
+                            "side": x_side,
+                            "type": "STOP_MARKET",
+                            "triggerPrice": sl_p,
+                            "closePosition": "true",
+                            "workingType": "MARK_PRICE",
+                        },
+                        {
+                            "symbol": symbol,
+                            "algoType": "CONDITIONAL",
+                            "side": x_side,
+                            "type": "STOP_MARKET",
+                            "triggerPrice": sl_p,
+                            "quantity": qty,
+                            "reduceOnly": "true",
+                            "workingType": "MARK_PRICE",
+                        },
+                        {
+                            "symbol": symbol,
+                            "algoType": "CONDITIONAL",
+                            "side": x_side,
+                            "type": "STOP",
+                            "triggerPrice": sl_p,
+                            "price": sl_p,
+                            "quantity": qty,
+                            "reduceOnly": "true",
+                            "timeInForce": "GTC",
+                            "workingType": "MARK_PRICE",
+                        },
+                    ]
+                    sl_created, sl_algo_order, sl_algo_error = _create_algo_order_with_fallbacks(sl_algo_variants, "SL")
+                    if sl_created:
+                        sl_order = sl_algo_order
+                        sl_error = None
+                        print(f"✅ SL algo order created: {sl_order}")
+                    else:
+                        sl_error = sl_error or sl_algo_error
+            except Exception as e:
+                sl_error = str(e)
+                print(f"⚠️ SL order creation failed: {e}")
+            return sl_created, sl_order, sl_error
+        def _place_tp1():
+            tp1_created, tp1_order, tp1_error = False, None, None
+            try:
                 if tp1_qty > 0:
-                    tp1_price = round_price(symbol, tp1, user_id)
                     tp1_variants = [
                         {
                             "symbol": symbol,
@@ -1513,7 +1932,7 @@ def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_v
                             "timeInForce": "GTC",
                         },
                     ]
-                    tp1_created, tp1_order, tp1_error = _create_order_with_fallbacks(tp1_variants)
+                    tp1_created, tp1_order, tp1_error = _create_order_with_fallbacks(tp1_variants, "TP1")
                     if tp1_created and tp1_order and tp1_order.get("orderId"):
                         tp1_created = True
                         print(f"✅ TP1 order created: {tp1_order['orderId']}")
@@ -1542,30 +1961,21 @@ def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_v
                                 "workingType": "MARK_PRICE",
                             },
                         ]
-                        tp1_created, tp1_algo_order, tp1_algo_error = _create_algo_order_with_fallbacks(tp1_algo_variants)
+                        tp1_created, tp1_algo_order, tp1_algo_error = _create_algo_order_with_fallbacks(tp1_algo_variants, "TP1")
                         if tp1_created:
                             tp1_order = tp1_algo_order
                             tp1_error = None
                             print(f"✅ TP1 algo order created: {tp1_order}")
                         else:
                             tp1_error = tp1_error or tp1_algo_error
-            time.sleep(0.3)
-        except Exception as e:
-            tp1_error = str(e)
-            print(f"⚠️ TP1 order creation failed: {e}")
-            log_trade_event("TRADE_WARN", f"⚠️ TP1 order failed: {tp1_error}", user_id)
-        # TP2 REMAINDER - Create with error tolerance
-        tp2_created = False
-        tp2_error = None
-        try:
-            if tp2 > 0 and ((side=="LONG" and tp2>entry) or (side=="SHORT" and tp2<entry)):
-                # TP2 is the remaining quantity (Total Qty - TP1 Qty)
-                # If TP1 failed or was not set, TP2 uses the full quantity
-                actual_tp1_qty = tp1_qty if tp1_created else 0
-                tp2_qty = round_qty(symbol, qty - actual_tp1_qty, user_id)
-
+            except Exception as e:
+                tp1_error = str(e)
+                print(f"⚠️ TP1 order creation failed: {e}")
+            return tp1_created, tp1_order, tp1_error
+        def _place_tp2():
+            tp2_created, tp2_order, tp2_error = False, None, None
+            try:
                 if tp2_qty > 0:
-                    tp2_price = round_price(symbol, tp2, user_id)
                     # TP2 is a Basic order (LIMIT or TAKE_PROFIT_MARKET with explicit quantity)
                     tp2_variants = [
                         {
@@ -1587,11 +1997,11 @@ def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_v
                             "workingType": "MARK_PRICE",
                         },
                     ]
-                    tp2_created, tp2_order, tp2_error = _create_order_with_fallbacks(tp2_variants)
+                    tp2_created, tp2_order, tp2_error = _create_order_with_fallbacks(tp2_variants, "TP2")
                     if tp2_created and tp2_order and tp2_order.get("orderId"):
                         tp2_created = True
                         print(f"✅ TP2 order created: {tp2_order['orderId']}")
-                    
+
                     if not tp2_created:
                         # Fallback to algo if regular fails
                         tp2_algo_variants = [
@@ -1606,17 +2016,77 @@ def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_v
                                 "workingType": "MARK_PRICE",
                             }
                         ]
-                        tp2_created, tp2_algo_order, tp2_algo_error = _create_algo_order_with_fallbacks(tp2_algo_variants)
+                        tp2_created, tp2_algo_order, tp2_algo_error = _create_algo_order_with_fallbacks(tp2_algo_variants, "TP2")
                         if tp2_created:
                             tp2_order = tp2_algo_order
                             tp2_error = None
                             print(f"✅ TP2 algo order created: {tp2_order}")
                         else:
                             tp2_error = tp2_error or tp2_algo_error
-        except Exception as e:
-            tp2_error = str(e)
-            print(f"⚠️ TP2 order creation failed: {e}")
-            log_trade_event("TRADE_WARN", f"⚠️ TP2 order failed: {tp2_error}", user_id)
+            except Exception as e:
+                tp2_error = str(e)
+                print(f"⚠️ TP2 order creation failed: {e}")
+            return tp2_created, tp2_order, tp2_error
+        def _cancel_placed_order(order):
+            try:
+                if not isinstance(order, dict):
+                    return
+                if order.get("algoId") is not None:
+                    if hasattr(client, "futures_cancel_algo_order"):
+                        client.futures_cancel_algo_order(algoId=order["algoId"])
+                    else:
+                        client._request_futures_api("delete", "algoOrder", True, data={"algoId": order["algoId"]})
+                elif order.get("orderId") is not None:
+                    client.futures_cancel_order(symbol=symbol, orderId=order["orderId"])
+            except Exception as cancel_err:
+                print(f"⚠️ Could not cancel protective order {order}: {cancel_err}")
+        def _as_trade_call(place, leg):
+            # Pool threads don't inherit the request's governor priority/user context
+            def run():
+                with request_priority(PRIORITY_TRADE, user_id):
+                    created, order, error = place()
+                _report(leg, "ok" if created else "failed" if error else "skipped", error)
+                return created, order, error
+            return run
+        # Quantities are planned up front so the three orders don't wait on each other:
+        # TP1 takes tp1_pct of qty, TP2 the remainder (or everything when TP1 isn't set)
+        tp1_qty = tp2_qty = 0
+        tp1_price = tp2_price = None
+        if tp1 > 0 and ((side=="LONG" and tp1>entry) or (side=="SHORT" and tp1<entry)):
+            tp1_qty = round_qty(symbol, qty * (tp1_pct/100), user_id)
+            tp1_price = round_price(symbol, tp1, user_id)
+        if tp2 > 0 and ((side=="LONG" and tp2>entry) or (side=="SHORT" and tp2<entry)):
+            tp2_qty = round_qty(symbol, qty - tp1_qty, user_id)
+            tp2_price = round_price(symbol, tp2, user_id)
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="bracket") as pool:
+            sl_future = pool.submit(_as_trade_call(_place_sl, "sl"))
+            tp1_future = pool.submit(_as_trade_call(_place_tp1, "tp1"))
+            tp2_future = pool.submit(_as_trade_call(_place_tp2, "tp2"))
+            sl_created, sl_order, sl_error = sl_future.result()
+            tp1_created, tp1_order, tp1_error = tp1_future.result()
+            tp2_created, tp2_order, tp2_error = tp2_future.result()
+        for label, created, error in (("SL", sl_created, sl_error), ("TP1", tp1_created, tp1_error), ("TP2", tp2_created, tp2_error)):
+            if error and not created:
+                log_trade_event("TRADE_WARN", f"⚠️ {label} order failed: {error}", user_id)
+        if tp2_created and tp1_qty > 0 and not tp1_created:
+            log_trade_event("TRADE_WARN", f"⚠️ {symbol}: TP1 failed - TP2 covers only the remaining {tp2_qty} (SL covers the full position)", user_id)
+        # HARD SAFETY:
+        # If Binance rejects algo order type (-4120), switch to virtual guard fallback.
+        # Otherwise, emergency-close to avoid unprotected exposure.
+        virtual_guard_enabled = False
+        sl_err_txt = (sl_error or "").lower()
+        if (not sl_created) and ("-4120" in sl_err_txt or "algo order api endpoints" in sl_err_txt):
+            virtual_guard_enabled = True
+            log_trade_event("TRADE_WARN", f"⚠️ {symbol}: Exchange SL/TP algo not supported, virtual guard enabled", user_id)
+        elif not sl_created:
+            # The TPs went out alongside the SL - don't leave them on a closed position
+            _cancel_placed_order(tp1_order if tp1_created else None)
+            _cancel_placed_order(tp2_order if tp2_created else None)
+            _emergency_close_position()
+            return {
+                "success": False,
+                "message": f"❌ Trade aborted: Stop Loss order rejected by Binance.\n{sl_error or ''}\nPosition auto-closed for safety."
+            }
         # PERSIST TO DATABASE
         pos = TradePosition(
             user_id=user_id,
@@ -1667,15 +2137,8 @@ def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_v
             f"✅ 1% RISK {side} {symbol} | Entry:${entry:.4f} SL:${sl_p:.4f}{tp_note} Qty:{qty} Lev:{lev}x{lev_note} | {status_msg}",
             user_id
         )
-        # Cache invalidation
-        cache_key_pos = f"positions_{user_id or 'public'}"
-        _positions_cache.pop(cache_key_pos, None)
-        _positions_cache_time.pop(cache_key_pos, None)
-        cache_key_hist = f"trade_history_{user_id or 'public'}"
-        _trade_history_cache.pop(cache_key_hist, None)
-        _trade_history_cache_time.pop(cache_key_hist, None)
-        # Fix 10: Invalidate conditional cache after trade execution
-        invalidate_conditional_cache(user_id)
+        # Cache invalidation: positions, history, TP/SL orders and balance all moved
+        invalidate_user_caches(user_id)
         
         # Final response with order status
         main_message = f"✅ {side} {symbol} executed (1% risk) @ {lev}x leverage{lev_note}"
@@ -1709,6 +2172,7 @@ def execute_trade_action(balance, symbol, side, entry, order_type, sl_type, sl_v
         log_trade_event("TRADE_FAIL", f"❌ {str(e)}", user_id)
         return {"success": False, "message": f"❌ {str(e)}"}
 
+@with_priority(PRIORITY_TRADE)
 def partial_close_position(symbol, close_percent=None, close_qty=None, user_id=None):
     from models import TradePosition, db
     try:
@@ -1740,22 +2204,15 @@ def partial_close_position(symbol, close_percent=None, close_qty=None, user_id=N
             db.session.commit()
         log_trade_event("PARTIAL_CLOSE", f"Closed {q} units of {symbol}, PnL: ${order.get('realizedPnl', 0):.2f}", user_id)
         
-        # Fix 10: Invalidate conditional cache after partial close
-        invalidate_conditional_cache(user_id)
-        
         # Invalidate caches after partial close
-        cache_key_positions = f"positions_{user_id or 'public'}"
-        cache_key_trades = f"trade_history_{user_id or 'public'}"
-        if cache_key_positions in _positions_cache:
-            del _positions_cache[cache_key_positions]
-        if cache_key_trades in _trade_history_cache:
-            del _trade_history_cache[cache_key_trades]
+        invalidate_user_caches(user_id)
         return {"success": True, "message": f"Closed {q} units", "order": order}
     
     except Exception as e:
         db.session.rollback()
         return {"success": False, "message": str(e)}
 
+@with_priority(PRIORITY_TRADE)
 def close_position(symbol, user_id=None):
     from models import TradePosition, db
     try:
@@ -1801,21 +2258,14 @@ def close_position(symbol, user_id=None):
             db.session.commit()
         log_trade_event("TRADE_CLOSE", f"Closed full position {symbol}", user_id)
         
-        # Fix 10: Invalidate conditional cache after position close
-        invalidate_conditional_cache(user_id)
-        
         # Invalidate caches after position close
-        cache_key_positions = f"positions_{user_id or 'public'}"
-        cache_key_trades = f"trade_history_{user_id or 'public'}"
-        if cache_key_positions in _positions_cache:
-            del _positions_cache[cache_key_positions]
-        if cache_key_trades in _trade_history_cache:
-            del _trade_history_cache[cache_key_trades]
+        invalidate_user_caches(user_id)
         return {"success": True, "message": "Position Closed"}
     except Exception as e: 
         db.session.rollback()
         return {"success": False, "message": str(e)}
 
+@with_priority(PRIORITY_TRADE)
 def trail_stop_loss(symbol, user_id=None):
     """Dynamic trailing SL: positive only, max -1% loss from entry"""
     from models import TradePosition, db
@@ -1898,18 +2348,20 @@ def get_live_pnl(symbol, user_id=None):
 
 def get_trade_history(user_id=None, force_refresh=False):
     from models import TradePosition
-    global _trade_history_cache, _trade_history_cache_time
     current_time = time.time()
-    cache_key = f"trade_history_{user_id or 'public'}"
+    cache_key = _user_key(user_id)
     
-    # Return cached trade history if less than 10 seconds old
-    if (not force_refresh) and cache_key in _trade_history_cache and (current_time - _trade_history_cache_time.get(cache_key, 0)) < 10:
-        return _trade_history_cache[cache_key]
+    # Return cached trade history if less than TRADE_HISTORY_TTL seconds old
+    if not force_refresh:
+        cached = _trade_history_cache.get(cache_key)
+        if cached is not None:
+            return cached
     
     try:
         client = get_client(user_id)
         if client is None:
-            return _trade_history_cache.get(cache_key, [])
+            entry = _trade_history_cache.get_entry(cache_key)
+            return entry[0] if entry else []
         # Increase lookback to 7 days
         start_time = int((time.time() - 7 * 24 * 3600) * 1000)
         binance_trades = client.futures_account_trades(limit=1000, startTime=start_time)
@@ -1960,8 +2412,7 @@ def get_trade_history(user_id=None, force_refresh=False):
         trade_history = attach_trade_levels(trade_history, user_id)
         
         # Cache the results
-        _trade_history_cache[cache_key] = trade_history
-        _trade_history_cache_time[cache_key] = current_time
+        _trade_history_cache.set(cache_key, trade_history, current_time)
         return trade_history
     except Exception as e:
         print(f"Error in get_trade_history: {e}")
@@ -2080,7 +2531,10 @@ def log_trade_event(event_type, message, user_id=None, pnl=0.0):
         db.session.add(log_entry)
         db.session.commit()
     
-    # Session for live UI (fallback/hybrid)
+    # Session for live UI (fallback/hybrid) - not available to queued trades (trade_queue.py),
+    # those events are in the DB log above
+    if not has_request_context():
+        return
     if "trade_events" not in session:
         session["trade_events"] = []
     
@@ -2126,28 +2580,19 @@ def get_wallet_balances(user_id=None):
         if isinstance(client_res, dict) and "error" in client_res:
             return {"success": False, "error": client_res["error"]}
 
-        client = client_res
-        acc = client.futures_account(recvWindow=10000)
-        assets = []
-        for asset in acc.get('assets', []):
-            if float(asset.get('walletBalance', 0)) > 0:
-                assets.append({
-                    'asset': asset.get('asset'),
-                    'balance': float(asset.get('walletBalance', 0)),
-                    'unrealized': float(asset.get('unrealizedProfit', 0)),
-                    'margin': float(asset.get('initialMargin', 0))
-                })
+        # The site-wide default client has its own snapshot, never the user's
+        snapshot_user = None if client_res is _default_client else user_id
+        acc, err = get_account_snapshot(snapshot_user, client=client_res)
+        if err:
+            return {"success": False, "error": err}
+        assets = [a for a in acc['assets'] if a['balance'] > 0]
                 
         return {
             "success": True,
-            "total_assets": float(acc.get('totalWalletBalance', 0)),
-            "total_unrealized": float(acc.get('totalUnrealizedProfit', 0)),
+            "total_assets": acc['wallet_balance'],
+            "total_unrealized": acc['unrealized_pnl'],
             "assets": assets,
-            "debug_info": {
-                "totalInitialMargin": acc.get('totalInitialMargin'),
-                "totalMaintMargin": acc.get('totalMaintMargin'),
-                "availableBalance": acc.get('availableBalance')
-            }
+            "debug_info": dict(acc['debug_info'])
         }
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -2157,7 +2602,6 @@ def get_live_price(symbol, user_id=None):
     ✅ FIXED: Bulletproof price fetch with per-symbol caching.
     CRITICAL: No cross-symbol fallback - only fetch the EXACT symbol requested.
     """
-    global _price_cache, _price_cache_time
     current_time = time.time()
     
     # ✅ CRITICAL: Strip whitespace and validate symbol format
@@ -2166,20 +2610,25 @@ def get_live_price(symbol, user_id=None):
         print(f"⚠️ INVALID SYMBOL FORMAT: '{symbol}' - returning 0 (NO FALLBACK)")
         return 0.0
     
-    # ✅ CRITICAL: Per-symbol, per-user cache key to prevent symbol mixing
-    cache_key = f"{symbol}_{user_id or 'public'}"
+    # ✅ Streamed mark/book price (market_data.py) - no REST call while the feed is fresh
+    streamed = market_data.get_price(symbol)
+    if streamed:
+        return streamed
+
+    # ✅ No stream: whole-market ticker table, one REST call per interval for every symbol/user/worker
+    bulk_price = market_data.get_rest_price(symbol)
+    if bulk_price:
+        return bulk_price
+
+    # ✅ CRITICAL: Per-symbol cache key to prevent symbol mixing (public data - shared by all users)
+    cache_key = symbol
     
-    # ✅ Check cache with per-symbol expiration (10 second TTL)
-    if cache_key in _price_cache and cache_key in _price_cache_time:
-        cache_age = current_time - _price_cache_time[cache_key]
-        if cache_age < 2:
-            cached_price = _price_cache[cache_key]
-            print(f"✓ PRICE CACHE HIT [{cache_age:.1f}s old]: {symbol} = ${cached_price}")
-            return cached_price
-        else:
-            print(f"🔄 PRICE CACHE EXPIRED [{cache_age:.1f}s]: {symbol} - fetching fresh...")
-    else:
-        print(f"🔄 PRICE CACHE MISS: {symbol} - fetching fresh...")
+    # ✅ Check cache with per-symbol expiration (config.PRICE_CACHE_DURATION)
+    cached_price = _price_cache.get(cache_key)
+    if cached_price is not None:
+        print(f"✓ PRICE CACHE HIT: {symbol} = ${cached_price}")
+        return cached_price
+    print(f"🔄 PRICE CACHE MISS/EXPIRED: {symbol} - fetching fresh...")
     
     # ✅ ATTEMPT 1: Try client API (if user has connected exchange)
     try:
@@ -2190,8 +2639,7 @@ def get_live_price(symbol, user_id=None):
             ticker = client.futures_symbol_ticker(symbol=symbol)
             price = float(ticker.get('price', 0))
             if price > 0:
-                _price_cache[cache_key] = price
-                _price_cache_time[cache_key] = current_time
+                _price_cache.set(cache_key, price, current_time)
                 print(f"✅ GOT PRICE FROM CLIENT API: {symbol} = ${price}")
                 return price
             else:
@@ -2201,8 +2649,8 @@ def get_live_price(symbol, user_id=None):
     
     # ✅ ATTEMPT 2: Try public Binance API endpoints
     public_endpoints = [
-        f"https://fapi.binance.com/fapi/v1/ticker/price?symbol={symbol}",
-        f"https://fapi.binance.com/fapi/v2/ticker/price?symbol={symbol}"
+        f"{config.BINANCE_FAPI_URL}/fapi/v1/ticker/price?symbol={symbol}",
+        f"{config.BINANCE_FAPI_URL}/fapi/v2/ticker/price?symbol={symbol}"
     ]
     proxies = {}
     if hasattr(config, 'PROXY_URL') and config.PROXY_URL:
@@ -2212,15 +2660,14 @@ def get_live_price(symbol, user_id=None):
     for endpoint in public_endpoints:
         try:
             print(f"   → Trying public endpoint: {endpoint}")
-            response = requests.get(endpoint, timeout=5, proxies=proxies)
+            response = governed_get(endpoint, timeout=5, proxies=proxies)
             data = response.json()
             # Handle both single ticker and list responses
             if isinstance(data, list):
                 data = data[0] if len(data) > 0 else {}
             price = float(data.get('price', 0))
             if price > 0:
-                _price_cache[cache_key] = price
-                _price_cache_time[cache_key] = current_time
+                _price_cache.set(cache_key, price, current_time)
                 print(f"✅ GOT PRICE FROM PUBLIC API: {symbol} = ${price}")
                 return price
         except Exception as e:
@@ -2243,17 +2690,17 @@ def get_live_price(symbol, user_id=None):
             cg_data = cg_response.json()
             price = float(cg_data.get(coin_id, {}).get('usd', 0))
             if price > 0:
-                _price_cache[cache_key] = price
-                _price_cache_time[cache_key] = current_time
+                _price_cache.set(cache_key, price, current_time)
                 print(f"✅ GOT PRICE FROM COINGECKO: {symbol} = ${price}")
                 return price
         except Exception as e:
             print(f"   ⚠️ CoinGecko fallback failed: {e}")
             
     # ✅ ATTEMPT 3: Last resort - use stale cache if available
-    if cache_key in _price_cache:
-        stale_price = _price_cache[cache_key]
-        stale_age = current_time - _price_cache_time.get(cache_key, 0)
+    stale = _price_cache.get_entry(cache_key)
+    if stale:
+        stale_price, stale_at = stale
+        stale_age = current_time - stale_at
         print(f"⚠️ NO FRESH PRICE AVAILABLE: Using STALE cache [{stale_age:.1f}s old] for {symbol} = ${stale_price}")
         return stale_price
     
@@ -2267,65 +2714,54 @@ def get_symbol_filters(symbol, user_id=None):
         {'filterType': 'LOT_SIZE', 'stepSize': '0.001', 'minQty': '0.001'},
         {'filterType': 'MIN_NOTIONAL', 'minNotional': '5'}
     ]
-    try:
-        client = get_client(user_id)
-        if client:
-            info = client.futures_exchange_info()
-            for s in info.get("symbols", []):
-                if s.get("symbol") == symbol: 
-                    return s.get("filters", DEFAULT_FILTERS)
-    except Exception:
-        pass
+    info = get_symbol_info(symbol, user_id)
+    if info and info.get('filters'):
+        return info['filters']
     return DEFAULT_FILTERS
 
 def get_min_qty(symbol, user_id=None):
-    for f in get_symbol_filters(symbol, user_id):
-        if f.get("filterType") == "LOT_SIZE":
-            return float(f.get("minQty", f.get("stepSize", 0.001)))
-    return 0.001
+    info = get_symbol_info(symbol, user_id)
+    return info['min_qty'] if info else 0.001
 
 def get_min_notional(symbol, user_id=None):
-    for f in get_symbol_filters(symbol, user_id):
-        if f.get("filterType") in ["MIN_NOTIONAL", "NOTIONAL"]:
-            return float(f.get("minNotional", f.get("notional", 5)))
-    return 5.0
+    info = get_symbol_info(symbol, user_id)
+    return info['min_notional'] if info else 5.0
 
 def get_required_order_qty(symbol, price, user_id=None):
-    step = get_lot_step(symbol, user_id)
+    info = get_symbol_info(symbol, user_id) or {}
+    step = info.get('step_size', 0.001)
     if step <= 0:
         step = 0.001
-    min_qty = get_min_qty(symbol, user_id)
-    min_notional = get_min_notional(symbol, user_id)
+    min_qty = info.get('min_qty', 0.001)
+    min_notional = info.get('min_notional', 5.0)
     if price <= 0:
         return min_qty
     min_notional_qty = math.ceil((min_notional / price) / step) * step
     return max(min_qty, min_notional_qty)
 
 def get_lot_step(symbol, user_id=None):
-    for f in get_symbol_filters(symbol, user_id):
-        if f.get("filterType") == "LOT_SIZE": 
-            return float(f.get("stepSize", 0.001))
-    return 0.001
+    info = get_symbol_info(symbol, user_id)
+    return info['step_size'] if info else 0.001
 
 def round_qty(symbol, qty, user_id=None):
     if qty <= 0:
         return 0
-    step = get_lot_step(symbol, user_id)
+    info = get_symbol_info(symbol, user_id)
+    step = info['step_size'] if info else 0.001
     if step == 0: 
         step = 0.001
-    precision = abs(int(round(-math.log10(step))))
+    precision = info['qty_precision'] if info else abs(int(round(-math.log10(step))))
     rounded = math.floor(qty / step) * step
     return round(rounded, precision) if rounded > 0 else 0
 
 def round_price(symbol, price, user_id=None):
-    for f in get_symbol_filters(symbol, user_id):
-        if f.get("filterType") == "PRICE_FILTER":
-            tick = float(f.get("tickSize", 0.01))
-            if tick == 0: 
-                return price
-            precision = abs(int(round(-math.log10(tick))))
-            return round(price - (price % tick), precision)
-    return round(price, 2)
+    info = get_symbol_info(symbol, user_id)
+    if not info:
+        return round(price, 2)
+    tick = info['tick_size']
+    if tick == 0: 
+        return price
+    return round(price - (price % tick), info['price_precision'])
 
 def get_live_balance(user_id):
     """
@@ -2340,11 +2776,10 @@ def get_live_balance(user_id):
         if isinstance(client_res, dict) and "error" in client_res:
             return ((0.0, 0.0), client_res["error"])
             
-        client = client_res
-        acc = client.futures_account(recvWindow=10000)
-        balance = float(acc.get('totalWalletBalance', 0.0))
-        margin_used = float(acc.get('totalInitialMargin', 0.0))
-        return ((balance, margin_used), None)
+        acc, err = get_account_snapshot(user_id, client=client_res)
+        if err:
+            return ((0.0, 0.0), err)
+        return ((acc['wallet_balance'], acc['initial_margin']), None)
     except Exception as e:
         print(f"❌ Error fetching live balance for user {user_id}: {e}")
         return ((0.0, 0.0), str(e))
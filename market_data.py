@@ -0,0 +1,250 @@
+"""
+Streamed market data: a process-wide price table fed by Binance WebSocket streams.
+
+One background thread per worker process holds a combined-stream connection:
+    !markPrice@arr@1s     - mark price of every contract, once a second
+    <symbol>@bookTicker   - best bid/ask, subscribed on demand for symbols the
+                            app actually asks about (the all-market book
+                            ticker is far too chatty to parse in Python)
+
+get_price() answers from that table without any network call. It returns None
+when the stream has nothing fresh for the symbol (not started yet,
+disconnected, unknown symbol), and logic.get_live_price falls back to REST.
+
+The REST fallback is bulk too: get_rest_price() reads a whole-market table
+refreshed by ONE ticker/price (or premiumIndex, for mark prices) call per
+REST_TABLE_TTL, published through shared_cache so every worker and every
+user reads the same table instead of asking per symbol.
+
+The thread is started lazily on first use in each worker, so gunicorn's
+preload_app master never owns a socket that would be shared across forks.
+"""
+import json
+import os
+import threading
+import time
+
+import config
+import shared_cache
+from exchange_governor import governed_get
+
+try:
+    from websockets.sync.client import connect as ws_connect
+except ImportError:  # websockets ships with python-binance, but don't hard-fail without it
+    ws_connect = None
+
+STREAM_STALE_SECONDS = 5        # older than this and get_price() says "don't know"
+BOOK_STALE_SECONDS = 3
+MARK_PRICE_STREAM = '!markPrice@arr@1s'
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 30
+MAX_BOOK_SUBSCRIPTIONS = 200    # Binance allows 1024 streams per connection
+REST_TABLE_TTL = config.PRICE_CACHE_DURATION
+REST_TABLE_RETRY_SECONDS = 5    # after a failed bulk refresh, don't retry before this
+
+# kind -> (path, price field); both are weight 1 per symbol, 2/10 for the whole market
+REST_TABLES = {
+    'last': ('/fapi/v1/ticker/price', 'price'),
+    'mark': ('/fapi/v1/premiumIndex', 'markPrice'),
+}
+
+# symbol -> {'mark', 'mark_at', 'bid', 'ask', 'book_at'} (receive time, local clock)
+_prices = {}
+_book_symbols = set()
+_pending_subscribe = []
+_lock = threading.Lock()
+_thread = None
+_thread_pid = None
+_connected = False
+_messages = 0
+_last_error = None
+# kind -> (prices dict, fetched_at); retry_at per kind after a failure
+_rest_tables = {}
+_rest_retry_at = {}
+
+
+def _enabled():
+    return ws_connect is not None and getattr(config, 'MARKET_DATA_STREAM', True)
+
+
+def _stream_url():
+    # Everything watched so far goes in the URL; later watch() calls queue a SUBSCRIBE
+    with _lock:
+        streams = [MARK_PRICE_STREAM] + [f"{s.lower()}@bookTicker" for s in sorted(_book_symbols)]
+        _pending_subscribe.clear()
+    return f"{config.BINANCE_FSTREAM_URL}/stream?streams={'/'.join(streams)}"
+
+
+def _apply(stream, data):
+    global _messages
+    now = time.time()
+    with _lock:
+        _messages += 1
+        if stream.startswith('!markPrice'):
+            for row in data:
+                entry = _prices.setdefault(row['s'], {})
+                entry['mark'] = float(row['p'])
+                entry['mark_at'] = now
+        elif stream.endswith('@bookTicker'):
+            entry = _prices.setdefault(data['s'], {})
+            entry['bid'] = float(data['b'])
+            entry['ask'] = float(data['a'])
+            entry['book_at'] = now
+
+
+def _send_pending(ws, request_id):
+    with _lock:
+        params, _pending_subscribe[:] = list(_pending_subscribe), []
+    if params:
+        ws.send(json.dumps({'method': 'SUBSCRIBE', 'params': params, 'id': request_id}))
+
+
+def _run():
+    global _connected, _last_error
+    backoff = RECONNECT_MIN_SECONDS
+    while True:
+        try:
+            kwargs = {'max_size': 8 * 1024 * 1024, 'open_timeout': 10}
+            if config.PROXY_URL:
+                kwargs['proxy'] = config.PROXY_URL
+            with ws_connect(_stream_url(), **kwargs) as ws:
+                _connected = True
+                backoff = RECONNECT_MIN_SECONDS
+                print(f"📡 [MARKET DATA] Stream connected ({len(_book_symbols)} book tickers)")
+                request_id = 1
+                while True:
+                    _send_pending(ws, request_id)
+                    request_id += 1
+                    try:
+                        raw = ws.recv(timeout=1)
+                    except TimeoutError:
+                        continue
+                    msg = json.loads(raw)
+                    if 'stream' in msg:
+                        _apply(msg['stream'], msg['data'])
+        except Exception as e:
+            _last_error = str(e)
+            print(f"⚠️ [MARKET DATA] Stream dropped: {e}; reconnecting in {backoff}s")
+        _connected = False
+        time.sleep(backoff)
+        backoff = min(RECONNECT_MAX_SECONDS, backoff * 2)
+
+
+def ensure_running():
+    """Start the stream thread in this process if it isn't running yet."""
+    global _thread, _thread_pid
+    if not _enabled():
+        return False
+    if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+        return True
+    with _lock:
+        if _thread is None or _thread_pid != os.getpid() or not _thread.is_alive():
+            _thread_pid = os.getpid()
+            _thread = threading.Thread(target=_run, name='market-data-stream', daemon=True)
+            _thread.start()
+    return True
+
+
+def watch(symbol):
+    """Add a bookTicker subscription for symbol (no-op if already watched or at the cap)."""
+    symbol = symbol.upper()
+    with _lock:
+        if symbol in _book_symbols or len(_book_symbols) >= MAX_BOOK_SUBSCRIPTIONS:
+            return
+        _book_symbols.add(symbol)
+        _pending_subscribe.append(f"{symbol.lower()}@bookTicker")
+
+
+def get_price(symbol, max_age=STREAM_STALE_SECONDS):
+    """
+    Streamed price for symbol: book-ticker mid if fresh, else mark price if
+    fresh, else None (caller should use REST). Never blocks on the network.
+    """
+    if not ensure_running():
+        return None
+    symbol = symbol.upper()
+    if symbol not in _book_symbols:
+        watch(symbol)
+    now = time.time()
+    with _lock:
+        entry = _prices.get(symbol)
+        if not entry:
+            return None
+        if entry.get('bid') and entry.get('ask') and now - entry.get('book_at', 0) < min(max_age, BOOK_STALE_SECONDS):
+            return round((entry['bid'] + entry['ask']) / 2, 8)
+        if entry.get('mark') and now - entry.get('mark_at', 0) < max_age:
+            return entry['mark']
+    return None
+
+
+def get_mark_price(symbol, max_age=STREAM_STALE_SECONDS):
+    """Streamed mark price only (what liquidations are computed from), or None."""
+    if not ensure_running():
+        return None
+    with _lock:
+        entry = _prices.get(symbol.upper())
+        if entry and entry.get('mark') and time.time() - entry.get('mark_at', 0) < max_age:
+            return entry['mark']
+    return None
+
+
+def _fetch_rest_table(kind):
+    path, field = REST_TABLES[kind]
+    proxies = {}
+    if config.PROXY_URL:
+        proxies = {'https': config.PROXY_URL, 'http': config.PROXY_URL}
+    # governed_get coalesces concurrent identical calls, so one fetch per worker at most
+    resp = governed_get(f"{config.BINANCE_FAPI_URL}{path}", timeout=5, proxies=proxies)
+    resp.raise_for_status()
+    table = {}
+    for row in resp.json():
+        price = float(row.get(field) or 0)
+        if price > 0:
+            table[row['symbol']] = price
+    return table
+
+
+def rest_price_table(kind='last', max_age=REST_TABLE_TTL):
+    """Whole-market {symbol: price} no older than max_age, or {} if it can't be had right now."""
+    now = time.time()
+    entry = _rest_tables.get(kind)
+    if entry and now - entry[1] < max_age:
+        return entry[0]
+    hit = shared_cache.lookup(f"price_table:{kind}", max_age)
+    if hit is not None:
+        _rest_tables[kind] = (hit[0], hit[1])
+        return hit[0]
+    if now < _rest_retry_at.get(kind, 0):
+        return {}
+    try:
+        table = _fetch_rest_table(kind)
+    except Exception as e:
+        _rest_retry_at[kind] = now + REST_TABLE_RETRY_SECONDS
+        print(f"⚠️ [MARKET DATA] Bulk {kind} price refresh failed: {e}")
+        return {}
+    fetched_at = time.time()
+    _rest_tables[kind] = (table, fetched_at)
+    shared_cache.store(f"price_table:{kind}", table, max(REST_TABLE_TTL, max_age), fetched_at)
+    return table
+
+
+def get_rest_price(symbol, mark=False, max_age=REST_TABLE_TTL):
+    """Price for symbol from the bulk REST table (last trade, or mark with mark=True), or None."""
+    return rest_price_table('mark' if mark else 'last', max_age).get(symbol.upper())
+
+
+def status():
+    """Connection and table state, for debugging/metrics."""
+    now = time.time()
+    with _lock:
+        fresh = sum(1 for e in _prices.values() if now - e.get('mark_at', 0) < STREAM_STALE_SECONDS)
+        return {
+            'enabled': _enabled(),
+            'connected': _connected,
+            'symbols': len(_prices),
+            'fresh_symbols': fresh,
+            'book_tickers': len(_book_symbols),
+            'messages': _messages,
+            'last_error': _last_error,
+            'rest_tables': {k: {'symbols': len(t), 'age': round(now - at, 1)} for k, (t, at) in _rest_tables.items()},
+        }
@@ -0,0 +1,274 @@
+"""
+Cross-worker cache for market data and per-user snapshots.
+
+gunicorn runs several worker processes and recycles them every
+max_requests, so per-process dicts are re-fetched once per worker and lost
+on every recycle. This module is a second cache level that every worker on
+the box (or every box, with Redis) reads and writes. logic.py keeps its
+in-process dicts as the first level and falls back to this on a miss.
+
+Backend is picked by config.SHARED_CACHE_URL:
+    sqlite                   - instance/shared_cache.db (default)
+    sqlite:////abs/path.db   - SQLite file at that path (WAL mode)
+    redis://host:6379/0      - Redis, or anything speaking its protocol (needs `redis`)
+    local                    - per-process dict only (old behaviour)
+
+Values must be JSON-serialisable. A broken backend degrades to cache misses,
+never to errors - the exchange is still the source of truth.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import config
+
+try:
+    import redis
+except ImportError:  # optional dependency, only needed for redis:// URLs
+    redis = None
+
+
+class LocalBackend:
+    """Per-process dict. Used when sharing is disabled or unavailable."""
+    name = 'local'
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+        if entry and entry[2] > time.time():
+            return entry[0], entry[1]
+        return None
+
+    def set(self, key, raw, stored_at, ttl):
+        with self._lock:
+            self._data[key] = (raw, stored_at, stored_at + ttl)
+
+    def add(self, key, raw, stored_at, ttl):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[2] > time.time():
+                return False
+            self._data[key] = (raw, stored_at, stored_at + ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_if(self, key, raw):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] == raw:
+                del self._data[key]
+
+
+class SQLiteBackend:
+    """SQLite file shared by every worker on the host (WAL: readers never block the writer)."""
+    name = 'sqlite'
+    PURGE_EVERY = 60
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        # One connection per thread per process - sqlite connections must not cross a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, stored_at FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key, raw, stored_at, ttl):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, stored_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, raw, stored_at, stored_at + ttl)
+        )
+        if stored_at - self._last_purge > self.PURGE_EVERY:
+            self._last_purge = stored_at
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (stored_at,))
+
+    def add(self, key, raw, stored_at, ttl):
+        conn = self._conn()
+        # An expired row doesn't count as present; each statement is atomic across processes
+        conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, time.time()))
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO cache (key, value, stored_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, raw, stored_at, stored_at + ttl)
+        )
+        return cur.rowcount == 1
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_if(self, key, raw):
+        self._conn().execute("DELETE FROM cache WHERE key = ? AND value = ?", (key, raw))
+
+
+class RedisBackend:
+    """Redis (or a compatible stand-in); shares the cache across hosts too."""
+    name = 'redis'
+    PREFIX = 'riskmgr:'
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("SHARED_CACHE_URL is redis:// but the 'redis' package is not installed")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key):
+        raw = self._client.get(self.PREFIX + key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry['v'], entry['t']
+
+    @staticmethod
+    def _px(stored_at, ttl):
+        # Expire ttl after stored_at, like the other backends (not ttl from now)
+        return int((stored_at + ttl - time.time()) * 1000)
+
+    def set(self, key, raw, stored_at, ttl):
+        px = self._px(stored_at, ttl)
+        if px <= 0:
+            self._client.delete(self.PREFIX + key)      # already expired
+            return
+        self._client.set(self.PREFIX + key, json.dumps({'v': raw, 't': stored_at}), px=px)
+
+    def add(self, key, raw, stored_at, ttl):
+        return bool(self._client.set(self.PREFIX + key, json.dumps({'v': raw, 't': stored_at}),
+                                     px=max(1, self._px(stored_at, ttl)), nx=True))
+
+    def delete(self, key):
+        self._client.delete(self.PREFIX + key)
+
+    # Compare-and-delete in one round trip, so a key another worker just re-claimed survives
+    DELETE_IF_SCRIPT = """
+        local entry = redis.call('GET', KEYS[1])
+        if entry and cjson.decode(entry)['v'] == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+
+    def delete_if(self, key, raw):
+        self._client.eval(self.DELETE_IF_SCRIPT, 1, self.PREFIX + key, raw)
+
+
+def _default_sqlite_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'shared_cache.db')
+
+
+def _make_backend(url):
+    url = (url or '').strip()
+    try:
+        if url == 'local':
+            return LocalBackend()
+        if url.startswith('redis://') or url.startswith('rediss://'):
+            return RedisBackend(url)
+        if url in ('', 'sqlite'):
+            return SQLiteBackend(_default_sqlite_path())
+        if url.startswith('sqlite:///'):
+            return SQLiteBackend(url[len('sqlite:///'):])
+        print(f"⚠️ [SHARED CACHE] Unknown SHARED_CACHE_URL '{url}', using per-process cache")
+    except Exception as e:
+        print(f"⚠️ [SHARED CACHE] Backend '{url}' unavailable ({e}), using per-process cache")
+    return LocalBackend()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_failures = 0
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _make_backend(getattr(config, 'SHARED_CACHE_URL', 'sqlite'))
+                print(f"[SHARED CACHE] Using {_backend.name} backend")
+    return _backend
+
+
+def _failed(op, key, e):
+    global _failures
+    _failures += 1
+    # Don't flood the log if the backend is down for a while
+    if _failures <= 3 or _failures % 100 == 0:
+        print(f"⚠️ [SHARED CACHE] {op} {key} failed ({_failures}x): {e}")
+
+
+def lookup(key, max_age):
+    """Return (value, stored_at) if another worker (or this one) stored key less than max_age ago, else None."""
+    try:
+        entry = get_backend().get(key)
+    except Exception as e:
+        _failed('get', key, e)
+        return None
+    if entry is None or (time.time() - entry[1]) >= max_age:
+        return None
+    try:
+        return json.loads(entry[0]), entry[1]
+    except ValueError:
+        return None
+
+
+def store(key, value, ttl, stored_at=None):
+    """Publish value for every worker; it expires ttl seconds after stored_at."""
+    stored_at = stored_at or time.time()
+    try:
+        get_backend().set(key, json.dumps(value), stored_at, ttl)
+    except Exception as e:
+        _failed('set', key, e)
+
+
+def add(key, value, ttl, stored_at=None):
+    """
+    Store key only if no live entry exists, atomically across workers. True when
+    this call stored it. A broken backend answers True: the guard degrades to
+    per-request, like every other miss.
+    """
+    stored_at = stored_at or time.time()
+    try:
+        return get_backend().add(key, json.dumps(value), stored_at, ttl)
+    except Exception as e:
+        _failed('add', key, e)
+        return True
+
+
+def delete(key):
+    try:
+        get_backend().delete(key)
+    except Exception as e:
+        _failed('delete', key, e)
+
+
+def delete_if(key, value):
+    """Delete key only while it still holds value (not if another worker replaced it)."""
+    try:
+        get_backend().delete_if(key, json.dumps(value))
+    except Exception as e:
+        _failed('delete', key, e)
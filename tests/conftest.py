@@ -0,0 +1,68 @@
+import itertools
+import os
+import socket
+import sys
+import tempfile
+
+import pytest
+
+with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    FAKE_URL = f"http://127.0.0.1:{s.getsockname()[1]}"
+
+# Before any app module imports config: per-process cache, no market-data thread, no proxy,
+# and every exchange URL pointed at the fake exchange below
+os.environ['SHARED_CACHE_URL'] = 'local'
+os.environ['MARKET_DATA_STREAM'] = '0'
+os.environ['PROXY_URL'] = ''
+os.environ['BINANCE_FAPI_URL'] = FAKE_URL
+os.environ['BINANCE_PAPI_URL'] = FAKE_URL
+os.environ['BINANCE_API_URL'] = FAKE_URL
+os.environ['EXCHANGE_WEIGHT_LIMIT'] = str(10 ** 6)
+# importing app creates its tables: keep that away from instance/users.db
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_binance  # noqa: E402
+
+FAKE_SERVER, FAKE, _ = fake_binance.start_server(port=int(FAKE_URL.rsplit(':', 1)[1]), weight_limit=10 ** 6)
+
+_user_numbers = itertools.count(1)
+
+
+@pytest.fixture
+def exchange(monkeypatch):
+    """The fake Binance, reset, with this process's caches emptied."""
+    import cache
+    import logic
+    import shared_cache
+    monkeypatch.setattr(shared_cache, '_backend', shared_cache.LocalBackend())
+    for ns in list(cache._namespaces.values()):
+        ns.clear()
+    for memo in (logic._user_clients, logic._last_client_error, logic._pm_orders_likely,
+                 logic._open_position_symbols):
+        memo.clear()
+    FAKE.accounts.clear()
+    FAKE.path_counts.clear()
+    FAKE.banned_until = 0
+    FAKE.options['fail'] = []
+    FAKE.options['algo_required'] = True
+    return FAKE
+
+
+@pytest.fixture
+def trader(exchange):
+    """A subscribed user with a connected fake-exchange account, inside an app context."""
+    from app import app
+    from models import ExchangeConnection, User, db
+    n = next(_user_numbers)
+    with app.app_context():
+        user = User(email=f"trader{n}@test.local", username=f"trader{n}", password='x', is_subscribed=True)
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(ExchangeConnection(user_id=user.id, exchange_type='binance', api_key=f"test-key-{n}",
+                                          api_secret=f"test-secret-{n}", is_connected=True))
+        db.session.commit()
+        user.account = exchange.account(f"test-key-{n}")
+        yield user
@@ -0,0 +1,29 @@
+import logic
+
+
+def account_calls(exchange):
+    return exchange.path_counts['/fapi/v2/account'] + exchange.path_counts['/fapi/v3/account']
+
+
+def test_balance_wallet_and_key_check_share_one_account_fetch(exchange, trader):
+    logic.get_client(trader.id)         # verifying the keys seeds the snapshot
+    (balance, margin), err = logic.get_live_balance(trader.id)
+    wallet = logic.get_wallet_balances(trader.id)
+    assert err is None and balance == 10000.0 and margin == 0.0
+    assert wallet['success'] and wallet['total_assets'] == 10000.0
+    assert account_calls(exchange) == 1
+
+
+def test_snapshot_is_refetched_after_invalidation(exchange, trader):
+    logic.get_live_balance(trader.id)
+    trader.account.wallet = 12345.0
+    assert logic.get_live_balance(trader.id)[0][0] == 10000.0      # still fresh
+    logic.invalidate_account_snapshot(trader.id)
+    assert logic.get_live_balance(trader.id)[0][0] == 12345.0
+
+
+def test_account_rows_teach_symbol_config(exchange, trader):
+    trader.account.fill('BTCUSDT', 'BUY', 0.01)
+    trader.account.leverage['BTCUSDT'] = 7
+    logic.get_account_snapshot(trader.id)
+    assert logic.known_symbol_config(trader.id, 'BTCUSDT')['leverage'] == 7
@@ -0,0 +1,68 @@
+import cache
+from cache import CacheNamespace
+
+
+def test_fresh_within_ttl_then_stale(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    ns = CacheNamespace('t_ttl', ttl=5)
+    ns.set('k', 'v')
+    assert ns.get('k') == 'v'
+    now[0] += 5
+    assert ns.get('k') is None
+    assert ns.get('k', default='miss') == 'miss'
+    # Stale entries stay for fallbacks until evicted
+    assert ns.get_entry('k') == ('v', 1000.0)
+    assert ns.get('k', max_age=60) == 'v'
+
+
+def test_lru_evicts_least_recently_used():
+    ns = CacheNamespace('t_lru', ttl=60, max_entries=2)
+    ns.set('a', 1)
+    ns.set('b', 2)
+    assert ns.get('a') == 1         # 'a' is now the most recently used
+    ns.set('c', 3)
+    assert 'b' not in ns
+    assert ns.get('a') == 1 and ns.get('c') == 3
+    assert ns.stats()['evictions'] == 1
+    assert ns.stats()['size'] == 2
+
+
+def test_hit_miss_counters_and_delete():
+    ns = CacheNamespace('t_stats', ttl=60)
+    ns.set('k', 'v')
+    ns.get('k')
+    ns.get('missing')
+    ns.delete('k')
+    assert 'k' not in ns
+    assert ns.stats()['hits'] == 1
+    assert ns.stats()['misses'] == 1
+
+
+def test_shared_namespace_reads_other_workers_entries(tmp_path, monkeypatch):
+    import shared_cache
+    monkeypatch.setattr(shared_cache, '_backend', shared_cache.SQLiteBackend(str(tmp_path / 'cache.db')))
+    ns = CacheNamespace('t_shared', ttl=60, shared=True)
+    CacheNamespace('t_shared', ttl=60, shared=True).set('k', {'from': 'other worker'})
+    assert ns.get('k') == {'from': 'other worker'}
+    assert 'k' in ns            # promoted into this worker's level
+
+
+def test_namespace_registry_and_invalidate():
+    ns = cache.namespace('t_registry', ttl=60)
+    assert cache.namespace('t_registry', ttl=1) is ns
+    ns.set('user:1', 'v', stored_at=123.0)
+    assert cache.stored_at('user:1', 't_registry', 'unknown') == (123.0, 0)
+    cache.invalidate('user:1', 't_registry')
+    assert 'user:1' not in ns
+
+
+def test_local_ttl_rereads_the_shared_store(tmp_path, monkeypatch):
+    import shared_cache
+    monkeypatch.setattr(shared_cache, '_backend', shared_cache.SQLiteBackend(str(tmp_path / 'cache.db')))
+    mine = CacheNamespace('t_local_ttl', ttl=60, shared=True, local_ttl=0)
+    other = CacheNamespace('t_local_ttl', ttl=60, shared=True)
+    mine.set('k', 'old')
+    other.set('k', 'new')
+    assert mine.get('k') == 'new'
+    assert other.get('k') == 'new'
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+from binance.exceptions import BinanceAPIException
+from flask import has_app_context
+
+import exchange_gateway
+import logic
+from exchange_governor import PRIORITY_INTERACTIVE, current_priority, current_user_id, request_priority
+
+SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'SOLUSDT', 'BNBUSDT', 'XRPUSDT']
+
+
+@pytest.fixture(params=['aiohttp', 'requests'])
+def client(request, exchange, trader, monkeypatch):
+    """A connected client; fetch_many() over aiohttp and over its requests fallback."""
+    if request.param == 'requests':
+        monkeypatch.setattr(exchange_gateway, 'aiohttp', None)
+    client = logic.get_client(trader.id)
+    exchange.path_counts.clear()
+    return client
+
+
+def position_calls(symbols):
+    return [('fapi', '/fapi/v2/positionRisk', {'symbol': s}) for s in symbols]
+
+
+def test_fetch_many_answers_in_call_order_with_errors_in_their_slots(client):
+    replies = exchange_gateway.fetch_many(client, position_calls(['ETHUSDT', 'NOPEUSDT', 'BTCUSDT']))
+    assert [replies[0][0]['symbol'], replies[2][0]['symbol']] == ['ETHUSDT', 'BTCUSDT']
+    assert isinstance(replies[1], BinanceAPIException) and replies[1].code == -1121
+    assert exchange_gateway.fetch_many(client, []) == []
+
+
+def test_fetch_many_waits_for_the_slowest_call_not_the_sum(client, exchange):
+    exchange.configure(latency_ms=200)
+    try:
+        started = time.time()
+        replies = exchange_gateway.fetch_many(client, position_calls(SYMBOLS))
+        elapsed = time.time() - started
+    finally:
+        exchange.configure(latency_ms=0)
+    assert [r[0]['symbol'] for r in replies] == SYMBOLS
+    assert elapsed < 0.6        # one after another: 1s
+
+
+def test_identical_calls_in_flight_are_sent_once(exchange, trader):
+    client = logic.get_client(trader.id)
+    exchange.path_counts.clear()
+    exchange.configure(latency_ms=100)
+    try:
+        first, second = exchange_gateway.fetch_many(client, position_calls(['BTCUSDT', 'BTCUSDT']))
+    finally:
+        exchange.configure(latency_ms=0)
+    assert first == second and first is not second
+    assert exchange.path_counts['/fapi/v2/positionRisk'] == 1
+
+
+def test_gather_runs_side_by_side_with_the_callers_context(exchange, trader):
+    def context():
+        time.sleep(0.2)
+        return current_priority('get'), current_user_id(), has_app_context()
+
+    started = time.time()
+    with request_priority(PRIORITY_INTERACTIVE, trader.id):
+        results = exchange_gateway.gather({name: context for name in 'abcd'})
+    assert time.time() - started < 0.6
+    assert results == {name: (PRIORITY_INTERACTIVE, trader.id, True) for name in 'abcd'}
+
+
+def test_gather_failures(exchange):
+    def broken():
+        raise ValueError('no')
+
+    results = exchange_gateway.gather({'ok': lambda: 1, 'bad': broken}, return_exceptions=True)
+    assert results['ok'] == 1 and isinstance(results['bad'], ValueError)
+    with pytest.raises(ValueError):
+        exchange_gateway.gather({'ok': lambda: 1, 'bad': broken})
+
+
+def test_gather_inside_a_gathered_call_runs_inline(exchange):
+    inner = lambda: exchange_gateway.gather({'x': lambda: 1, 'y': lambda: 2})
+    assert exchange_gateway.gather({'a': inner, 'b': inner}) == {'a': {'x': 1, 'y': 2}, 'b': {'x': 1, 'y': 2}}
@@ -0,0 +1,236 @@
+import threading
+import time
+
+import pytest
+
+from exchange_governor import (PRIORITY_INTERACTIVE, PRIORITY_POLL, PRIORITY_TRADE, RequestGovernor,
+                               RequestScheduler, RequestShed, SingleFlight, endpoint_weight,
+                               flight_key)
+
+
+class Reply:
+    """Just the response fields RequestGovernor.observe() reads."""
+
+    def __init__(self, url, status_code=200, headers=None, text=''):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+
+def test_endpoint_weight_by_path_and_symbol():
+    assert endpoint_weight('/fapi/v1/openOrders', {'symbol': 'BTCUSDT'}) == 1
+    assert endpoint_weight('/fapi/v1/openOrders') == 40
+    assert endpoint_weight('/fapi/v1/algoOrder/openOrders') == 40      # longest suffix wins
+    assert endpoint_weight('/fapi/v1/algoOrder') == 1
+    assert endpoint_weight('https://fapi.example/fapi/v3/positionRisk?recvWindow=1') == 5
+    assert endpoint_weight('/fapi/v1/somethingNew') == 1
+
+
+def test_observe_takes_used_weight_from_headers():
+    governor = RequestGovernor()
+    governor.observe(Reply('http://weights.test/fapi/v2/account', headers={'X-MBX-USED-WEIGHT-1M': '1234'}))
+    assert governor.status()['weights.test']['used_weight'] == 1234
+
+
+def test_polls_are_shed_near_the_limit_but_trades_go_out():
+    governor = RequestGovernor()
+    url = 'http://busy.test/fapi/v2/account'
+    limit = governor._window('busy.test').limit
+    governor.observe(Reply(url, headers={'X-MBX-USED-WEIGHT-1M': str(int(limit * 0.86))}))
+    with pytest.raises(RequestShed):
+        governor.acquire(url, priority=PRIORITY_POLL)
+    assert governor.acquire(url, priority=PRIORITY_INTERACTIVE) == 5
+    assert governor.acquire(url, priority=PRIORITY_TRADE) == 5
+
+
+def test_ban_stops_every_priority():
+    governor = RequestGovernor()
+    url = 'http://banned.test/fapi/v1/order'
+    governor.observe(Reply(url, status_code=418, headers={'Retry-After': '30'}))
+    assert governor.status()['banned.test']['banned_for'] > 0
+    with pytest.raises(RequestShed):
+        governor.acquire(url, priority=PRIORITY_TRADE)
+
+
+def test_banned_until_message_is_honoured():
+    governor = RequestGovernor()
+    until_ms = int((time.time() + 120) * 1000)
+    governor.observe(Reply('http://ipban.test/fapi/v1/openOrders', status_code=400,
+                           text=f'{{"code":-1003,"msg":"Way too many requests; IP banned until {until_ms}."}}'))
+    assert governor.banned_until('ipban.test') == until_ms / 1000
+
+
+def test_scheduler_caps_in_flight_but_never_queues_trades():
+    scheduler = RequestScheduler(max_concurrent=1)
+    scheduler.enter(PRIORITY_POLL, 'alice')
+    scheduler.enter(PRIORITY_TRADE, 'bob')     # trades go straight through
+    assert scheduler.status() == {'active': 2, 'waiting': 0}
+
+    entered = threading.Event()
+
+    def wait_for_slot():
+        scheduler.enter(PRIORITY_POLL, 'carol')
+        entered.set()
+
+    t = threading.Thread(target=wait_for_slot)
+    t.start()
+    time.sleep(0.1)
+    assert not entered.is_set()
+    scheduler.leave()
+    scheduler.leave()
+    t.join(2)
+    assert entered.is_set()
+    scheduler.leave()
+    assert scheduler.status() == {'active': 0, 'waiting': 0}
+
+
+def test_scheduler_sheds_stale_waiters(monkeypatch):
+    import exchange_governor
+    monkeypatch.setitem(exchange_governor.PRIORITY_MAX_WAIT, PRIORITY_POLL, 0.1)
+    scheduler = RequestScheduler(max_concurrent=1)
+    scheduler.enter(PRIORITY_POLL, 'alice')
+    with pytest.raises(RequestShed):
+        scheduler.enter(PRIORITY_POLL, 'bob')
+    assert scheduler.status() == {'active': 1, 'waiting': 0}
+
+
+def run_together(*fns):
+    """Start every fn on its own thread at once; return their results in order."""
+    results = [None] * len(fns)
+    start = threading.Barrier(len(fns))
+
+    def run(i, fn):
+        start.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=run, args=(i, fn)) for i, fn in enumerate(fns)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def slow(value, calls, delay=0.2):
+    def fn():
+        calls.append(value)
+        time.sleep(delay)
+        return {'owner': value}
+    return fn
+
+
+def test_flight_key_ignores_signing_noise():
+    a = flight_key('KEY', '/fapi/v1/openOrders', {'symbol': 'BTCUSDT', 'timestamp': 1, 'signature': 'x'})
+    b = flight_key('KEY', '/fapi/v1/openOrders', {'signature': 'y', 'timestamp': 2, 'symbol': 'BTCUSDT'})
+    assert a == b
+
+
+def test_flight_key_separates_api_keys_and_params():
+    base = flight_key('KEY_ALICE', '/fapi/v2/account', {})
+    assert base != flight_key('KEY_BOB', '/fapi/v2/account', {})
+    assert base != flight_key('KEY_ALICE', '/fapi/v2/account', {'symbol': 'BTCUSDT'})
+    assert base != flight_key('KEY_ALICE', '/fapi/v3/positionRisk', {})
+
+
+def test_single_flight_coalesces_same_key():
+    sf, calls = SingleFlight(), []
+    key = flight_key('KEY', '/fapi/v2/account', {})
+    first, second = run_together(lambda: sf.do(key, slow('A', calls)), lambda: sf.do(key, slow('B', calls)))
+    assert len(calls) == 1
+    assert first == second
+    assert first is not second          # followers get a copy by default
+    assert sf.coalesced == 1
+
+
+def test_single_flight_keeps_api_keys_apart():
+    sf, calls = SingleFlight(), []
+    alice = flight_key('KEY_ALICE', '/fapi/v2/account', {})
+    bob = flight_key('KEY_BOB', '/fapi/v2/account', {})
+    a, b = run_together(lambda: sf.do(alice, slow('KEY_ALICE', calls)), lambda: sf.do(bob, slow('KEY_BOB', calls)))
+    assert a == {'owner': 'KEY_ALICE'}
+    assert b == {'owner': 'KEY_BOB'}
+    assert sorted(calls) == ['KEY_ALICE', 'KEY_BOB']
+
+
+def test_single_flight_shares_result_without_copy():
+    sf, calls = SingleFlight(), []
+    first, second = run_together(lambda: sf.do('k', slow('A', calls), copy_result=False),
+                                 lambda: sf.do('k', slow('B', calls), copy_result=False))
+    assert first is second
+
+
+def test_single_flight_shares_errors_and_forgets_after_landing():
+    sf = SingleFlight()
+
+    def boom():
+        time.sleep(0.2)
+        raise ValueError('down')
+
+    def call():
+        try:
+            return sf.do('k', boom)
+        except ValueError as e:
+            return str(e)
+
+    assert run_together(call, call) == ['down', 'down']
+    # Nothing is cached once the flight lands
+    assert sf.do('k', lambda: 'fresh') == 'fresh'
+
+
+def test_single_flight_follower_retries_when_leader_was_shed():
+    sf, calls = SingleFlight(), []
+
+    def shed():
+        time.sleep(0.2)
+        raise RequestShed('stale')
+
+    def leader():
+        try:
+            return sf.do('k', shed)
+        except RequestShed:
+            return 'shed'
+
+    def follower():
+        time.sleep(0.05)
+        return sf.do('k', lambda: calls.append('retry') or 'ok')
+
+    assert run_together(leader, follower) == ['shed', 'ok']
+    assert calls == ['retry']
+
+
+def test_governed_get_never_shares_one_accounts_signed_reply(monkeypatch):
+    import exchange_governor
+    import logic
+
+    class Reply:
+        status_code = 200
+        text = '{}'
+
+        def __init__(self, url, api_key):
+            self.url, self.headers, self.api_key = url, {}, api_key
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {'owner': self.api_key}
+
+    def fake_get(url, headers=None, **kwargs):
+        time.sleep(0.2)
+        return Reply(url, headers['X-MBX-APIKEY'])
+
+    class Client:
+        API_SECRET = 'secret'
+        timestamp_offset = 0
+
+        def __init__(self, api_key):
+            self.API_KEY = api_key
+
+    monkeypatch.setattr(exchange_governor.requests, 'get', fake_get)
+    monkeypatch.setattr(exchange_governor.governor, 'observe', lambda resp: None)
+    alice, bob = Client('KEY_ALICE'), Client('KEY_BOB')
+    a, b = run_together(lambda: logic._fetch_papi(alice, '/papi/v1/um/openOrders'),
+                        lambda: logic._fetch_papi(bob, '/papi/v1/um/openOrders'))
+    assert a == {'owner': 'KEY_ALICE'}
+    assert b == {'owner': 'KEY_BOB'}
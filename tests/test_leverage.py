@@ -0,0 +1,70 @@
+import pytest
+
+import logic
+
+
+@pytest.fixture
+def no_brackets(exchange, monkeypatch):
+    monkeypatch.setattr(logic, '_leverage_brackets', {})
+    monkeypatch.setattr(logic, '_leverage_bracket_floors', {})
+    monkeypatch.setattr(logic, '_leverage_brackets_time', 0)
+    monkeypatch.setattr(logic, '_leverage_brackets_retry_at', 0)
+    return exchange
+
+
+@pytest.mark.parametrize('notional, leverage', [
+    (0, 125), (49999, 125), (50000, 62), (249999, 62), (250000, 31), (10 ** 9, 3),
+])
+def test_leverage_tier_for_notional(no_brackets, trader, notional, leverage):
+    # fake_binance BTCUSDT tiers: caps 50k, 250k, 1.25M, ... halving from 125x
+    assert logic.max_leverage_for_notional('BTCUSDT', notional, trader.id) == leverage
+
+
+def test_one_bracket_download_serves_every_symbol(no_brackets, trader):
+    assert logic.get_max_leverage('BTCUSDT', trader.id) == 125
+    assert logic.get_max_leverage('SOLUSDT', trader.id) == 50
+    assert logic.max_leverage_for_notional('BNBUSDT', 60000, trader.id) == 37
+    assert no_brackets.path_counts['/fapi/v1/leverageBracket'] == 1
+
+
+def test_without_brackets_the_safe_default_applies(no_brackets):
+    # No connected user: the signed bracket endpoint can't be asked
+    assert logic.max_leverage_for_notional('SOLUSDT', 1000) is None
+    assert logic.get_max_leverage('SOLUSDT') == 20
+    assert logic.get_max_leverage('BTCUSDT') == 125
+
+
+def trade(user, symbol, leverage, units):
+    entry = logic.get_live_price(symbol, user.id)
+    sizing = {'suggested_units': units, 'suggested_leverage': leverage}
+    return logic.execute_trade_action(10000, symbol, 'LONG', entry, 'MARKET', 'SL % Movement', 2, sizing, units,
+                                      leverage, 'CROSS', 0, 0, 0, user_id=user.id)
+
+
+def test_trade_leverage_is_capped_by_its_tier_in_one_call(no_brackets, trader):
+    # 1 BTC is above the 50k tier cap: 62x at most
+    result = trade(trader, 'BTCUSDT', 100, 1)
+    assert result['success'], result
+    assert trader.account.leverage['BTCUSDT'] == 62
+    assert no_brackets.path_counts['/fapi/v1/leverage'] == 1
+
+
+def test_known_leverage_is_not_set_again(no_brackets, trader):
+    assert trade(trader, 'ETHUSDT', 10, 0.1)['success']
+    assert trade(trader, 'ETHUSDT', 10, 0.1)['success']
+    assert no_brackets.path_counts['/fapi/v1/leverage'] == 1
+
+
+def test_without_brackets_trade_leverage_is_capped_by_the_default(no_brackets, trader):
+    no_brackets.configure(fail=[{'path': 'leverageBracket', 'code': -1000, 'count': 1}])
+    result = trade(trader, 'SOLUSDT', 40, 1)
+    assert result['success'], result
+    assert trader.account.leverage['SOLUSDT'] == 20
+
+
+def test_rejected_leverage_forgets_what_we_knew(no_brackets, trader):
+    logic.remember_symbol_config(trader.id, 'ETHUSDT', leverage=5)
+    no_brackets.configure(fail=[{'path': 'leverage', 'code': -4028, 'count': 1}])
+    result = trade(trader, 'ETHUSDT', 10, 0.1)
+    assert not result['success'] and 'rejected' in result['message']
+    assert logic.known_symbol_config(trader.id, 'ETHUSDT').get('leverage') is None
@@ -0,0 +1,140 @@
+import pytest
+
+import live_feed
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(live_feed.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def builds(clock, monkeypatch):
+    """Swap every section builder for one that records its calls; returns the call log."""
+    calls = []
+    live_feed._snapshot_memo.clear()
+
+    def builder(name):
+        def build(user_id, symbol):
+            calls.append(name)
+            return {'section': name}
+        return build
+
+    monkeypatch.setattr(live_feed, 'SECTIONS', {name: (builder(name), every)
+                                                for name, (_, every) in live_feed.SECTIONS.items()})
+    return calls
+
+
+def test_snapshot_rebuilds_only_the_sections_that_are_due(builds, clock):
+    first = live_feed.snapshot(1, 'BTCUSDT')
+    assert sorted(builds) == sorted(live_feed.SECTIONS)
+    assert set(first['sections']) == set(live_feed.SECTIONS)
+
+    builds.clear()
+    clock[0] += 2
+    again = live_feed.snapshot(1, 'BTCUSDT', first['version'])
+    assert sorted(builds) == ['liquidation', 'logs', 'price']
+    assert again == {'version': first['version'], 'sections': {}}
+
+    builds.clear()
+    clock[0] += 4
+    live_feed.snapshot(1, 'BTCUSDT', first['version'])
+    assert 'history' not in builds and 'positions' in builds and 'tp_sl' in builds
+
+
+def test_unknown_version_gets_every_section_without_a_rebuild(builds):
+    live_feed.snapshot(1, 'BTCUSDT')
+    builds.clear()
+    fresh_tab = live_feed.snapshot(1, 'BTCUSDT')
+    assert builds == []
+    assert set(fresh_tab['sections']) == set(live_feed.SECTIONS)
+
+
+def test_failed_section_is_retried_on_the_next_poll(builds, clock, monkeypatch):
+    def broken(user_id, symbol):
+        raise RuntimeError('exchange down')
+
+    monkeypatch.setitem(live_feed.SECTIONS, 'history', (broken, 10))
+    first = live_feed.snapshot(1, 'BTCUSDT')
+    assert 'history' not in first['sections']
+    assert first['version'].split('.')[list(live_feed.SECTIONS).index('history')] == ''
+
+    monkeypatch.setitem(live_feed.SECTIONS, 'history', (lambda user_id, symbol: {'trades': []}, 10))
+    clock[0] += 1
+    again = live_feed.snapshot(1, 'BTCUSDT', first['version'])
+    assert again['sections']['history'] == {'trades': []}
+
+
+@pytest.fixture
+def ticks(builds, clock, monkeypatch):
+    """stream() against the fake clock: each sleep moves time on instead of waiting."""
+    def sleep(seconds):
+        clock[0] += seconds
+    monkeypatch.setattr(live_feed.time, 'sleep', sleep)
+    from app import app
+    with app.app_context():
+        yield builds
+
+
+def events(body):
+    return [chunk.split('\n')[0].split(': ', 1)[1] for chunk in body if chunk.startswith('event: ')]
+
+
+def test_stream_sends_hello_then_each_section_once_while_unchanged(ticks):
+    body = list(live_feed.stream(1, 'BTCUSDT', max_seconds=10))
+    assert body[0] == "retry: 2000\n\n"
+    assert events(body) == ['hello'] + list(live_feed.SECTIONS)
+    assert ticks.count('price') == 10 and ticks.count('history') == 1
+
+
+def test_stream_resends_a_section_when_it_changes(ticks, clock, monkeypatch):
+    monkeypatch.setitem(live_feed.SECTIONS, 'price', (lambda user_id, symbol: {'price': int(clock[0]) // 2}, 1))
+    body = list(live_feed.stream(1, 'BTCUSDT', max_seconds=4))
+    assert events(body).count('price') == 2
+
+
+def test_stream_skips_failed_sections_and_keeps_the_connection_alive(ticks, monkeypatch):
+    def broken(user_id, symbol):
+        raise RuntimeError('exchange down')
+
+    monkeypatch.setitem(live_feed.SECTIONS, 'history', (broken, 10))
+    body = list(live_feed.stream(1, 'BTCUSDT', max_seconds=live_feed.KEEPALIVE_SECONDS + 2))
+    assert 'history' not in events(body) and 'positions' in events(body)
+    assert ": keepalive\n\n" in body
+
+
+@pytest.mark.parametrize('mode, multithread, expected', [
+    ('auto', True, True), ('auto', False, False), ('off', True, False), ('on', False, True),
+])
+def test_push_is_only_offered_by_threaded_workers(monkeypatch, mode, multithread, expected):
+    monkeypatch.setattr(live_feed.config, 'LIVE_PUSH', mode)
+    assert live_feed.available({'wsgi.multithread': multithread}) is expected
+
+
+def test_stream_slots_are_limited_per_worker(monkeypatch):
+    monkeypatch.setattr(live_feed, '_stream_slots', live_feed.threading.BoundedSemaphore(2))
+    assert live_feed.claim_slot() and live_feed.claim_slot()
+    assert not live_feed.claim_slot()
+    live_feed.release_slot()
+    assert live_feed.claim_slot()
+
+
+def test_live_stream_endpoint(trader, monkeypatch):
+    from app import app
+    monkeypatch.setattr(live_feed, '_stream_slots', live_feed.threading.BoundedSemaphore(1))
+    monkeypatch.setattr(live_feed, 'stream', lambda user_id, symbol: iter([live_feed._event('hello', symbol)]))
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(trader.id)
+
+    monkeypatch.setattr(live_feed.config, 'LIVE_PUSH', 'off')
+    assert client.get('/api/live_stream').status_code == 204      # the page keeps polling
+
+    monkeypatch.setattr(live_feed.config, 'LIVE_PUSH', 'on')
+    resp = client.get('/api/live_stream?symbol=ethusdt')
+    assert resp.mimetype == 'text/event-stream'
+    assert resp.get_data(as_text=True) == "event: hello\ndata: ETHUSDT\n\n"
+    resp.close()
+    assert live_feed.claim_slot()       # the finished stream gave its slot back
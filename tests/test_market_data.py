@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+import config
+import fake_binance
+import logic
+import market_data
+
+
+@pytest.fixture
+def fresh_tables(monkeypatch):
+    monkeypatch.setattr(market_data, '_prices', {})
+    monkeypatch.setattr(market_data, '_rest_tables', {})
+    monkeypatch.setattr(market_data, '_rest_retry_at', {})
+
+
+def test_book_mid_beats_mark_until_it_goes_stale(fresh_tables, monkeypatch):
+    monkeypatch.setattr(market_data, 'ensure_running', lambda: True)
+    monkeypatch.setattr(market_data, '_book_symbols', {'BTCUSDT'})
+    market_data._apply('!markPrice@arr@1s', [{'s': 'BTCUSDT', 'p': '100.0'}])
+    market_data._apply('btcusdt@bookTicker', {'s': 'BTCUSDT', 'b': '99.0', 'a': '101.5'})
+    assert market_data.get_price('BTCUSDT') == 100.25
+    market_data._prices['BTCUSDT']['book_at'] -= market_data.BOOK_STALE_SECONDS
+    assert market_data.get_price('BTCUSDT') == 100.0
+    market_data._prices['BTCUSDT']['mark_at'] -= market_data.STREAM_STALE_SECONDS
+    assert market_data.get_price('BTCUSDT') is None
+
+
+def test_live_price_comes_from_the_stream(exchange, fresh_tables, monkeypatch):
+    server, url = fake_binance.start_stream_server(exchange, interval=0.2)
+    try:
+        monkeypatch.setattr(config, 'BINANCE_FSTREAM_URL', url)
+        monkeypatch.setattr(config, 'MARKET_DATA_STREAM', True)
+        monkeypatch.setattr(market_data, '_thread', None)
+        deadline = time.time() + 5
+        while market_data.get_price('ETHUSDT') is None and time.time() < deadline:
+            time.sleep(0.05)
+        exchange.path_counts.clear()
+        assert logic.get_live_price('ETHUSDT') == pytest.approx(exchange.market.price('ETHUSDT'), rel=0.01)
+        assert sum(exchange.path_counts.values()) == 0
+    finally:
+        monkeypatch.setattr(config, 'MARKET_DATA_STREAM', False)
+        server.shutdown()
+
+
+def test_one_bulk_ticker_call_prices_every_symbol(exchange, fresh_tables):
+    for symbol in ('BTCUSDT', 'ETHUSDT', 'SOLUSDT', 'ALT001USDT'):
+        assert logic.get_live_price(symbol) == pytest.approx(exchange.market.price(symbol), rel=0.01)
+    assert market_data.get_rest_price('BTCUSDT', mark=True) == pytest.approx(exchange.market.price('BTCUSDT'), rel=0.01)
+    assert exchange.path_counts['/fapi/v1/ticker/price'] == 1
+    assert exchange.path_counts['/fapi/v1/premiumIndex'] == 1
+
+
+def test_other_workers_read_the_published_table(exchange, fresh_tables, monkeypatch):
+    market_data.rest_price_table()
+    monkeypatch.setattr(market_data, '_rest_tables', {})    # another worker process
+    assert market_data.get_rest_price('BTCUSDT')
+    assert exchange.path_counts['/fapi/v1/ticker/price'] == 1
+
+
+def test_failed_bulk_refresh_backs_off(exchange, fresh_tables):
+    exchange.configure(fail=[{'path': 'ticker/price', 'code': -1000, 'count': 1}])
+    assert market_data.rest_price_table() == {}
+    assert market_data.rest_price_table() == {}
+    assert exchange.path_counts['/fapi/v1/ticker/price'] == 1
+
+
+@pytest.fixture
+def two_traders(exchange, trader):
+    from models import ExchangeConnection, User, db
+    other = User(email=f"other{trader.id}@test.local", username=f"other{trader.id}", password='x', is_subscribed=True)
+    db.session.add(other)
+    db.session.flush()
+    db.session.add(ExchangeConnection(user_id=other.id, exchange_type='binance', api_key=f"other-key-{trader.id}",
+                                      api_secret='other-secret', is_connected=True))
+    db.session.commit()
+    return trader, other
+
+
+def test_public_prices_and_brackets_are_cached_once_for_every_user(two_traders, exchange, fresh_tables,
+                                                                   monkeypatch):
+    alice, bob = two_traders
+    monkeypatch.setattr(market_data, 'get_rest_price', lambda symbol, mark=False, max_age=None: None)
+    monkeypatch.setattr(logic, '_leverage_brackets', {})
+    monkeypatch.setattr(logic, '_leverage_brackets_time', 0)
+    for user in (alice, bob):
+        logic.get_client(user.id)
+    exchange.path_counts.clear()
+    assert logic.get_live_price('BTCUSDT', alice.id) == logic.get_live_price('BTCUSDT', bob.id)
+    assert logic.get_max_leverage('BTCUSDT', alice.id) == logic.get_max_leverage('BTCUSDT', bob.id) == 125
+    assert exchange.path_counts['/fapi/v1/ticker/price'] == 1
+    assert exchange.path_counts['/fapi/v1/leverageBracket'] == 1
@@ -0,0 +1,65 @@
+import time
+
+import logic
+
+
+class Rejected(Exception):
+    """Stands in for BinanceAPIException: only .code is looked at."""
+
+    def __init__(self, code):
+        super().__init__(f"APIError(code={code})")
+        self.code = code
+
+
+STOP = {'symbol': 'X', 'type': 'STOP_MARKET', 'stopPrice': 1, 'closePosition': True}
+STOP_QTY = {'symbol': 'X', 'type': 'STOP_MARKET', 'stopPrice': 1, 'quantity': 2, 'reduceOnly': True}
+
+
+def test_shape_names_the_params_not_their_values():
+    assert logic.order_variant_shape('order', STOP) == 'order:STOP_MARKET:closePosition,stopPrice'
+    assert logic.order_variant_shape('order', dict(STOP, stopPrice=9)) == logic.order_variant_shape('order', STOP)
+
+
+def test_known_good_first_and_rejected_shapes_skipped(exchange):
+    stop, stop_qty = (logic.order_variant_shape('order', v) for v in (STOP, STOP_QTY))
+    logic.record_order_variant(1, 'X', 'SL', stop, Rejected(-1106))
+    logic.record_order_variant(1, 'X', 'SL', stop_qty)
+    planned, skipped = logic.plan_order_variants(1, 'X', 'SL', 'order', [STOP, STOP_QTY])
+    assert [shape for _, shape in planned] == [stop_qty]
+    assert [shape for shape, _ in skipped] == [stop]
+
+
+def test_only_shape_errors_are_learned(exchange):
+    shape = logic.order_variant_shape('order', STOP)
+    logic.record_order_variant(1, 'X', 'SL', shape, Rejected(-2021))   # would trigger now: not the shape's fault
+    assert logic.learned_order_variants(1, 'X', 'SL') == {'good': None, 'bad': {}}
+
+
+def test_rejections_are_retried_after_the_ttl(exchange):
+    shape = logic.order_variant_shape('order', STOP)
+    logic.record_order_variant(1, 'X', 'SL', shape, Rejected(-4120))
+    memory = logic.learned_order_variants(1, 'X', 'SL')
+    memory['bad'][shape]['at'] = time.time() - logic.ORDER_VARIANT_TTL - 1
+    logic._order_variant_cache.set(logic._order_variant_key(1, 'X', 'SL'), memory)
+    assert shape in logic.learned_order_variants(1, 'X', 'SL')['bad']
+    planned, skipped = logic.plan_order_variants(1, 'X', 'SL', 'order', [STOP])
+    assert [s for _, s in planned] == [shape] and not skipped
+
+
+def trade(user, symbol, units):
+    entry = logic.get_live_price(symbol, user.id)
+    sizing = {'suggested_units': units, 'suggested_leverage': 10}
+    return logic.execute_trade_action(10000, symbol, 'LONG', entry, 'MARKET', 'SL % Movement', 2, sizing, units,
+                                      10, 'CROSS', entry * 1.02, 50, entry * 1.04, user_id=user.id)
+
+
+def test_second_trade_goes_straight_to_the_learned_endpoint(exchange, trader):
+    assert trade(trader, 'ETHUSDT', 1)['success']
+    assert logic.learned_order_variants(trader.id, 'ETHUSDT', 'SL')['good'].startswith('algo:')
+    exchange.path_counts.clear()
+    logic._order_variant_cache.clear()      # another worker: the lesson comes from the shared store
+    result = trade(trader, 'ETHUSDT', 1)
+    assert result['success'], result
+    # entry + the TP2 LIMIT; SL and TP1 skip the regular endpoint that answered -4120
+    assert exchange.path_counts['/fapi/v1/order'] == 2
+    assert exchange.path_counts['/fapi/v1/algoOrder'] == 2
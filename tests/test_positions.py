@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+
+import exchange_gateway
+import logic
+from exchange_governor import endpoint_weight
+
+
+@pytest.fixture
+def rounds(monkeypatch):
+    """Every exchange_gateway.fetch_many() round: [[(path, params), ...], ...]."""
+    seen = []
+    fetch_many = exchange_gateway.fetch_many
+
+    def recording(client, calls, *args, **kwargs):
+        seen.append([(path, dict(params or {})) for _, path, params in calls])
+        return fetch_many(client, calls, *args, **kwargs)
+
+    monkeypatch.setattr(exchange_gateway, 'fetch_many', recording)
+    return seen
+
+
+def weight(rounds):
+    return sum(endpoint_weight(path, params) for calls in rounds for path, params in calls)
+
+
+def open_position(exchange, account, symbol, side='BUY', qty=0.01):
+    account.fill(symbol, side, qty)
+    exit_side = 'SELL' if side == 'BUY' else 'BUY'
+    price = exchange.market.price(symbol)
+    exchange.new_algo_order(account, {'symbol': symbol, 'side': exit_side, 'type': 'STOP_MARKET',
+                                      'triggerPrice': round(price * 0.9, 2), 'closePosition': 'true'})
+
+
+def orders_of(positions):
+    return {p['symbol']: sorted(o['type'] for o in p['open_orders']) for p in positions}
+
+
+def test_open_orders_are_fetched_per_symbol_with_positions(exchange, trader, rounds):
+    open_position(exchange, trader.account, 'BTCUSDT')
+    open_position(exchange, trader.account, 'ETHUSDT', side='SELL')
+    exchange.new_order(trader.account, {'symbol': 'ETHUSDT', 'side': 'BUY', 'type': 'LIMIT', 'quantity': '0.01',
+                                        'price': '3000', 'reduceOnly': 'true'})
+    first = logic.get_open_positions(trader.id, force_refresh=True)
+    assert orders_of(first) == {'BTCUSDT': ['STOP_MARKET'], 'ETHUSDT': ['LIMIT', 'STOP_MARKET']}
+
+    rounds.clear()
+    again = logic.get_open_positions(trader.id, force_refresh=True)
+    assert orders_of(again) == orders_of(first)
+    assert len(rounds) == 1                     # orders ride along with positionRisk
+    assert weight(rounds) == 5 + 2 * 2          # not 5 + 2 * 40 for the account-wide lists
+
+
+def test_fresh_conditional_orders_are_reused(exchange, trader, rounds):
+    open_position(exchange, trader.account, 'BTCUSDT')
+    logic.get_open_positions(trader.id, force_refresh=True)
+    logic.get_all_open_conditional_orders(trader.id)          # the TP/SL poller
+    rounds.clear()
+    positions = logic.get_open_positions(trader.id, force_refresh=True)
+    assert orders_of(positions) == {'BTCUSDT': ['STOP_MARKET']}
+    assert [path for calls in rounds for path, _ in calls] == ['/fapi/v3/positionRisk']
+
+
+def test_a_new_position_still_gets_its_orders(exchange, trader):
+    open_position(exchange, trader.account, 'BTCUSDT')
+    logic.get_open_positions(trader.id, force_refresh=True)
+    open_position(exchange, trader.account, 'SOLUSDT', qty=1)
+    positions = logic.get_open_positions(trader.id, force_refresh=True)
+    assert orders_of(positions) == {'BTCUSDT': ['STOP_MARKET'], 'SOLUSDT': ['STOP_MARKET']}
+
+
+def test_many_positions_use_the_account_wide_lists(exchange, trader, rounds, monkeypatch):
+    monkeypatch.setattr(logic, 'OPEN_ORDERS_PER_SYMBOL_MAX', 1)
+    open_position(exchange, trader.account, 'BTCUSDT')
+    open_position(exchange, trader.account, 'ETHUSDT')
+    positions = logic.get_open_positions(trader.id, force_refresh=True)
+    assert orders_of(positions) == {'BTCUSDT': ['STOP_MARKET'], 'ETHUSDT': ['STOP_MARKET']}
+    assert ('/fapi/v1/openOrders', {'recvWindow': 10000}) in rounds[-1]
+
+
+def test_positions_and_liquidation_polls_share_one_snapshot(exchange, trader):
+    open_position(exchange, trader.account, 'BTCUSDT')
+    exchange.path_counts.clear()
+    assert [p['symbol'] for p in logic.get_open_positions(trader.id)] == ['BTCUSDT']
+    assert [p['symbol'] for p in logic.get_open_positions_live(trader.id)] == ['BTCUSDT']
+    assert exchange.path_counts['/fapi/v3/positionRisk'] == 1
+
+
+def test_concurrent_callers_wait_for_the_fetch_in_flight(exchange, trader):
+    from app import app
+    open_position(exchange, trader.account, 'BTCUSDT')
+    logic.get_client(trader.id)
+    exchange.configure(latency_ms=200)
+    exchange.path_counts.clear()
+    results = []
+
+    def poll():
+        with app.app_context():
+            results.append(logic.get_open_positions(trader.id))
+
+    threads = [threading.Thread(target=poll) for _ in range(3)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+    finally:
+        exchange.configure(latency_ms=0)
+    assert [len(r) for r in results] == [1, 1, 1]
+    assert exchange.path_counts['/fapi/v3/positionRisk'] == 1
+
+
+def test_failed_fetch_is_not_cached_as_no_positions(exchange, trader):
+    open_position(exchange, trader.account, 'BTCUSDT')
+    exchange.configure(fail=[{'path': 'positionRisk', 'code': -1000, 'count': 1}])
+    assert logic.get_open_positions(trader.id) == []
+    assert [p['symbol'] for p in logic.get_open_positions(trader.id)] == ['BTCUSDT']
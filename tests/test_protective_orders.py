@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import logic
+
+
+def trade(user, symbol, units, tp1_pct=50, progress=None):
+    entry = logic.get_live_price(symbol, user.id)
+    sizing = {'suggested_units': units, 'suggested_leverage': 10}
+    return logic.execute_trade_action(10000, symbol, 'LONG', entry, 'MARKET', 'SL % Movement', 2, sizing, units,
+                                      10, 'CROSS', entry * 1.02, tp1_pct, entry * 1.04, user_id=user.id,
+                                      progress=progress)
+
+
+def test_sl_and_both_tps_are_placed(exchange, trader):
+    legs = {}
+    result = trade(trader, 'ETHUSDT', 1, progress=lambda leg, status, detail=None: legs.__setitem__(leg, status))
+    assert result['success'], result
+    assert legs == {'entry': 'ok', 'sl': 'ok', 'tp1': 'ok', 'tp2': 'ok'}
+    sl, tp1 = sorted(trader.account.algo_orders.values(), key=lambda o: float(o['triggerPrice']))
+    tp2, = trader.account.orders.values()       # a plain reduce-only LIMIT
+    assert sl['type'] == 'STOP_MARKET' and sl['closePosition']
+    assert (tp1['type'], float(tp1['quantity'])) == ('TAKE_PROFIT_MARKET', 0.5)
+    assert (tp2['type'], float(tp2['origQty'])) == ('LIMIT', 0.5)
+    assert all(o['side'] == 'SELL' for o in (sl, tp1, tp2))
+
+
+def test_protective_orders_go_out_concurrently(exchange, trader):
+    exchange.configure(algo_required=False)     # one /order call per leg
+
+    def progress(leg, status, detail=None):
+        if leg == 'entry':
+            exchange.configure(latency_ms=300)
+
+    try:
+        assert trade(trader, 'ETHUSDT', 1, progress=progress)['success']
+    finally:
+        exchange.configure(latency_ms=0)
+    placed = [o['updateTime'] for o in trader.account.orders.values()]
+    assert len(placed) == 3
+    assert max(placed) - min(placed) < 200      # one after another would be 300ms apart
+
+
+def test_rejected_sl_cancels_the_tps_and_closes_the_position(exchange, trader):
+    def progress(leg, status, detail=None):
+        if leg == 'entry':
+            exchange.configure(fail=[{'path': 'v1/order', 'code': -2021, 'count': 100},
+                                     {'path': 'algoOrder', 'code': -2021, 'count': 100}])
+        elif leg == 'sl':
+            exchange.options['fail'] = []       # let the cancels and the emergency close through
+
+    result = trade(trader, 'ETHUSDT', 1, progress=progress)
+    assert not result['success'] and 'auto-closed' in result['message']
+    assert trader.account.positions['ETHUSDT']['amt'] == 0
+    assert not trader.account.orders and not trader.account.algo_orders
+
+
+def test_one_client_parses_each_threads_own_reply(exchange, trader):
+    exchange.configure(latency_ms=50)
+    try:
+        client = logic.get_client(trader.id)
+        symbols = ['BTCUSDT', 'ETHUSDT', 'SOLUSDT', 'BNBUSDT'] * 2
+        with ThreadPoolExecutor(max_workers=len(symbols)) as pool:
+            rows = list(pool.map(lambda s: client.futures_position_information(symbol=s), symbols))
+    finally:
+        exchange.configure(latency_ms=0)
+    assert [r[0]['symbol'] for r in rows] == symbols
+    assert client.response is None or client.response.status_code == 200
@@ -0,0 +1,133 @@
+import json
+import multiprocessing
+import time
+
+import pytest
+
+import shared_cache
+from shared_cache import LocalBackend, RedisBackend, SQLiteBackend
+
+
+class FakeRedis:
+    """The redis-py calls RedisBackend makes, on a dict (the delete_if script done in Python)."""
+
+    def __init__(self):
+        self.data = {}      # key -> (value, expires_at)
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] <= time.time():
+            del self.data[key]
+            entry = None
+        return entry
+
+    def get(self, key):
+        entry = self._live(key)
+        return entry[0].encode() if entry else None
+
+    def set(self, key, value, px=None, nx=False):
+        if nx and self._live(key):
+            return None
+        self.data[key] = (value, time.time() + px / 1000)
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def eval(self, script, numkeys, key, arg):
+        assert 'cjson.decode' in script
+        entry = self._live(key)
+        if entry and json.loads(entry[0])['v'] == arg:
+            del self.data[key]
+            return 1
+        return 0
+
+
+def redis_backend():
+    backend = RedisBackend.__new__(RedisBackend)    # no server needed
+    backend._client = FakeRedis()
+    return backend
+
+
+@pytest.fixture(params=['local', 'sqlite', 'redis'])
+def backend(request, tmp_path):
+    if request.param == 'local':
+        return LocalBackend()
+    if request.param == 'sqlite':
+        return SQLiteBackend(str(tmp_path / 'cache.db'))
+    return redis_backend()
+
+
+def test_set_get_and_expiry(backend):
+    now = time.time()
+    backend.set('k', '"v"', now, 60)
+    assert backend.get('k') == ('"v"', now)
+    backend.set('old', '"v"', now - 120, 60)
+    assert backend.get('old') is None
+    backend.delete('k')
+    assert backend.get('k') is None
+
+
+def test_add_only_when_absent_and_delete_only_own_value(backend):
+    now = time.time()
+    assert backend.add('k', '"a"', now, 60)
+    assert not backend.add('k', '"b"', now, 60)
+    backend.delete_if('k', '"b"')
+    assert backend.get('k')[0] == '"a"'
+    backend.delete_if('k', '"a"')
+    assert backend.get('k') is None
+    assert backend.add('k', '"b"', now, 60)
+
+
+def test_sqlite_is_shared_by_every_connection_to_the_file(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    worker_a, worker_b = SQLiteBackend(path), SQLiteBackend(path)
+    now = time.time()
+    worker_a.set('k', '"from a"', now, 60)
+    assert worker_b.get('k') == ('"from a"', now)
+    assert not worker_b.add('k', '"from b"', now, 60)
+
+
+def _claim(path, results):
+    results.put(SQLiteBackend(path).add('slot', '"mine"', time.time(), 60))
+
+
+def test_sqlite_add_lets_one_process_win(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    SQLiteBackend(path)
+    results = multiprocessing.get_context('fork').Queue()
+    procs = [multiprocessing.get_context('fork').Process(target=_claim, args=(path, results)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(10)
+    assert sorted(results.get(timeout=5) for _ in procs) == [False, False, False, True]
+
+
+def test_module_api_round_trips_json_and_honours_max_age(monkeypatch):
+    monkeypatch.setattr(shared_cache, '_backend', LocalBackend())
+    shared_cache.store('k', {'a': [1, 2]}, 60, stored_at=time.time() - 10)
+    assert shared_cache.lookup('k', 60)[0] == {'a': [1, 2]}
+    assert shared_cache.lookup('k', 5) is None
+
+
+def test_broken_backend_degrades_to_misses(monkeypatch):
+    class Down:
+        def __getattr__(self, name):
+            def fail(*args):
+                raise ConnectionError('down')
+            return fail
+
+    monkeypatch.setattr(shared_cache, '_backend', Down())
+    shared_cache.store('k', 1, 60)
+    shared_cache.delete('k')
+    assert shared_cache.lookup('k', 60) is None
+    assert shared_cache.add('k', 1, 60) is True     # the guard falls back to per-request
+
+
+def test_backend_from_url(tmp_path, monkeypatch):
+    assert isinstance(shared_cache._make_backend('local'), LocalBackend)
+    assert isinstance(shared_cache._make_backend(f"sqlite:///{tmp_path}/x.db"), SQLiteBackend)
+    assert isinstance(shared_cache._make_backend('memcached://nope'), LocalBackend)
+    monkeypatch.setattr(shared_cache, 'redis', None)
+    assert isinstance(shared_cache._make_backend('redis://localhost:6379/0'), LocalBackend)
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+import cache
+import logic
+import shared_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(shared_cache, '_backend', shared_cache.LocalBackend())
+    logic._symbol_config_cache.clear()
+    yield
+    logic._symbol_config_cache.clear()
+
+
+def fake_calls(suffix):
+    from conftest import FAKE
+    return sum(n for path, n in FAKE.path_counts.items() if path.endswith(suffix))
+
+
+class LeverageClient:
+    def __init__(self):
+        self.calls = []
+
+    def futures_change_leverage(self, symbol, leverage):
+        self.calls.append(leverage)
+        return {'leverage': leverage}
+
+
+def test_stale_poll_cannot_undo_a_leverage_change():
+    poll_started = time.time()
+    logic.remember_symbol_config(7, 'BTCUSDT', leverage=10)     # trade switched 20x -> 10x
+    # A positionRisk poll that began before the change lands afterwards, still saying 20x
+    logic.learn_symbol_config(7, [{'symbol': 'BTCUSDT', 'leverage': '20', 'marginType': 'cross'}], poll_started)
+    known = logic.known_symbol_config(7, 'BTCUSDT')
+    assert known['leverage'] == 10
+    assert known['margin_type'] == 'CROSSED'    # fields we never set are still learned
+
+
+def test_poll_started_after_the_change_is_learned():
+    logic.remember_symbol_config(7, 'BTCUSDT', leverage=10)
+    time.sleep(0.01)
+    logic.learn_symbol_config(7, [{'symbol': 'BTCUSDT', 'leverage': '25'}], time.time())
+    assert logic.known_symbol_config(7, 'BTCUSDT')['leverage'] == 25
+
+
+def test_forget_blocks_older_fetches_from_teaching_it_back():
+    logic.remember_symbol_config(7, 'BTCUSDT', leverage=10)
+    poll_started = time.time()
+    time.sleep(0.01)
+    logic.forget_symbol_config(7, 'BTCUSDT')
+    logic.learn_symbol_config(7, [{'symbol': 'BTCUSDT', 'leverage': '10'}], poll_started)
+    assert logic.known_symbol_config(7, 'BTCUSDT').get('leverage') is None
+    logic.learn_symbol_config(7, [{'symbol': 'BTCUSDT', 'leverage': '10'}], time.time())
+    assert logic.known_symbol_config(7, 'BTCUSDT')['leverage'] == 10
+
+
+def test_worker_sees_leverage_another_worker_set(tmp_path, monkeypatch):
+    # Two gunicorn workers: their own namespace objects over one SQLite shared cache
+    monkeypatch.setattr(shared_cache, '_backend', shared_cache.SQLiteBackend(str(tmp_path / 'cache.db')))
+    worker_a, worker_b = (cache.CacheNamespace('symbol_config', ttl=logic.SYMBOL_CONFIG_TTL, shared=True,
+                                               local_ttl=logic._symbol_config_cache.local_ttl) for _ in range(2))
+    client = LeverageClient()
+    monkeypatch.setattr(logic, '_symbol_config_cache', worker_b)
+    logic.ensure_leverage(client, 'BTCUSDT', 10, 7)
+    monkeypatch.setattr(logic, '_symbol_config_cache', worker_a)
+    logic.ensure_leverage(client, 'BTCUSDT', 20, 7)
+    monkeypatch.setattr(logic, '_symbol_config_cache', worker_b)
+    assert logic.known_symbol_config(7, 'BTCUSDT')['leverage'] == 20
+    logic.ensure_leverage(client, 'BTCUSDT', 10, 7)     # must not be skipped on B's old memory
+    assert client.calls == [10, 20, 10]
+
+
+def place_trade(user, symbol='BTCUSDT', margin_mode='ISOLATED', lev=10):
+    entry = logic.get_live_price(symbol, user.id)
+    sizing = logic.calculate_position_sizing(1000, entry, 'SL % Movement', 2, 'LONG', user_id=user.id, symbol=symbol)
+    return logic.execute_trade_action(1000, symbol, 'LONG', entry, 'MARKET', 'SL % Movement', 2, sizing,
+                                      sizing['suggested_units'], min(lev, sizing['suggested_leverage']),
+                                      margin_mode, 0, 0, 0, user_id=user.id)
+
+
+def test_cross_margin_from_the_form_is_sent_and_remembered_as_crossed(trader):
+    trader.account.margin_type['BTCUSDT'] = 'ISOLATED'
+    result = place_trade(trader, margin_mode='CROSS')
+    assert result['success'], result
+    assert trader.account.margin_type['BTCUSDT'] == 'CROSSED'
+    assert logic.known_symbol_config(trader.id, 'BTCUSDT')['margin_type'] == 'CROSSED'
+    calls = fake_calls('marginType')
+    place_trade(trader, margin_mode='CROSS')
+    assert fake_calls('marginType') == calls      # already CROSSED: no second change
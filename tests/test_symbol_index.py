@@ -0,0 +1,42 @@
+import pytest
+
+import logic
+
+
+@pytest.fixture
+def no_index(exchange, monkeypatch):
+    """No compiled index in this worker (or the shared cache) yet."""
+    monkeypatch.setattr(logic, '_symbol_index', {})
+    monkeypatch.setattr(logic, '_symbol_index_time', 0)
+    monkeypatch.setattr(logic, '_symbol_index_retry_at', 0)
+    return exchange
+
+
+def test_rounding_helpers_share_one_exchange_info_download(no_index):
+    assert logic.round_qty('BTCUSDT', 0.12345) == 0.123
+    assert logic.round_price('BTCUSDT', 65000.17) == 65000.1
+    assert logic.get_lot_step('ETHUSDT') == 0.001
+    assert logic.get_min_notional('BTCUSDT') == 100
+    assert logic.get_required_order_qty('BTCUSDT', 50000) == pytest.approx(0.002)
+    assert no_index.path_counts['/fapi/v1/exchangeInfo'] == 1
+
+
+def test_index_entry_carries_compiled_filters(no_index):
+    entry = logic.get_symbol_info('SOLUSDT')
+    assert (entry['tick_size'], entry['step_size'], entry['min_qty']) == (0.01, 1.0, 1.0)
+    assert (entry['price_precision'], entry['qty_precision']) == (2, 0)
+    assert 'SOLUSDT' in logic.get_all_exchange_symbols()
+
+
+def test_another_worker_reads_the_shared_index(no_index, monkeypatch):
+    logic.get_symbol_index()
+    monkeypatch.setattr(logic, '_symbol_index', {})     # a fresh worker process
+    assert logic.get_symbol_info('BTCUSDT')['tick_size'] == 0.1
+    assert no_index.path_counts['/fapi/v1/exchangeInfo'] == 1
+
+
+def test_failed_refresh_backs_off(no_index):
+    no_index.configure(fail=[{'path': 'exchangeInfo', 'code': -1000, 'count': 1}])
+    assert logic.get_symbol_info('BTCUSDT') is None
+    assert logic.round_qty('BTCUSDT', 0.12345) == 0.123     # defaults while the index is missing
+    assert no_index.path_counts['/fapi/v1/exchangeInfo'] == 1
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+import shared_cache
+import trade_queue
+
+
+class RecordingPool:
+    """Stands in for the trade executor: records jobs instead of running them."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, app, job, kwargs):
+        self.submitted.append(job)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(shared_cache, '_backend', shared_cache.LocalBackend())
+    monkeypatch.setattr(trade_queue, '_jobs', {})
+    pool = RecordingPool()
+    monkeypatch.setattr(trade_queue, '_pool', lambda: pool)
+    return pool
+
+
+def finish(job, state='done'):
+    job['state'] = state
+    trade_queue._save(job)
+    shared_cache.delete(trade_queue._active_key(job['user_id']))
+
+
+def test_second_submit_returns_the_job_in_flight(pool):
+    job, created = trade_queue.submit(None, 1, {'symbol': 'BTCUSDT', 'side': 'LONG'})
+    again, created_again = trade_queue.submit(None, 1, {'symbol': 'BTCUSDT', 'side': 'LONG'})
+    assert created and not created_again
+    assert again['id'] == job['id']
+    assert len(pool.submitted) == 1
+    assert trade_queue.active_job(1)['id'] == job['id']
+
+
+def test_one_active_job_per_user_not_per_server(pool):
+    _, created_1 = trade_queue.submit(None, 1, {'symbol': 'BTCUSDT', 'side': 'LONG'})
+    _, created_2 = trade_queue.submit(None, 2, {'symbol': 'BTCUSDT', 'side': 'LONG'})
+    assert created_1 and created_2
+    assert len(pool.submitted) == 2
+
+
+def test_finished_job_frees_the_user(pool):
+    job, _ = trade_queue.submit(None, 1, {'symbol': 'BTCUSDT', 'side': 'LONG'})
+    finish(job)
+    assert trade_queue.active_job(1) is None
+    nxt, created = trade_queue.submit(None, 1, {'symbol': 'ETHUSDT', 'side': 'SHORT'})
+    assert created and nxt['id'] != job['id']
+
+
+def test_jobs_are_private_to_their_user(pool):
+    job, _ = trade_queue.submit(None, 1, {'symbol': 'BTCUSDT', 'side': 'LONG'})
+    assert trade_queue.get_job(job['id'], 1)['id'] == job['id']
+    assert trade_queue.get_job(job['id'], 2) is None
+
+
+def test_job_without_progress_stops_blocking_the_user(pool, monkeypatch):
+    job, _ = trade_queue.submit(None, 1, {'symbol': 'BTCUSDT', 'side': 'LONG'})
+    job['state'] = 'running'
+    trade_queue._save(job)
+    # Its worker died: no progress since
+    later = time.time() + trade_queue.STALE_JOB_SECONDS + 1
+    monkeypatch.setattr(trade_queue.time, 'time', lambda: later)
+    assert trade_queue.active_job(1) is None
+    nxt, created = trade_queue.submit(None, 1, {'symbol': 'BTCUSDT', 'side': 'LONG'})
+    assert created and nxt['id'] != job['id']
+    assert trade_queue.active_job(1)['id'] == nxt['id']
+
+
+def test_concurrent_double_click_queues_one_job(pool, monkeypatch):
+    # Both requests pass the active_job() check before either claims the key
+    monkeypatch.setattr(trade_queue, 'active_job', lambda user_id: None)
+    start = threading.Barrier(2)
+    results = []
+
+    def click():
+        start.wait()
+        results.append(trade_queue.submit(None, 1, {'symbol': 'BTCUSDT', 'side': 'LONG'}))
+
+    threads = [threading.Thread(target=click) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert sorted(created for _, created in results) == [False, True]
+    assert results[0][0]['id'] == results[1][0]['id']
+    assert len(pool.submitted) == 1
+
+
+def test_sqlite_add_is_add_if_absent(tmp_path):
+    backend = shared_cache.SQLiteBackend(str(tmp_path / 'cache.db'))
+    now = time.time()
+    assert backend.add('k', '"a"', now, 60)
+    assert not backend.add('k', '"b"', now, 60)
+    backend.delete_if('k', '"b"')               # someone else's value: kept
+    assert backend.get('k')[0] == '"a"'
+    backend.delete_if('k', '"a"')
+    assert backend.add('k', '"b"', now, 60)
+    assert backend.add('expired', '"x"', now - 120, 60)
+    assert backend.add('expired', '"y"', now, 60)   # an expired row doesn't count
@@ -0,0 +1,34 @@
+import types
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def user(monkeypatch):
+    monkeypatch.setattr(app_module, 'current_user', types.SimpleNamespace(id=99))
+    app_module._etag_memo.clear()
+
+
+def poll(version, build, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    with app_module.app.test_request_context('/api/tp1_and_sl_orders', headers=headers):
+        return app_module.versioned_json('', version, build)
+
+
+def test_unchanged_version_answers_304_without_building(user):
+    first = poll(('v1',), lambda: {'orders': [1]})
+    assert first.status_code == 200
+    etag = first.get_etag()[0]
+    second = poll(('v1',), lambda: pytest.fail('built despite an unchanged version'), f'"{etag}"')
+    assert second.status_code == 304
+
+
+def test_unknown_version_always_rebuilds(user):
+    first = poll(None, lambda: {'orders': [1]})
+    etag = first.get_etag()[0]
+    changed = poll(None, lambda: {'orders': [2]}, f'"{etag}"')
+    assert changed.status_code == 200
+    assert changed.get_json() == {'orders': [2]}
+    assert app_module._etag_memo.get('99:/api/tp1_and_sl_orders:') is None
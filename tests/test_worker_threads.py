@@ -0,0 +1,86 @@
+import threading
+import time
+
+import logic
+
+
+def concurrently(n, fn):
+    """Call fn from n threads at once (each in its own app context, as gthread requests are)."""
+    from app import app
+    start, results = threading.Barrier(n), [None] * n
+
+    def run(i):
+        with app.app_context():
+            start.wait()
+            results[i] = fn()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+    return results
+
+
+def test_concurrent_first_requests_build_one_client(exchange, trader):
+    exchange.configure(latency_ms=50)
+    try:
+        clients = concurrently(16, lambda: logic.get_client(trader.id))
+    finally:
+        exchange.configure(latency_ms=0)
+    assert all(c is clients[0] for c in clients) and not isinstance(clients[0], dict)
+    assert exchange.path_counts['/fapi/v1/time'] == 1
+    assert exchange.path_counts['/fapi/v2/account'] + exchange.path_counts['/fapi/v3/account'] == 1
+
+
+def test_requests_queued_behind_a_failed_build_share_its_error(exchange, trader):
+    exchange.configure(latency_ms=50, fail=[{'path': 'account', 'code': -1000, 'count': 1}])
+    try:
+        results = concurrently(8, lambda: logic.get_user_exchange_client(trader.id))
+    finally:
+        exchange.configure(latency_ms=0)
+    assert all(isinstance(r, dict) and r['error'] for r in results)
+    assert exchange.path_counts['/fapi/v1/time'] == 1
+    assert logic.get_client(trader.id) is not None     # a later request builds afresh
+
+
+def test_virtual_guard_never_runs_twice_at_once_for_a_user(exchange, trader, monkeypatch):
+    monkeypatch.setattr(logic.config, 'VIRTUAL_GUARD_INTERVAL_SECONDS', 0, raising=False)
+    monkeypatch.setattr(logic, '_virtual_guard_last_run', {})
+    runs = []
+    from models import TradePosition
+
+    class Query:
+        def filter_by(self, **kwargs):
+            runs.append(kwargs['user_id'])
+            time.sleep(0.3)             # hold the run open while the other threads arrive
+            return self
+
+        def all(self):
+            return []
+
+    monkeypatch.setattr(TradePosition, 'query', Query())
+    concurrently(8, lambda: logic.run_virtual_tp_sl_guard(trader.id))
+    assert runs == [trader.id]
+    assert trader.id not in logic._virtual_guard_running
+    logic.run_virtual_tp_sl_guard(trader.id)
+    assert len(runs) == 2
+
+
+def test_leverage_reader_never_pairs_new_rows_with_old_floors(exchange, monkeypatch):
+    for name in ('_leverage_brackets', '_leverage_bracket_floors', '_leverage_brackets_time'):
+        monkeypatch.setattr(logic, name, getattr(logic, name))
+    logic._install_leverage_brackets({'XUSDT': [{'floor': 0, 'leverage': 50}, {'floor': 1000, 'leverage': 20}]},
+                                     time.time())
+    assert logic.max_leverage_for_notional('XUSDT', 1500) == 20
+    # A refresh that has published new rows but not (yet) their floors
+    logic._leverage_brackets = {'XUSDT': [{'floor': 0, 'leverage': 50}, {'floor': 5000, 'leverage': 20}]}
+    assert logic.max_leverage_for_notional('XUSDT', 1500) == 50
+
+
+def test_sqlite_writers_wait_and_readers_use_wal(trader):
+    from app import app
+    from models import db
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args']['timeout'] == 15
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
@@ -0,0 +1,190 @@
+"""
+Background trade execution with job IDs.
+
+Placing a trade is a chain of signed exchange calls (leverage, margin type,
+entry, SL/TP bracket) plus DB writes. Running it inside the web request tied
+up a gunicorn sync worker for the whole chain, so one slow exchange reply
+stalled every page that worker would have served. /index now submits the
+trade here and returns straight away; the trade runs on a small thread pool
+in the same worker process.
+
+Job state (overall state plus per-leg progress for entry/sl/tp1/tp2 and the
+final execute_trade_action result) is published through shared_cache, so a
+status poll answered by any worker sees it.
+
+    job, created = trade_queue.submit(app, user_id, trade_kwargs)
+    trade_queue.get_job(job['id'], user_id)
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import shared_cache
+
+JOB_TTL = 3600
+# A queued/running job with no progress for this long died with its worker
+# (recycled by max_requests, OOM-killed) and no longer blocks the user
+STALE_JOB_SECONDS = 300
+CLAIM_ATTEMPTS = 3
+LEGS = ('entry', 'sl', 'tp1', 'tp2')
+FINISHED_STATES = ('done', 'failed')
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_jobs = {}           # this worker's jobs: {job_id: job}; other workers' come from shared_cache
+_jobs_lock = threading.Lock()
+
+
+def _pool():
+    """Per-process pool, created on first use (never in the gunicorn master before fork)."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=config.TRADE_EXECUTOR_THREADS,
+                                               thread_name_prefix='trade')
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _active_key(user_id):
+    return f"trade_job_active:{user_id}"
+
+
+def _save(job):
+    # Under the lock so leg updates from concurrent SL/TP threads publish in order
+    with _jobs_lock:
+        job['updated_at'] = time.time()
+        _jobs[job['id']] = job
+        snapshot = dict(job, legs=dict(job['legs']), details=dict(job['details']))
+        shared_cache.store(f"trade_job:{job['id']}", snapshot, JOB_TTL)
+
+
+def get_job(job_id, user_id=None):
+    """Job dict, or None if unknown/expired (or it belongs to someone other than user_id)."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job = dict(job, legs=dict(job['legs']), details=dict(job['details']))
+    if job is None:
+        hit = shared_cache.lookup(f"trade_job:{job_id}", JOB_TTL)
+        job = hit[0] if hit else None
+    if job is None or (user_id is not None and job.get('user_id') != user_id):
+        return None
+    return job
+
+
+def _in_flight(job):
+    """Queued/running and still making progress."""
+    if job is None or job['state'] in FINISHED_STATES:
+        return False
+    return time.time() - job.get('updated_at', job['created_at']) < STALE_JOB_SECONDS
+
+
+def active_job(user_id):
+    """The user's queued/running job, if any."""
+    hit = shared_cache.lookup(_active_key(user_id), JOB_TTL)
+    job = get_job(hit[0], user_id) if hit else None
+    return job if _in_flight(job) else None
+
+
+def _claim(user_id, job):
+    """
+    Make job the user's active one. Returns None when claimed, else the job
+    already in flight. The claim is an atomic add-if-absent, so two workers
+    handling a double-click can't both win; a key left behind by a finished
+    or dead job is released (only if it still points at that job) and retried.
+    Gives back job itself if every attempt lost and no winner is in flight.
+    """
+    key = _active_key(user_id)
+    for _ in range(CLAIM_ATTEMPTS):
+        if shared_cache.add(key, job['id'], JOB_TTL):
+            return None
+        hit = shared_cache.lookup(key, JOB_TTL)
+        existing = get_job(hit[0], user_id) if hit else None
+        if _in_flight(existing):
+            return existing
+        if hit:
+            if existing and existing['state'] not in FINISHED_STATES:
+                print(f"⚠️ [TRADE QUEUE] Job {existing['id']} stalled in '{existing['state']}' - releasing user {user_id}")
+            shared_cache.delete_if(key, hit[0])
+    return active_job(user_id) or job
+
+
+def submit(app, user_id, trade_kwargs):
+    """
+    Queue logic.execute_trade_action(**trade_kwargs, user_id=user_id).
+    Returns (job, created); created is False when the user already has a trade
+    in flight - double-clicks must not open two positions.
+    """
+    existing = active_job(user_id)
+    if existing:
+        return existing, False
+    job = {
+        'id': uuid.uuid4().hex[:16],
+        'user_id': user_id,
+        'symbol': trade_kwargs.get('symbol'),
+        'side': trade_kwargs.get('side'),
+        'state': 'queued',
+        'legs': {leg: 'pending' for leg in LEGS},
+        'details': {},
+        'result': None,
+        'created_at': time.time(),
+    }
+    # Saved before the claim, so whoever sees the active key can read the job
+    _save(job)
+    existing = _claim(user_id, job)
+    if existing is not None and existing['id'] != job['id']:
+        _discard(job)
+        return existing, False
+    if existing is not None:
+        # Lost every claim race without finding the winner: don't run unguarded
+        job['state'] = 'failed'
+        job['result'] = {"success": False, "message": "❌ Another trade was being submitted - try again"}
+        _save(job)
+        return job, True
+    _pool().submit(_run, app, job, dict(trade_kwargs, user_id=user_id))
+    print(f"📨 [TRADE QUEUE] Job {job['id']} queued: {job['side']} {job['symbol']} for user {user_id}")
+    return job, True
+
+
+def _discard(job):
+    with _jobs_lock:
+        _jobs.pop(job['id'], None)
+    shared_cache.delete(f"trade_job:{job['id']}")
+
+
+def _run(app, job, trade_kwargs):
+    import logic
+
+    def progress(leg, status, detail=None):
+        with _jobs_lock:
+            job['legs'][leg] = status
+            if detail:
+                job['details'][leg] = str(detail)[:300]
+        _save(job)
+
+    job['state'] = 'running'
+    job['started_at'] = time.time()
+    _save(job)
+    try:
+        with app.app_context():
+            result = logic.execute_trade_action(progress=progress, **trade_kwargs)
+            logic.invalidate_user_caches(job['user_id'])
+    except Exception as e:
+        print(f"❌ [TRADE QUEUE] Job {job['id']} crashed: {e}")
+        result = {"success": False, "message": f"❌ {e}"}
+    with _jobs_lock:
+        for leg, status in job['legs'].items():
+            if status == 'pending':
+                job['legs'][leg] = 'skipped'
+        job['result'] = result
+        job['state'] = 'done' if result.get('success') else 'failed'
+        job['finished_at'] = time.time()
+    _save(job)
+    shared_cache.delete_if(_active_key(job['user_id']), job['id'])
+    print(f"📬 [TRADE QUEUE] Job {job['id']} {job['state']} in {job['finished_at'] - job['started_at']:.2f}s")